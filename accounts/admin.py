@@ -1,9 +1,9 @@
 from django.contrib import admin
 
-from .models import CustomUser, FreelancerProfile, Skill,SkillMapping, ClientProfile,Review
+from .models import CustomUser, FreelancerProfile, Skill,SkillMapping, ClientProfile,Review, FirstProjectProvisioning
 
 class FreelancerProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'portfolio', 'average_rating']
+    list_display = ['user', 'portfolio', 'average_rating', 'rating_count', 'bayesian_rating']
     filter_horizontal = ('skills',)
 
 admin.site.register(CustomUser)
@@ -12,3 +12,10 @@ admin.site.register(Skill)
 admin.site.register(SkillMapping)
 admin.site.register(ClientProfile)
 admin.site.register(Review)
+
+
+@admin.register(FirstProjectProvisioning)
+class FirstProjectProvisioningAdmin(admin.ModelAdmin):
+    list_display = ['user', 'status', 'attempts', 'first_project_id', 'next_attempt_at', 'updated_at']
+    list_filter = ['status']
+    exclude = ['payload']
@@ -0,0 +1,104 @@
+# accounts/leaderboard.py
+"""
+Top freelancers by Bayesian rating, overall and per skill, kept ranked in the cache.
+
+Each board is a list of entries {'id', 'key', 'data'} where `key` is the sort key
+of the profile and `data` the serialized freelancer, so a read is a single cache
+get. Boards are built lazily and repositioned in place when a rating changes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'leaderboard:generation'
+
+TIE_BREAKS = {
+    'rating_count': ('-rating_count', 'id'),
+    'oldest': ('id',),
+}
+
+
+def get_ordering():
+    return ('-bayesian_rating',) + TIE_BREAKS[settings.LEADERBOARD_TIE_BREAK]
+
+
+def sort_key(profile):
+    return tuple(
+        -getattr(profile, field[1:]) if field.startswith('-') else getattr(profile, field)
+        for field in get_ordering()
+    )
+
+
+def board_key(skill_id=None):
+    # Bumping the generation drops every board at once, e.g. when a skill is renamed
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+    return f'leaderboard:{generation}:' + (f'skill:{skill_id}' if skill_id else 'top')
+
+
+def make_entry(profile):
+    from .serializers import FreelancerListSerializer
+    return {'id': profile.pk, 'key': sort_key(profile), 'data': FreelancerListSerializer(profile.user).data}
+
+
+def build_board(skill_id=None):
+    from .models import FreelancerProfile
+    profiles = FreelancerProfile.objects.all()
+    if skill_id:
+        profiles = profiles.filter(skills=skill_id)
+    profiles = profiles.select_related('user').prefetch_related('skills').order_by(*get_ordering())
+    entries = [make_entry(profile) for profile in profiles[:settings.LEADERBOARD_SIZE]]
+    cache.set(board_key(skill_id), entries, settings.LEADERBOARD_TIMEOUT)
+    return entries
+
+
+def get_leaderboard(skill_id=None):
+    entries = cache.get(board_key(skill_id))
+    if entries is None:
+        entries = build_board(skill_id)
+    return [entry['data'] for entry in entries]
+
+
+def reposition(entries, entry):
+    """
+    The board with `entry` moved to its new place, or None when it has to be
+    rebuilt because a profile outside the board may now rank higher.
+    """
+    size = settings.LEADERBOARD_SIZE
+    others = [other for other in entries if other['id'] != entry['id']]
+    was_listed = len(others) < len(entries)
+    if was_listed and len(entries) >= size and others and entry['key'] > others[-1]['key']:
+        return None
+    if not was_listed and len(entries) >= size and entry['key'] >= entries[-1]['key']:
+        return entries
+    return sorted(others + [entry], key=lambda item: item['key'])[:size]
+
+
+def update_freelancer(profile_id):
+    """
+    Moves a freelancer within the cached boards it belongs to after its rating or
+    displayed data changed. Boards that are not cached are left to the next read.
+    """
+    from .models import FreelancerProfile
+    profile = FreelancerProfile.objects.select_related('user').prefetch_related('skills').filter(
+        pk=profile_id
+    ).first()
+    if profile is None:
+        return
+    entry = make_entry(profile)
+    for skill_id in [None] + [skill.id for skill in profile.skills.all()]:
+        key = board_key(skill_id)
+        entries = cache.get(key)
+        if entries is None:
+            continue
+        updated = reposition(entries, entry)
+        if updated is None:
+            build_board(skill_id)
+        elif updated is not entries:
+            cache.set(key, updated, settings.LEADERBOARD_TIMEOUT)
+
+
+def invalidate_skills(skill_ids):
+    cache.delete_many([board_key(skill_id) for skill_id in skill_ids])
+
+
+def invalidate_all():
+    cache.set(GENERATION_KEY, cache.get_or_set(GENERATION_KEY, 1, None) + 1, None)
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.provisioning import provision_pending_users
+
+
+class Command(BaseCommand):
+    help = 'Registers users created in deferred mode in the first project.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PROVISIONING_BATCH_SIZE)
+        parser.add_argument('--concurrency', type=int, default=settings.PROVISIONING_CONCURRENCY)
+        parser.add_argument('--max-attempts', type=int, default=settings.PROVISIONING_MAX_ATTEMPTS)
+        parser.add_argument('--interval', type=float, default=settings.PROVISIONING_POLL_INTERVAL,
+                            help='Seconds to sleep when nothing is pending.')
+        parser.add_argument('--once', action='store_true', help='Process a single batch and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = provision_pending_users(
+                options['batch_size'], options['concurrency'], options['max_attempts']
+            )
+            if any(stats.values()):
+                self.stdout.write('provisioned={provisioned} retried={retried} failed={failed}'.format(**stats))
+            if options['once']:
+                return
+            if sum(stats.values()) < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from accounts import leaderboard
+from accounts.models import FreelancerProfile, Review
+from accounts.ratings import rebuild_ratings
+from backend.versioning import bump_versions
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the rating totals, average and Bayesian rating of freelancer profiles from their reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        ids = FreelancerProfile.objects.order_by('pk').values_list('pk', flat=True)
+        updated = 0
+        last_pk = 0
+        while True:
+            # Bounded UPDATEs so row locks are not held on the whole table at once
+            batch = list(ids.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            updated += rebuild_ratings(FreelancerProfile, Review, batch)
+            bump_versions(FreelancerProfile.objects.filter(pk__in=batch))
+            last_pk = batch[-1]
+        leaderboard.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings of {updated} freelancer profiles.'))
@@ -0,0 +1,56 @@
+import itertools
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local stand-in for the first project API. Every POST is answered with 201 and a new id. '
+        'Point FIRST_PROJECT_API_URL / FIRST_PROJECT_ORDER_API_URL at it to exercise the integrations.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0, help='Seconds to wait before answering.')
+        parser.add_argument('--failure-rate', type=float, default=0,
+                            help='Share of requests answered with 503, between 0 and 1.')
+
+    def handle(self, *args, **options):
+        ids = itertools.count(1)
+        stdout = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                time.sleep(options['latency'])
+                if random.random() < options['failure_rate']:
+                    self.reply(503, {'detail': 'Stub failure'})
+                else:
+                    self.reply(201, {'id': next(ids)})
+
+            def reply(self, code, body):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                stdout.write(format % args)
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(f"First project stub listening on http://{options['host']}:{options['port']}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_skill_remove_freelancerprofile_skills_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clientprofile',
+            name='profile_image',
+            field=models.ImageField(blank=True, upload_to='profile_images/%Y/%m/%d/'),
+        ),
+    ]
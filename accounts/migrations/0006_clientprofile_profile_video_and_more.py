@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:55
+
+import accounts.models
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_clientprofile_profile_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientprofile',
+            name='profile_video',
+            field=models.FileField(blank=True, upload_to='profile_videos/%Y/%m/%d/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['mp4', 'mov', 'avi']), accounts.models.validate_video_file]),
+        ),
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='introduction_video',
+            field=models.FileField(blank=True, upload_to='introduction_videos/%Y/%m/%d/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['mp4', 'mov', 'avi']), accounts.models.validate_video_file]),
+        ),
+    ]
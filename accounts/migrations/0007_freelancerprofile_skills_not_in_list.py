@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_clientprofile_profile_video_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='skills_not_in_list',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_freelancerprofile_skills_not_in_list'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkillMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_project_skill_id', models.IntegerField()),
+                ('second_project_skill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.skill')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+import accounts.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_skillmapping'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirstProjectProvisioning',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status_token', models.CharField(default=accounts.models.new_status_token, editable=False, max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('provisioned', 'Provisioned'), ('failed', 'Failed')], default='pending', max_length=12)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('encrypted_password', models.TextField(blank=True, editable=False)),
+                ('first_project_id', models.IntegerField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='provisioning', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='accounts_prov_due_idx')],
+            },
+        ),
+    ]
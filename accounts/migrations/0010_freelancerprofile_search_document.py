@@ -0,0 +1,82 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:06
+
+from django.db import migrations, models
+
+# The index as it was created here; accounts/search.py maintains it from then on
+TABLE = 'accounts_freelancer_fts'
+COLUMNS = {'name': 'A', 'username': 'A', 'skills': 'B', 'other_skills': 'C'}
+CHUNK_SIZE = 2000
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    qn = connection.ops.quote_name
+    insert = None
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Trigram tokens so a partial name or username matches anywhere in the word
+            cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, tokenize='trigram')".format(
+                qn(TABLE), ', '.join(COLUMNS)
+            ))
+            insert = 'INSERT INTO {} (rowid, {}) VALUES ({})'
+        elif connection.vendor == 'postgresql':
+            document = ' || '.join(
+                "setweight(to_tsvector('simple', coalesce({}, '')), '{}')".format(qn(column), weight)
+                for column, weight in COLUMNS.items()
+            )
+            cursor.execute('CREATE TABLE IF NOT EXISTS {} (id bigint PRIMARY KEY, {}, document tsvector '
+                           'GENERATED ALWAYS AS ({}) STORED)'.format(
+                               qn(TABLE), ', '.join(f'{qn(column)} text' for column in COLUMNS), document))
+            cursor.execute('CREATE INDEX IF NOT EXISTS {} ON {} USING GIN (document)'.format(
+                qn(f'{TABLE}_document_idx'), qn(TABLE)
+            ))
+            insert = 'INSERT INTO {} (id, {}) VALUES ({})'
+        if insert:
+            insert = insert.format(qn(TABLE), ', '.join(qn(column) for column in COLUMNS),
+                                   ', '.join(['%s'] * (len(COLUMNS) + 1)))
+
+        # search_document is filled on every database, it backs the search without a full-text engine
+        FreelancerProfile = apps.get_model('accounts', 'FreelancerProfile')
+        queryset = FreelancerProfile.objects.order_by('pk').select_related('user').prefetch_related('skills')
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+            if not chunk:
+                return
+            rows = []
+            for profile in chunk:
+                values = [
+                    f'{profile.user.first_name} {profile.user.last_name}'.strip(),
+                    profile.user.username,
+                    ' '.join(skill.name for skill in profile.skills.all()),
+                    profile.skills_not_in_list or '',
+                ]
+                profile.search_document = ' '.join(value for value in values if value).lower()
+                rows.append([profile.pk, *values])
+            FreelancerProfile.objects.bulk_update(chunk, ['search_document'])
+            if insert:
+                cursor.executemany(insert, rows)
+            last_pk = chunk[-1].pk
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(connection.ops.quote_name(TABLE)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_firstprojectprovisioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
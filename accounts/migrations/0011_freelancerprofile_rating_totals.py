@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:11
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+# RATING_PRIOR_MEAN and RATING_PRIOR_WEIGHT when the ratings were first filled;
+# `manage.py rebuild_ratings` recomputes them with the current settings
+PRIOR_MEAN = 3.0
+PRIOR_WEIGHT = 5
+
+
+def fill_rating_totals(apps, schema_editor):
+    FreelancerProfile = apps.get_model('accounts', 'FreelancerProfile')
+    Review = apps.get_model('accounts', 'Review')
+    reviews = Review.objects.filter(freelancer=OuterRef('pk')).order_by().values('freelancer')
+    FreelancerProfile.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), Value(0.0)),
+        rating_count=Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), Value(0)),
+    )
+    FreelancerProfile.objects.update(
+        average_rating=Case(
+            When(rating_count__gt=0, then=F('rating_sum') / Cast(F('rating_count'), FloatField())),
+            default=Value(0.0), output_field=FloatField(),
+        ),
+        bayesian_rating=Case(
+            When(rating_count__gt=0,
+                 then=(Value(PRIOR_WEIGHT * PRIOR_MEAN) + F('rating_sum')) / (Value(PRIOR_WEIGHT) + F('rating_count'))),
+            default=Value(0.0), output_field=FloatField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_freelancerprofile_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='bayesian_rating',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='rating_sum',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='freelancerprofile',
+            index=models.Index(fields=['-bayesian_rating', 'id'], name='accounts_freelancer_rank_idx'),
+        ),
+        migrations.RunPython(fill_rating_totals, migrations.RunPython.noop),
+    ]
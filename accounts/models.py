@@ -1,9 +1,19 @@
+import secrets
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
+from django.utils import timezone
+
+from backend import response_cache
+from backend.versioning import VersionedModelMixin, bump_versions
+from . import leaderboard
+from .ratings import rating_values, rebuild_ratings
 def validate_video_file(value):
     # Ensure the file is not too large, etc.
     pass
@@ -25,6 +35,12 @@ class CustomUser(AbstractUser):
     )
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # FreelancerListView, newest first
+            models.Index(fields=['role', '-id'], name='accounts_user_role_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self._state.adding and len(self.username) < 8:
             raise ValidationError("Username must be at least 8 characters long")
@@ -39,7 +55,7 @@ class CustomUser(AbstractUser):
                 client_profile.contact_email = self.email
                 client_profile.save()
 
-class ClientProfile(models.Model):
+class ClientProfile(VersionedModelMixin, models.Model):
     PREFERRED_COMMUNICATION_CHOICES = [
         ('email', 'Email'),
         ('chat', 'Chat'),
@@ -53,6 +69,8 @@ class ClientProfile(models.Model):
     contact_name = models.CharField(max_length=255, editable=False)
     contact_email = models.EmailField(max_length=255, editable=False)
     preferred_communication = models.CharField(max_length=10, choices=PREFERRED_COMMUNICATION_CHOICES, default='email')
+    # Bumped on every change to the profile, see backend/versioning.py
+    version = models.PositiveIntegerField(default=1, editable=False)
     profile_video = models.FileField(
         upload_to='profile_videos/%Y/%m/%d/',
         validators=[FileExtensionValidator(allowed_extensions=['mp4', 'mov', 'avi']), validate_video_file],
@@ -66,23 +84,61 @@ class ClientProfile(models.Model):
         super(ClientProfile, self).save(*args, **kwargs)
 
 # Freelancer Profile Model
-class FreelancerProfile(models.Model):
+class FreelancerProfile(VersionedModelMixin, models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='freelancer_profile')
     portfolio = models.URLField(max_length=255, blank=True)
     skills = models.ManyToManyField(Skill, blank=True)
     average_rating = models.FloatField(default=0.0)
+    # Running totals kept by Review, see accounts/ratings.py
+    rating_sum = models.FloatField(default=0.0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    bayesian_rating = models.FloatField(default=0.0, editable=False)
+    # Also bumped when the skills change, read by the incremental recommendations run
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Bumped on every change to what the profile endpoint returns, see backend/versioning.py
+    version = models.PositiveIntegerField(default=1, editable=False)
     reviews = models.TextField(blank=True)
     skills_not_in_list = models.CharField(max_length=50, blank=True)
+    # Names, username and skills flattened for search, maintained by accounts/search.py
+    search_document = models.TextField(blank=True, editable=False)
     profile_image = models.ImageField(upload_to='profile_images', blank=True)
     introduction_video = models.FileField(
         upload_to='introduction_videos/%Y/%m/%d/',
         validators=[FileExtensionValidator(allowed_extensions=['mp4', 'mov', 'avi']), validate_video_file],
         blank=True
     )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-bayesian_rating', 'id'], name='accounts_freelancer_rank_idx'),
+        ]
+
+    # Only written by adjust_rating and rebuild_ratings
+    RATING_FIELDS = ('rating_sum', 'rating_count', 'average_rating', 'bayesian_rating')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # A profile loaded before a review came in must not write back its stale totals
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.RATING_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def adjust_rating(cls, profile_id, sum_delta, count_delta):
+        cls.objects.filter(pk=profile_id).update(
+            **rating_values(F('rating_sum') + sum_delta, F('rating_count') + count_delta), version=F('version') + 1
+        )
+
     def update_rating(self):
-        total_rating = sum(review.rating for review in self.received_reviews.all())
-        self.average_rating = total_rating / self.received_reviews.count()
-        self.save()
+        # Full recount, adjust_rating keeps the totals current on every review
+        rebuild_ratings(FreelancerProfile, Review, [self.pk])
+        self.refresh_from_db(fields=['rating_sum', 'rating_count', 'average_rating', 'bayesian_rating'])
+
+
+# The freelancer <-> skill rows, as opposed to the FREELANCER_SKILLS posting lists of listings/matching.py
+FreelancerSkill = FreelancerProfile.skills.through
 
 @receiver(post_save, sender=CustomUser)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
@@ -98,8 +154,192 @@ class Review(models.Model):
     freelancer = models.ForeignKey(FreelancerProfile, on_delete=models.CASCADE, related_name='received_reviews')
 
     def save(self, *args, **kwargs):
-        super(Review, self).save(*args, **kwargs)
-        self.freelancer.update_rating()
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = Review.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'freelancer_id', 'rating'
+                ).first()
+            super(Review, self).save(*args, **kwargs)
+            if previous:
+                FreelancerProfile.adjust_rating(previous[0], -previous[1], -1)
+            FreelancerProfile.adjust_rating(self.freelancer_id, float(self.rating), 1)
+            profile_ids = {self.freelancer_id} | ({previous[0]} if previous else set())
+            for profile_id in profile_ids:
+                transaction.on_commit(lambda profile_id=profile_id: leaderboard.update_freelancer(profile_id))
 
     def __str__(self):
-        return f"Review by {self.client.username} for {self.freelancer.user.username}"
\ No newline at end of file
+        return f"Review by {self.client.username} for {self.freelancer.user.username}"
+
+
+def new_status_token():
+    return secrets.token_urlsafe(32)
+
+
+class FirstProjectProvisioning(models.Model):
+    """
+    Registration of a user in the first project that still has to be (or has been)
+    pushed by the provision_first_project_users reconciler.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('provisioned', 'Provisioned'),
+        ('failed', 'Failed'),
+    )
+    # Emptied when the registration fails for good and the (inactive) user is deleted
+    user = models.OneToOneField(CustomUser, null=True, on_delete=models.SET_NULL, related_name='provisioning')
+    # Handed to the registering client to poll the status with, instead of the user id
+    status_token = models.CharField(max_length=64, unique=True, default=new_status_token, editable=False)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='pending')
+    # Registration data for the first project, cleared once the user is provisioned or failed
+    payload = models.JSONField(default=dict, blank=True)
+    # The password the first project registers the user with, encrypted and only
+    # readable for PROVISIONING_PASSWORD_TTL seconds, cleared along with the payload
+    encrypted_password = models.TextField(blank=True, editable=False)
+    first_project_id = models.IntegerField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='accounts_prov_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Provisioning of {self.user.username if self.user else 'a deleted user'} ({self.status})"
+
+
+@receiver(post_delete, sender=Review)
+def remove_deleted_review_rating(sender, instance, **kwargs):
+    FreelancerProfile.adjust_rating(instance.freelancer_id, -instance.rating, -1)
+    transaction.on_commit(lambda: leaderboard.update_freelancer(instance.freelancer_id))
+
+
+# Keep the freelancer search documents (accounts/search.py) fresh
+
+@receiver(post_save, sender=FreelancerProfile)
+def refresh_profile_search_document(sender, instance, **kwargs):
+    from .search import refresh_freelancer_documents
+    refresh_freelancer_documents([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def refresh_user_search_document(sender, instance, created, **kwargs):
+    if not created and instance.role == 'freelancer':
+        from .search import refresh_freelancer_documents
+        refresh_freelancer_documents(FreelancerProfile.objects.filter(user=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=FreelancerProfile)
+def unindex_deleted_profile(sender, instance, **kwargs):
+    from .search import FREELANCER_INDEX
+    FREELANCER_INDEX.delete([instance.pk])
+
+
+@receiver(m2m_changed, sender=FreelancerSkill)
+def refresh_profile_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    from .search import refresh_freelancer_documents
+    if not reverse:
+        refresh_freelancer_documents([instance.pk])
+    elif pk_set:
+        refresh_freelancer_documents(pk_set)
+
+
+@receiver(post_save, sender=Skill)
+def refresh_renamed_skill(sender, instance, created, **kwargs):
+    if not created:
+        from .search import refresh_freelancer_documents
+        refresh_freelancer_documents(instance.freelancerprofile_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Skill)
+def refresh_deleted_skill(sender, instance, **kwargs):
+    from .search import refresh_freelancer_documents
+    profile_ids = list(instance.freelancerprofile_set.values_list('id', flat=True))
+    if profile_ids:
+        transaction.on_commit(lambda: refresh_freelancer_documents(profile_ids))
+
+
+# Keep the cached leaderboards (accounts/leaderboard.py) in line with profiles and skills
+
+@receiver(post_save, sender=FreelancerProfile)
+def update_leaderboard_profile(sender, instance, **kwargs):
+    transaction.on_commit(lambda: leaderboard.update_freelancer(instance.pk))
+
+
+@receiver(post_save, sender=CustomUser)
+def update_leaderboard_user(sender, instance, created, **kwargs):
+    if not created and instance.role == 'freelancer':
+        profile_ids = list(FreelancerProfile.objects.filter(user=instance).values_list('id', flat=True))
+        for profile_id in profile_ids:
+            transaction.on_commit(lambda profile_id=profile_id: leaderboard.update_freelancer(profile_id))
+
+
+@receiver(m2m_changed, sender=FreelancerSkill)
+def update_leaderboard_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_clear':
+        transaction.on_commit(leaderboard.invalidate_all)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        profile_ids, skill_ids = (pk_set, [instance.pk]) if reverse else ([instance.pk], pk_set)
+        transaction.on_commit(lambda: leaderboard.invalidate_skills(skill_ids))
+        for profile_id in profile_ids:
+            transaction.on_commit(lambda profile_id=profile_id: leaderboard.update_freelancer(profile_id))
+
+
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+@receiver(post_delete, sender=FreelancerProfile)
+def invalidate_leaderboards(sender, **kwargs):
+    # Skill names are part of every entry, and a deleted profile may leave a gap to refill
+    if sender is not Skill or not kwargs.get('created'):
+        transaction.on_commit(leaderboard.invalidate_all)
+
+
+# Drop cached public responses (backend/response_cache.py) built on changed rows.
+# Skill names and user details appear in listing and freelancer payloads alike.
+
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+def bump_skill_responses(sender, **kwargs):
+    response_cache.bump('skills', 'listings', 'freelancers')
+
+
+@receiver(post_save, sender=SkillMapping)
+@receiver(post_delete, sender=SkillMapping)
+def bump_skill_mappings(sender, **kwargs):
+    # Reloads the skill catalog (accounts/skills.py), which is versioned with the skills
+    response_cache.bump('skills')
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_save, sender=ClientProfile)
+def bump_user_responses(sender, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        response_cache.bump('listings', 'freelancers')
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_freelancer_version(sender, instance, created, update_fields=None, **kwargs):
+    # Names are part of the profile payload; client profiles are saved by CustomUser.save itself
+    if not created and (update_fields is None or set(update_fields) != {'last_login'}):
+        bump_versions(FreelancerProfile.objects.filter(user=instance))
+
+
+@receiver(post_save, sender=FreelancerProfile)
+@receiver(post_delete, sender=FreelancerProfile)
+@receiver(m2m_changed, sender=FreelancerSkill)
+def bump_freelancer_responses(sender, **kwargs):
+    if kwargs.get('action') in (None, 'post_add', 'post_remove', 'post_clear'):
+        response_cache.bump('freelancers')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def bump_review_responses(sender, **kwargs):
+    response_cache.bump('reviews', 'freelancers')
@@ -0,0 +1,186 @@
+# accounts/provisioning.py
+import base64
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from backend.first_project import CircuitOpenError, get_client
+from .models import CustomUser, FirstProjectProvisioning
+
+logger = logging.getLogger(__name__)
+
+# Never the password, which is stored encrypted apart from the payload
+FIRST_PROJECT_FIELDS = ['username', 'first_name', 'last_name', 'email', 'role']
+
+
+def build_registration_payload(data):
+    """
+    Registration data in the shape the first project expects ('role' is called 'user_type' there).
+    """
+    payload = {field: data.get(field) for field in FIRST_PROJECT_FIELDS if field in data}
+    payload['user_type'] = payload.pop('role', None)
+    return payload
+
+
+def get_password_cipher():
+    # Derived from SECRET_KEY: rotating it makes the waiting passwords unreadable,
+    # and those registrations fail
+    key = hashlib.sha256(f'{settings.SECRET_KEY}:first-project-provisioning'.encode()).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def encrypt_password(password):
+    return get_password_cipher().encrypt(password.encode()).decode()
+
+
+def decrypt_password(token):
+    """
+    The password, or None once it is older than PROVISIONING_PASSWORD_TTL.
+    """
+    try:
+        return get_password_cipher().decrypt(token.encode(), ttl=settings.PROVISIONING_PASSWORD_TTL).decode()
+    except InvalidToken:
+        return None
+
+
+def build_registration_request(provisioning):
+    """
+    The stored payload plus the password, as the synchronous registration sends
+    it, or None when the password can no longer be read.
+    """
+    password = decrypt_password(provisioning.encrypted_password)
+    if password is None:
+        return None
+    return {**provisioning.payload, 'password': password}
+
+
+def enqueue_provisioning(user, data):
+    return FirstProjectProvisioning.objects.create(
+        user=user,
+        payload=build_registration_payload(data),
+        encrypted_password=encrypt_password(data.get('password', '')),
+    )
+
+
+def get_backoff(attempts):
+    delay = settings.PROVISIONING_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, settings.PROVISIONING_MAX_BACKOFF_SECONDS))
+
+
+def claim_due_provisionings(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        provisionings = list(
+            FirstProjectProvisioning.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('user')
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        FirstProjectProvisioning.objects.filter(id__in=[p.id for p in provisionings]).update(
+            next_attempt_at=now + timedelta(seconds=settings.PROVISIONING_LEASE_SECONDS)
+        )
+    return provisionings
+
+
+def parse_json(response):
+    try:
+        return response.json()
+    except ValueError:
+        return {'detail': response.text[:500]}
+
+
+def register_in_first_project(client, provisioning):
+    """
+    Returns (first_project_id, None, False) on success, otherwise
+    (None, errors, retryable), or None when the breaker is open and nothing was sent.
+    """
+    data = build_registration_request(provisioning)
+    if data is None:
+        return None, {'detail': 'The registration expired before it reached the first project.'}, False
+    if not client.available('register'):
+        return None
+    try:
+        response = client.post('register', data=data)
+    except CircuitOpenError:
+        # Another worker's trial call holds the half-open breaker
+        return None
+    except requests.RequestException as e:
+        return None, {'detail': str(e)}, True
+
+    if response.status_code == 201:
+        return parse_json(response).get('id'), None, False
+    retryable = response.status_code >= 500 or response.status_code in (408, 429)
+    return None, parse_json(response), retryable
+
+
+def provision_pending_users(batch_size=None, concurrency=None, max_attempts=None, client=None):
+    batch_size = batch_size or settings.PROVISIONING_BATCH_SIZE
+    concurrency = concurrency or settings.PROVISIONING_CONCURRENCY
+    max_attempts = max_attempts or settings.PROVISIONING_MAX_ATTEMPTS
+    client = client or get_client()
+    stats = {'provisioned': 0, 'retried': 0, 'failed': 0}
+    if not client.available('register'):
+        return stats
+
+    provisionings = claim_due_provisionings(batch_size)
+    if not provisionings:
+        return stats
+
+    # The remote API registers one user per call, the batch goes out over the shared
+    # keep-alive pool instead of one connection per user.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda p: register_in_first_project(client, p), provisionings))
+
+    # The breaker opened mid-batch: what was not sent is no attempt, and gets picked up
+    # again once the lease runs out
+    sent = [(provisioning, result) for provisioning, result in zip(provisionings, results) if result is not None]
+    provisionings = [provisioning for provisioning, _ in sent]
+
+    for provisioning, (first_project_id, errors, retryable) in sent:
+        provisioning.attempts += 1
+        if errors is None:
+            provisioning.status = 'provisioned'
+            provisioning.first_project_id = first_project_id
+            provisioning.payload = {}
+            provisioning.encrypted_password = ''
+            provisioning.last_error = None
+            stats['provisioned'] += 1
+        elif not retryable or provisioning.attempts >= max_attempts:
+            logger.error('Provisioning of user %s failed: %s', provisioning.user_id, errors)
+            provisioning.status = 'failed'
+            provisioning.payload = {}
+            provisioning.encrypted_password = ''
+            provisioning.last_error = errors
+            stats['failed'] += 1
+        else:
+            logger.warning('Provisioning of user %s failed (attempt %s): %s',
+                           provisioning.user_id, provisioning.attempts, errors)
+            provisioning.next_attempt_at = timezone.now() + get_backoff(provisioning.attempts)
+            provisioning.last_error = errors
+            stats['retried'] += 1
+
+    now = timezone.now()
+    for provisioning in provisionings:
+        provisioning.updated_at = now
+    FirstProjectProvisioning.objects.bulk_update(
+        provisionings,
+        ['status', 'first_project_id', 'payload', 'encrypted_password', 'attempts', 'next_attempt_at', 'last_error',
+         'updated_at'],
+    )
+    provisioned_user_ids = [p.user_id for p in provisionings if p.status == 'provisioned']
+    if provisioned_user_ids:
+        CustomUser.objects.filter(id__in=provisioned_user_ids).update(is_active=True)
+    # As the synchronous registration does; the provisioning stays, without a user,
+    # so the status endpoint can still report the failure. Only users that never
+    # could log in, and so own nothing the delete would cascade to.
+    failed_user_ids = [p.user_id for p in provisionings if p.status == 'failed']
+    if failed_user_ids:
+        CustomUser.objects.filter(id__in=failed_user_ids, is_active=False).delete()
+    return stats
@@ -0,0 +1,49 @@
+# accounts/ratings.py
+"""
+Rating aggregates of freelancer profiles. rating_sum and rating_count are running
+totals adjusted in the same transaction as each review; average_rating and
+bayesian_rating are derived from them in the same UPDATE.
+"""
+from django.conf import settings
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
+
+
+def rating_values(rating_sum, rating_count):
+    """
+    UPDATE values for the given sum and count expressions.
+
+    The Bayesian score pulls profiles with few reviews towards the prior mean, so
+    a single 5 does not outrank a hundred 4.9s. Unrated profiles score 0.
+    """
+    mean = float(settings.RATING_PRIOR_MEAN)
+    weight = float(settings.RATING_PRIOR_WEIGHT)
+    has_reviews = GreaterThan(rating_count, 0)
+    return {
+        'rating_sum': rating_sum,
+        'rating_count': rating_count,
+        'average_rating': Case(
+            When(has_reviews, then=rating_sum / Cast(rating_count, FloatField())),
+            default=Value(0.0), output_field=FloatField(),
+        ),
+        'bayesian_rating': Case(
+            When(has_reviews, then=(Value(weight * mean) + rating_sum) / (Value(weight) + rating_count)),
+            default=Value(0.0), output_field=FloatField(),
+        ),
+    }
+
+
+def rebuild_ratings(profile_model, review_model, profile_ids=None):
+    """
+    Recomputes the aggregates from the reviews table.
+    """
+    profiles = profile_model.objects.all()
+    if profile_ids is not None:
+        profiles = profiles.filter(pk__in=profile_ids)
+    reviews = review_model.objects.filter(freelancer=OuterRef('pk')).order_by().values('freelancer')
+    profiles.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), Value(0.0)),
+        rating_count=Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), Value(0)),
+    )
+    return profiles.update(**rating_values(F('rating_sum'), F('rating_count')))
@@ -0,0 +1,84 @@
+# accounts/search.py
+from backend.fulltext import FullTextIndex, SearchResults
+
+# Trigram tokens on SQLite so a partial name or username matches anywhere in the word
+FREELANCER_INDEX = FullTextIndex(
+    table='accounts_freelancer_fts',
+    columns={'name': 'A', 'username': 'A', 'skills': 'B', 'other_skills': 'C'},
+    snippet_column='skills',
+    sqlite_tokenizer='trigram',
+    pg_config='simple',
+)
+
+
+def build_documents(profiles):
+    """
+    Index rows for freelancer profiles with their user and skills loaded. Also
+    used by rebuild_index(), which takes the model as an argument.
+    """
+    return [
+        (profile.pk, {
+            'name': f'{profile.user.first_name} {profile.user.last_name}'.strip(),
+            'username': profile.user.username,
+            'skills': ' '.join(skill.name for skill in profile.skills.all()),
+            'other_skills': profile.skills_not_in_list,
+        })
+        for profile in profiles
+    ]
+
+
+def build_search_document(values):
+    return ' '.join(value for value in values.values() if value).lower()
+
+
+def refresh_freelancer_documents(profile_ids):
+    """
+    Rebuilds the stored search_document and the index rows of the given profiles.
+    Writes with update() so no profile signals fire again.
+    """
+    from .models import FreelancerProfile
+    profiles = FreelancerProfile.objects.filter(id__in=profile_ids).select_related('user').prefetch_related('skills')
+    documents = build_documents(profiles)
+    for pk, values in documents:
+        FreelancerProfile.objects.filter(pk=pk).update(search_document=build_search_document(values))
+    FREELANCER_INDEX.upsert(documents)
+
+
+def rebuild_index(profile_model, chunk_size=2000):
+    FREELANCER_INDEX.clear()
+    queryset = profile_model.objects.order_by('pk').select_related('user').prefetch_related('skills')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        documents = build_documents(chunk)
+        for profile, (_, values) in zip(chunk, documents):
+            profile.search_document = build_search_document(values)
+        profile_model.objects.bulk_update(chunk, ['search_document'])
+        FREELANCER_INDEX.upsert(documents)
+        last_pk = chunk[-1].pk
+
+
+def search_freelancer_profiles(query, queryset=None):
+    """
+    Ranked freelancer profiles matching every word of the query, with `rank` set
+    on each. Lazy sequence meant to be handed to a paginator.
+    """
+    from .models import FreelancerProfile
+    queryset = queryset if queryset is not None else FreelancerProfile.objects.all()
+
+    if not FREELANCER_INDEX.is_supported() or not FREELANCER_INDEX.usable_terms(query):
+        # Words too short for the trigram index, or no full-text engine: scan the prebuilt documents
+        return queryset.filter(search_document__icontains=query.strip().lower()).order_by('-id')
+
+    def load(hits):
+        profiles = queryset.in_bulk([pk for pk, _, _ in hits])
+        results = []
+        for pk, rank, _ in hits:
+            if pk in profiles:
+                profiles[pk].rank = rank
+                results.append(profiles[pk])
+        return results
+
+    return SearchResults(FREELANCER_INDEX, query, load)
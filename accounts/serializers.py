@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from backend.eager_loading import EagerLoadingMixin
 from .models import ClientProfile, FreelancerProfile, Review, Skill, CustomUser
+from .skills import existing_skill_ids
 
 User = get_user_model()
 
@@ -31,7 +33,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
             email=validated_data['email'],
-            role=validated_data['role']
+            role=validated_data['role'],
+            is_active=validated_data.get('is_active', True),
         )
         user.set_password(validated_data['password'])
         user.save()
@@ -58,7 +61,10 @@ class ClientProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ('contact_name', 'contact_email')  # These fields are auto-populated
 
 
-class FreelancerProfileSerializer(serializers.ModelSerializer):
+class FreelancerProfileSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user',)
+    prefetch_related_fields = ('skills', 'received_reviews')
+
     skill_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
     user = UserSerializer(read_only=True)
     reviews = serializers.SerializerMethodField()
@@ -86,8 +92,7 @@ class FreelancerProfileSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         skill_ids = validated_data.get('skill_ids')
         if skill_ids is not None:
-            skills = Skill.objects.filter(id__in=skill_ids)
-            instance.skills.set(skills)
+            instance.skills.set(existing_skill_ids(skill_ids))
 
         return super().update(instance, validated_data)
 
@@ -96,7 +101,9 @@ class FreelancerProfileSerializer(serializers.ModelSerializer):
         return ReviewSerializer(reviews, many=True).data
 
 
-class FreelancerProfileNestedSerializer(serializers.ModelSerializer):
+class FreelancerProfileNestedSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    prefetch_related_fields = ('skills',)
+
     skills = serializers.SerializerMethodField()
 
     class Meta:
@@ -106,7 +113,12 @@ class FreelancerProfileNestedSerializer(serializers.ModelSerializer):
     def get_skills(self, obj):
         return [skill.name for skill in obj.skills.all()]
 
-class FreelancerListSerializer(serializers.ModelSerializer):
+class FreelancerListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('freelancer_profile',)
+    prefetch_related_fields = tuple(
+        f'freelancer_profile__{field}' for field in FreelancerProfileNestedSerializer.prefetch_related_fields
+    )
+
     freelancer_profile = FreelancerProfileNestedSerializer(read_only=True)
 
     class Meta:
@@ -0,0 +1,95 @@
+# accounts/skills.py
+"""
+The skill catalog: every skill id, name and first project mapping, held in
+memory by each process.
+
+Skills and their mappings hardly ever change, so the catalog is loaded whole and
+kept as an immutable snapshot, tagged with the 'skills' version of
+backend/response_cache.py. Every Skill and SkillMapping save and delete bumps
+that version after commit, and the next get_catalog() in any process loads a
+new snapshot. Lookups and translations are then dictionary hits; names the
+snapshot does not know yet fall back to a query.
+"""
+from collections import namedtuple
+from threading import Lock
+from types import MappingProxyType
+
+from backend import response_cache
+from .models import Skill, SkillMapping
+
+# names: id -> name, ids: name -> id, first_project_ids: id -> tuple of the
+# first project's skill ids
+SkillCatalog = namedtuple('SkillCatalog', ['version', 'names', 'ids', 'first_project_ids'])
+
+_lock = Lock()
+_catalog = None
+
+
+def load_catalog(version):
+    names = dict(Skill.objects.values_list('id', 'name'))
+    first_project_ids = {}
+    for skill_id, first_project_id in SkillMapping.objects.order_by('id').values_list(
+        'second_project_skill_id', 'first_project_skill_id'
+    ):
+        first_project_ids.setdefault(skill_id, []).append(first_project_id)
+    return SkillCatalog(
+        version,
+        MappingProxyType(names),
+        MappingProxyType({name: pk for pk, name in names.items()}),
+        MappingProxyType({pk: tuple(ids) for pk, ids in first_project_ids.items()}),
+    )
+
+
+def get_catalog():
+    global _catalog
+    # Read before the tables, so a snapshot is never newer than its version
+    version = response_cache.get_versions(['skills'])[0]
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        with _lock:
+            if _catalog is None or _catalog.version != version:
+                _catalog = load_catalog(version)
+            catalog = _catalog
+    return catalog
+
+
+def translate_skill_ids(skill_ids):
+    """
+    The first project's skill ids for the given skills, unmapped ones left out.
+    """
+    first_project_ids = get_catalog().first_project_ids
+    return [pk for skill_id in skill_ids for pk in first_project_ids.get(skill_id, ())]
+
+
+def resolve_skill_ids(names, create=True):
+    """
+    Skill name -> id for the given names. With create, the skills that do not
+    exist yet are created in one INSERT; otherwise they are left out.
+    """
+    names = set(names)
+    catalog = get_catalog()
+    ids = {name: catalog.ids[name] for name in names if name in catalog.ids}
+    missing = names - ids.keys()
+    if missing:
+        ids.update(Skill.objects.filter(name__in=missing).values_list('name', 'id'))
+        new = names - ids.keys()
+        if new and create:
+            # Another request may create the same skills meanwhile
+            Skill.objects.bulk_create([Skill(name=name) for name in new], ignore_conflicts=True)
+            ids.update(Skill.objects.filter(name__in=new).values_list('name', 'id'))
+            # bulk_create sends no post_save
+            response_cache.bump('skills')
+    return ids
+
+
+def existing_skill_ids(ids):
+    """
+    The given skill ids that exist, in their original order.
+    """
+    ids = list(dict.fromkeys(ids))
+    known = get_catalog().names
+    unknown = [pk for pk in ids if pk not in known]
+    if unknown:
+        found = set(Skill.objects.filter(pk__in=unknown).values_list('id', flat=True))
+        return [pk for pk in ids if pk in known or pk in found]
+    return ids
@@ -1,3 +1,400 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from backend.first_project import CircuitBreaker, CircuitOpenError
+from listings import matching
+from listings.models import Listing
+from . import leaderboard
+from .models import CustomUser, FirstProjectProvisioning, FreelancerProfile, Review, Skill
+from .provisioning import enqueue_provisioning, provision_pending_users
+from .ratings import rebuild_ratings
+
+REGISTRATION = {
+    'username': 'newclient1', 'first_name': 'New', 'last_name': 'Client', 'email': 'new@example.com',
+    'password': 'Secret!pass123', 'role': 'client',
+}
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data or {}
+        self.text = str(self.data)
+
+    def json(self):
+        return self.data
+
+
+class FakeFirstProject:
+    """
+    Stands in for backend.first_project.FirstProjectClient, answering every call
+    with the next of `responses` (the last one repeats).
+    """
+    def __init__(self, *responses):
+        self.responses = list(responses) or [FakeResponse(201, {'id': 1})]
+        self.calls = []
+
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def available(self, endpoint):
+        return self.breaker.available()
+
+    def post(self, endpoint, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(endpoint)
+        self.calls.append((endpoint, kwargs))
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+
+class SyncRegistrationTests(TestCase):
+    def test_registration_waits_for_the_first_project_by_default(self):
+        first_project = FakeFirstProject(FakeResponse(201, {'id': 42}))
+        with mock.patch('accounts.views.get_client', return_value=first_project):
+            response = APIClient().post('/api/accounts/register/', REGISTRATION, format='json')
+        self.assertEqual((response.status_code, response.data['first_project_id']), (201, 42))
+        [(_, kwargs)] = first_project.calls
+        self.assertEqual(kwargs['data']['password'], REGISTRATION['password'])
+        self.assertFalse(FirstProjectProvisioning.objects.exists())
+
+
+@override_settings(FIRST_PROJECT_REGISTRATION_MODE='deferred')
+class DeferredRegistrationTests(TestCase):
+    def register(self, **data):
+        return APIClient().post('/api/accounts/register/', {**REGISTRATION, **data}, format='json')
+
+    def test_payload_keeps_no_password(self):
+        self.assertEqual(self.register().status_code, 202)
+        provisioning = FirstProjectProvisioning.objects.get()
+        self.assertNotIn('password', provisioning.payload)
+        self.assertNotIn(REGISTRATION['password'], str(provisioning.payload))
+        self.assertNotIn(REGISTRATION['password'], provisioning.encrypted_password)
+
+    def test_reconciler_sends_the_password(self):
+        self.register()
+        first_project = FakeFirstProject(FakeResponse(201, {'id': 42}))
+        self.assertEqual(provision_pending_users(client=first_project)['provisioned'], 1)
+        [(endpoint, kwargs)] = first_project.calls
+        sent = kwargs['data']
+        self.assertEqual(endpoint, 'register')
+        self.assertEqual(sent['password'], REGISTRATION['password'])
+        self.assertEqual(sent['user_type'], 'client')
+        provisioning = FirstProjectProvisioning.objects.get()
+        self.assertEqual((provisioning.status, provisioning.first_project_id), ('provisioned', 42))
+        self.assertEqual(provisioning.encrypted_password, '')
+
+    def login(self):
+        return APIClient().post('/api/accounts/login/', {
+            'username': REGISTRATION['username'], 'password': REGISTRATION['password'],
+        }, format='json')
+
+    def test_user_can_log_in_once_provisioned(self):
+        self.register()
+        self.assertEqual(self.login().status_code, 401)
+        provision_pending_users(client=FakeFirstProject(FakeResponse(201, {'id': 42})))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_failure_keeps_a_user_who_could_log_in(self):
+        self.register()
+        # Activated by hand before the first project answered
+        CustomUser.objects.filter(username=REGISTRATION['username']).update(is_active=True)
+        provision_pending_users(client=FakeFirstProject(FakeResponse(400, {'username': ['Taken.']})))
+        self.assertTrue(CustomUser.objects.filter(username=REGISTRATION['username']).exists())
+        self.assertEqual(FirstProjectProvisioning.objects.get().status, 'failed')
+
+    def test_expired_password_fails_without_a_call(self):
+        self.register()
+        first_project = FakeFirstProject()
+        with override_settings(PROVISIONING_PASSWORD_TTL=-1):
+            self.assertEqual(provision_pending_users(client=first_project)['failed'], 1)
+        self.assertEqual(first_project.calls, [])
+        self.assertEqual(FirstProjectProvisioning.objects.get().status, 'failed')
+
+    def test_status_is_read_with_the_token_only(self):
+        response = self.register()
+        status_url = response.data['status_url']
+        provisioning = FirstProjectProvisioning.objects.get()
+        self.assertIn(provisioning.status_token, status_url)
+        self.assertNotIn(f"/{response.data['id']}/", status_url)
+        status = APIClient().get(status_url)
+        self.assertEqual((status.status_code, status.data['provisioning_status']), (200, 'pending'))
+        self.assertEqual(APIClient().get('/api/accounts/register/status/guessed/').status_code, 404)
+
+    def test_failed_registration_removes_the_user(self):
+        status_url = self.register().data['status_url']
+        first_project = FakeFirstProject(FakeResponse(400, {'username': ['Taken.']}))
+        self.assertEqual(provision_pending_users(client=first_project)['failed'], 1)
+        self.assertFalse(CustomUser.objects.filter(username=REGISTRATION['username']).exists())
+        status = APIClient().get(status_url).data
+        self.assertEqual(status['provisioning_status'], 'failed')
+        self.assertEqual(status['errors'], {'username': ['Taken.']})
+        self.assertIsNone(status['id'])
+        # The username is free again
+        self.assertEqual(self.register().status_code, 202)
+
+
+class ProvisioningBreakerTests(TestCase):
+    def test_open_breaker_stops_the_batch_without_spending_attempts(self):
+        for i in range(5):
+            user = CustomUser.objects.create_user(username=f'breakeruser{i}', password='x', role='client')
+            enqueue_provisioning(user, {'username': user.username, 'password': 'x', 'role': 'client'})
+        first_project = FakeFirstProject(FakeResponse(503))
+        stats = provision_pending_users(concurrency=1, client=first_project)
+
+        # The breaker opens after two failures, the other three are never sent
+        self.assertEqual(len(first_project.calls), 2)
+        self.assertEqual(stats, {'provisioned': 0, 'retried': 2, 'failed': 0})
+        attempts = sorted(FirstProjectProvisioning.objects.values_list('attempts', flat=True))
+        self.assertEqual(attempts, [0, 0, 0, 1, 1])
+        self.assertFalse(FirstProjectProvisioning.objects.exclude(status='pending').exists())
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = CustomUser.objects.create_user(username='cache-client', password='x', role='client')
+        freelancer = CustomUser.objects.create_user(username='cache-freelancer', password='x', role='freelancer')
+        self.profile = FreelancerProfile.objects.get(user=freelancer)
+
+    def review_ratings(self):
+        response = APIClient().get('/api/accounts/reviews/freelancer/cache-freelancer/')
+        return [review['rating'] for review in response.data['results']]
+
+    def test_cached_reviews_are_dropped_once_the_review_commits(self):
+        self.assertEqual(self.review_ratings(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(rating=5, text='cached', client=self.client_user, freelancer=self.profile)
+            self.assertEqual(self.review_ratings(), [])
+        self.assertEqual(self.review_ratings(), [5])
+
+    def test_cached_profile_costs_the_version_lookup_only(self):
+        url = '/api/accounts/freelancer/cache-freelancer/'
+        first = APIClient().get(url)
+        with self.assertNumQueries(1):
+            second = APIClient().get(url)
+        self.assertEqual((second.data, second['ETag']), (first.data, first['ETag']))
+
+
+class FreelancerProfileETagTests(TestCase):
+    URL = '/api/accounts/freelancer/etag-freelancer/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='etag-freelancer', password='x', role='freelancer')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def update(self, etag, portfolio):
+        return self.api.put('/api/accounts/profile/update/', {'portfolio': portfolio}, format='json',
+                            HTTP_IF_MATCH=etag)
+
+    def test_unchanged_profile_answers_not_modified(self):
+        etag = APIClient().get(self.URL)['ETag']
+        response = APIClient().get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_update_needs_the_current_etag_and_returns_the_next(self):
+        etag = APIClient().get(self.URL)['ETag']
+        response = self.update(etag, 'https://example.com/first')
+        self.assertEqual(response.status_code, 200)
+        new_etag = response['ETag']
+        self.assertNotEqual(new_etag, etag)
+
+        response = self.update(etag, 'https://example.com/lost')
+        self.assertEqual((response.status_code, response['ETag']), (412, new_etag))
+        self.assertEqual(FreelancerProfile.objects.get(user=self.user).portfolio, 'https://example.com/first')
+
+        response = APIClient().get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (200, new_etag))
+        self.assertEqual(response.data['portfolio'], 'https://example.com/first')
+
+
+class RatingTotalsTests(TestCase):
+    def setUp(self):
+        self.client_user = CustomUser.objects.create_user(username='rating-client', password='x', role='client')
+        self.profiles = [
+            FreelancerProfile.objects.get(user=CustomUser.objects.create_user(
+                username=f'rating-freelancer-{i}', password='x', role='freelancer'
+            ))
+            for i in range(2)
+        ]
+
+    def totals(self):
+        return list(FreelancerProfile.objects.order_by('pk').values_list(*FreelancerProfile.RATING_FIELDS))
+
+    def assert_totals(self, change, *expected):
+        with self.subTest(change=change):
+            totals = self.totals()
+            self.assertEqual([row[:2] for row in totals], [(float(total), count) for total, count in expected])
+            rebuild_ratings(FreelancerProfile, Review)
+            self.assertEqual(totals, self.totals())
+
+    def test_running_totals_follow_review_changes(self):
+        first, second = self.profiles
+        review = Review.objects.create(rating=4, text='good', client=self.client_user, freelancer=first)
+        other = Review.objects.create(rating=2, text='meh', client=self.client_user, freelancer=first)
+        self.assert_totals('create', (6, 2), (0, 0))
+        self.assertEqual(FreelancerProfile.objects.get(pk=first.pk).average_rating, 3.0)
+
+        other.rating = 5
+        other.save()
+        self.assert_totals('edit', (9, 2), (0, 0))
+        other.freelancer = second
+        other.save()
+        self.assert_totals('move', (4, 1), (5, 1))
+        review.delete()
+        self.assert_totals('delete', (0, 0), (5, 1))
+        self.assertEqual(FreelancerProfile.objects.get(pk=first.pk).average_rating, 0.0)
+
+    def test_stale_profile_save_keeps_the_totals(self):
+        stale = FreelancerProfile.objects.get(pk=self.profiles[0].pk)
+        Review.objects.create(rating=5, text='great', client=self.client_user, freelancer=self.profiles[0])
+        stale.portfolio = 'https://example.com/stale'
+        stale.save()
+        profile = FreelancerProfile.objects.get(pk=stale.pk)
+        self.assertEqual((profile.portfolio, profile.rating_count, profile.average_rating),
+                         ('https://example.com/stale', 1, 5.0))
+
+
+@override_settings(LEADERBOARD_SIZE=3)
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        leaderboard.invalidate_all()
+        self.skill = Skill.objects.create(name='board-skill')
+        self.client_user = CustomUser.objects.create_user(username='board-client', password='x', role='client')
+        self.profiles = []
+        for i in range(4):
+            user = CustomUser.objects.create_user(username=f'board-freelancer-{i}', password='x', role='freelancer')
+            self.profiles.append(FreelancerProfile.objects.get(user=user))
+        self.profiles[0].skills.add(self.skill)
+        self.profiles[3].skills.add(self.skill)
+
+    def review(self, profile, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Review.objects.create(rating=rating, text='board', client=self.client_user, freelancer=profile)
+
+    def board(self, **params):
+        response = APIClient().get('/api/accounts/top-freelancers/', params)
+        return [int(freelancer['username'].rsplit('-', 1)[1]) for freelancer in response.data]
+
+    def test_cached_boards_follow_review_changes(self):
+        first = self.review(self.profiles[0], 5)
+        self.review(self.profiles[1], 4)
+        self.review(self.profiles[2], 3)
+        self.assertEqual(self.board(), [0, 1, 2])
+        self.assertEqual(self.board(skill=self.skill.pk), [0, 3])
+
+        # Moves up into the board and pushes the last one out
+        late = [self.review(self.profiles[3], 5), self.review(self.profiles[3], 5)]
+        self.assertEqual(self.board(), [3, 0, 1])
+        self.assertEqual(self.board(skill=self.skill.pk), [3, 0])
+
+        # Falls out of the board, which is refilled from below
+        with self.captureOnCommitCallbacks(execute=True):
+            first.rating = 1
+            first.save()
+        self.assertEqual(self.board(), [3, 1, 2])
+
+        for review in late:
+            with self.captureOnCommitCallbacks(execute=True):
+                review.delete()
+        self.assertEqual(self.board(), [1, 2, 0])
+        self.assertEqual(self.board(skill=self.skill.pk), [0, 3])
+
+
+class ClientProfileETagTests(TestCase):
+    def test_profile_read_gives_the_etag_to_update_with(self):
+        user = CustomUser.objects.create_user(username='etag-client', password='x', role='client')
+        api = APIClient()
+        api.force_authenticate(user)
+        etag = api.get('/api/accounts/profile/')['ETag']
+
+        response = api.put('/api/accounts/profile/update/', {'company_name': 'First'}, format='json',
+                           HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(api.get('/api/accounts/profile/')['ETag'], response['ETag'])
+        response = api.put('/api/accounts/profile/update/', {'company_name': 'Lost'}, format='json',
+                           HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+
+
+class FreelancerSearchTests(TestCase):
+    def test_username_search_is_paginated(self):
+        for i in range(3):
+            CustomUser.objects.create_user(username=f'searchable{i}', password='x', role='freelancer')
+        response = APIClient().get('/api/accounts/editlisting/search/', {'q': 'searchable', 'limit': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(set(response.data['results'][0]), {'username'})
+
+    def test_empty_query_is_rejected_by_both_endpoints(self):
+        for url in ('/api/accounts/editlisting/search/', '/api/accounts/search/freelancers/'):
+            for params in ({}, {'q': '  '}):
+                with self.subTest(url=url, params=params):
+                    self.assertEqual(APIClient().get(url, params).status_code, 400)
+
+
+class QueryCountTests(TestCase):
+    """
+    The freelancer list endpoints must not send more queries as they return more rows.
+    """
+    ENDPOINTS = (
+        '/api/accounts/freelancers/',
+        '/api/accounts/top-freelancers/',
+        '/api/accounts/search/freelancers/?q=qcheck&limit=100',
+        '/api/listings/client/matched_freelancers/',
+    )
+
+    def setUp(self):
+        self.skills = [Skill.objects.create(name=f'qcheck-skill-{i}') for i in range(3)]
+        self.client_user = CustomUser.objects.create_user(username='qcheck-client', password='x', role='client')
+        listing = Listing.objects.create(user=self.client_user, title='qcheck listing', description='qcheck',
+                                         price=100)
+        listing.skills.set(self.skills)
+        self.freelancers = 0
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+
+    def add_freelancers(self, count):
+        for i in range(self.freelancers, self.freelancers + count):
+            user = CustomUser.objects.create_user(
+                username=f'qcheck-{i}', password='x', role='freelancer', first_name='Qcheck', last_name=str(i)
+            )
+            profile = FreelancerProfile.objects.get(user=user)
+            profile.skills.set(self.skills[:2])
+            for rating in (4, 5):
+                Review.objects.create(rating=rating, text='qcheck', client=self.client_user, freelancer=profile)
+        self.freelancers += count
+
+    def get(self, url):
+        # Measured on a miss, when the cached responses, boards and postings are built
+        cache.clear()
+        leaderboard.invalidate_all()
+        matching.invalidate_all()
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        self.add_freelancers(5)
+        counts = {}
+        for url in self.ENDPOINTS:
+            with CaptureQueriesContext(connection) as queries:
+                self.get(url)
+            counts[url] = len(queries)
+
+        self.add_freelancers(45)
+        for url in self.ENDPOINTS:
+            with self.subTest(url=url), self.assertNumQueries(counts[url]):
+                self.get(url)
@@ -1,10 +1,11 @@
 from django.urls import path
 from .views import UserRegistrationAPIView, UserLoginAPIView, UserProfileView, FreelancerListView, \
     FreelancerProfileView, CreateReviewView, TopFreelancersView, UserLogoutAPIView, UserProfileUpdateView, \
-    SkillListView, SearchFreelancerView, search_freelancers, FreelancerReviewsListView
+    SkillListView, SearchFreelancerView, search_freelancers, FreelancerReviewsListView, RegistrationStatusAPIView
 from .views import create_review
 urlpatterns = [
     path('register/', UserRegistrationAPIView.as_view(), name='register'),
+    path('register/status/<str:token>/', RegistrationStatusAPIView.as_view(), name='register-status'),
     path('login/', UserLoginAPIView.as_view(), name='login'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
     path('freelancers/', FreelancerListView.as_view(), name='freelancer-list'),
@@ -1,6 +1,5 @@
 from rest_framework import generics, permissions
 from rest_framework.generics import get_object_or_404
-from rest_framework.generics import ListAPIView
 from .models import ClientProfile, FreelancerProfile, CustomUser
 from .serializers import UserRegistrationSerializer, ClientProfileSerializer, FreelancerProfileSerializer, \
     FreelancerListSerializer, ReviewSerializer
@@ -15,29 +14,78 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.conf import settings
+from django.db import transaction
+from backend.first_project import get_client
+from django.urls import reverse
+from .models import FirstProjectProvisioning
+from .provisioning import enqueue_provisioning
+from backend.eager_loading import EagerLoadingViewMixin
+from backend.response_cache import CachedResponseMixin
+from backend.versioning import get_version_etag, if_match_failed, precondition_failed, version_etag
+from .leaderboard import get_leaderboard
 from .serializers import UserRegistrationSerializer
 class UserRegistrationAPIView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = UserRegistrationSerializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.save()
-            # Prepare data for the first project
-            data_for_first_project = request.data.copy()
-            data_for_first_project['user_type'] = data_for_first_project.pop('role')  # Convert 'role' to 'user_type'
-
-            # Now register this user in the first project
-            response = requests.post(settings.FIRST_PROJECT_API_URL, data=data_for_first_project)
-            if response.status_code == 201:
-                return Response({
-                    'id': user.id,
-                    'username': user.username,
-                    'email': user.email,
-                    'first_project_id': response.json().get('id')
-                }, status=status.HTTP_201_CREATED)
-            else:
-                user.delete()  # Optionally delete the user if the first project registration fails
-                return Response(response.json(), status=response.status_code)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if settings.FIRST_PROJECT_REGISTRATION_MODE == 'deferred':
+            # The first project registration is pushed later by provision_first_project_users,
+            # the client polls the status endpoint until it is no longer pending. Until then
+            # the user cannot log in.
+            with transaction.atomic():
+                user = serializer.save(is_active=False)
+                provisioning = enqueue_provisioning(user, request.data)
+            return Response({
+                'id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'provisioning_status': provisioning.status,
+                'status_url': reverse('register-status', kwargs={'token': provisioning.status_token}),
+            }, status=status.HTTP_202_ACCEPTED)
+
+        user = serializer.save()
+        # Prepare data for the first project
+        data_for_first_project = request.data.copy()
+        data_for_first_project['user_type'] = data_for_first_project.pop('role')  # Convert 'role' to 'user_type'
+
+        # Now register this user in the first project
+        try:
+            response = get_client().post('register', data=data_for_first_project)
+        except requests.RequestException:
+            user.delete()
+            return Response({'error': 'First project is unavailable, try again later'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if response.status_code == 201:
+            return Response({
+                'id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'first_project_id': response.json().get('id')
+            }, status=status.HTTP_201_CREATED)
+        else:
+            user.delete()  # Optionally delete the user if the first project registration fails
+            return Response(response.json(), status=response.status_code)
+
+
+class RegistrationStatusAPIView(APIView):
+    """
+    Looked up by the status token handed out at registration, which only the
+    registering client knows. The user can log in once the status is
+    'provisioned'. A failed registration removes the user, who never could log
+    in, and has to register again.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, token):
+        provisioning = get_object_or_404(FirstProjectProvisioning, status_token=token)
+        return Response({
+            'id': provisioning.user_id,
+            'provisioning_status': provisioning.status,
+            'first_project_id': provisioning.first_project_id,
+            'errors': provisioning.last_error if provisioning.status == 'failed' else None,
+        })
 
 
 # accounts/views.py
@@ -57,11 +105,11 @@ class UserProfileView(generics.RetrieveAPIView):
         response_data = {}
 
         if user.role == 'client':
-            client_profile = ClientProfile.objects.get(user=user)
-            response_data = ClientProfileSerializer(client_profile).data
+            profile = ClientProfile.objects.get(user=user)
+            response_data = ClientProfileSerializer(profile).data
         elif user.role == 'freelancer':
-            freelancer_profile = FreelancerProfile.objects.get(user=user)
-            response_data = FreelancerProfileSerializer(freelancer_profile).data
+            profile = FreelancerProfile.objects.get(user=user)
+            response_data = FreelancerProfileSerializer(profile).data
         else:
             return Response({'error': 'User role is not defined'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -74,7 +122,10 @@ class UserProfileView(generics.RetrieveAPIView):
             'role': user.role
         })
 
-        return Response(response_data)
+        response = Response(response_data)
+        # What UserProfileUpdateView expects back in If-Match
+        response['ETag'] = version_etag(type(profile), profile.pk, profile.version)
+        return response
 
     def put(self, request, *args, **kwargs):
         print("Received data:", request.data)
@@ -85,18 +136,24 @@ class UserProfileView(generics.RetrieveAPIView):
         return self.partial_update(request, *args, **kwargs)
 
 
-class FreelancerListView(generics.ListAPIView):
+class FreelancerListView(EagerLoadingViewMixin, generics.ListAPIView):
     serializer_class = FreelancerListSerializer
 
     def get_queryset(self):
         return CustomUser.objects.filter(role='freelancer')
 
-class FreelancerProfileView(generics.RetrieveAPIView):
+class FreelancerProfileView(CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveAPIView):
     queryset = FreelancerProfile.objects.all()
     serializer_class = FreelancerProfileSerializer
     permission_classes = [permissions.AllowAny]  # Set appropriate permissions
+    cache_scopes = ('freelancers',)
     lookup_field = 'user__username'
 
+    def get_version_etag(self):
+        return get_version_etag(FreelancerProfile.objects.filter(
+            user__username=self.kwargs.get('username'), user__role='freelancer'
+        ))
+
     def get_object(self):
         queryset = self.filter_queryset(self.get_queryset())
         username = self.kwargs.get('username')
@@ -127,16 +184,17 @@ class CreateReviewView(generics.CreateAPIView):
         serializer.save(client=self.request.user, freelancer=freelancer)
 
 
-class TopFreelancersView(ListAPIView):
-    serializer_class = FreelancerListSerializer
-
-    def get_queryset(self):
-        # Get top 3 FreelancerProfiles by rating
-        top_profiles = FreelancerProfile.objects.order_by('-average_rating')[:3]
+class TopFreelancersView(APIView):
+    """
+    Cached leaderboard, overall or for one skill with ?skill=<id>.
+    """
+    permission_classes = [permissions.AllowAny]
 
-        # Fetch the associated User objects
-        top_user_ids = [profile.user_id for profile in top_profiles]
-        return CustomUser.objects.filter(id__in=top_user_ids)
+    def get(self, request):
+        skill_id = request.query_params.get('skill')
+        if skill_id is not None and not skill_id.isdigit():
+            return Response({'error': 'skill must be a skill id'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_leaderboard(int(skill_id) if skill_id else None))
 
 
 class UserLogoutAPIView(APIView):
@@ -161,6 +219,18 @@ class UserProfileUpdateView(APIView):
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
     def put(self, request, *args, **kwargs):
+        profile_model = {'freelancer': FreelancerProfile, 'client': ClientProfile}.get(request.user.role)
+        with transaction.atomic():
+            # If-Match carries the ETag of the profile the client last read
+            etag = get_version_etag(profile_model.objects.filter(user=request.user), lock=True) if profile_model else None
+            if if_match_failed(request, etag):
+                return precondition_failed(etag)
+            response = self.update_profile(request)
+        if profile_model and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = get_version_etag(profile_model.objects.filter(user=request.user))
+        return response
+
+    def update_profile(self, request):
         user = request.user
         data = request.data
 
@@ -205,37 +275,40 @@ from .models import Skill
 from .serializers import SkillSerializer
 from rest_framework import generics
 
-class SkillListView(generics.ListAPIView):
+class SkillListView(CachedResponseMixin, generics.ListAPIView):
     queryset = Skill.objects.all()
     serializer_class = SkillSerializer
+    keyset_ordering = 'name'
+    cache_scopes = ('skills',)
+
+from rest_framework.decorators import api_view
+from backend.pagination import SearchResultsPagination
+from .search import search_freelancer_profiles
+
 
-from django.db.models import Q
 class SearchFreelancerView(APIView):
     def get(self, request):
-        query = request.GET.get('q', '')
-        freelancers = FreelancerProfile.objects.filter(
-            Q(user__username__icontains=query) |
-            Q(user__email__icontains=query) |
-            Q(user__first_name__icontains=query) |   # Added search by first name
-            Q(user__last_name__icontains=query) |    # Added search by last name
-            Q(skills__name__icontains=query)
-        ).distinct()
-        serializer = FreelancerProfileSerializer(freelancers, many=True)
-        return Response(serializer.data)
-
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return Response({'message': 'No search query provided'}, status=status.HTTP_400_BAD_REQUEST)
+        freelancers = search_freelancer_profiles(
+            query, FreelancerProfileSerializer.setup_eager_loading(FreelancerProfile.objects.all())
+        )
+        paginator = SearchResultsPagination()
+        page = paginator.paginate_queryset(freelancers, request, view=self)
+        serializer = FreelancerProfileSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
-from .models import FreelancerProfile
 
 @api_view(['GET'])
 def search_freelancers(request):
-    query = request.GET.get('q', '')
-    print(f"Query: {query}")  # Check the actual query value
-    freelancers = FreelancerProfile.objects.filter(user__username__icontains=query)
-    print(freelancers)  # Check the queryset
-    data = [{'username': freelancer.user.username} for freelancer in freelancers]
-    return Response(data)
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return Response({'message': 'No search query provided'}, status=status.HTTP_400_BAD_REQUEST)
+    freelancers = search_freelancer_profiles(query, FreelancerProfile.objects.select_related('user'))
+    paginator = SearchResultsPagination()
+    page = paginator.paginate_queryset(freelancers, request)
+    return paginator.get_paginated_response([{'username': freelancer.user.username} for freelancer in page])
 
 
 
@@ -250,7 +323,6 @@ def create_review(request, freelancer_id):
     serializer = ReviewSerializer(data=request.data)
     if serializer.is_valid():
         serializer.save(client=request.user, freelancer=freelancer_profile)
-        freelancer_profile.update_rating()  # Assume this method updates and saves the average rating
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     else:
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -259,10 +331,11 @@ from rest_framework import generics
 from .models import Review, FreelancerProfile
 from .serializers import ReviewSerializer
 
-class FreelancerReviewsListView(generics.ListAPIView):
+class FreelancerReviewsListView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.AllowAny]
+    cache_scopes = ('reviews',)
 
     def get_queryset(self):
-        freelancer_id = self.kwargs.get('freelancer_id')
-        return Review.objects.filter(freelancer__id=freelancer_id)
\ No newline at end of file
+        # The route passes the freelancer's username
+        return Review.objects.filter(freelancer__user__username=self.kwargs.get('username'))
\ No newline at end of file
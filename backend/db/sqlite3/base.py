@@ -0,0 +1,64 @@
+# backend/db/sqlite3/base.py
+"""
+The stock SQLite backend tuned for concurrent writers.
+
+With 'wal' set in OPTIONS every new connection gets the pragmas below: WAL lets
+readers run alongside the writer and commits append to the log instead of
+rewriting pages, synchronous NORMAL only syncs at checkpoints. WAL sticks to the
+database file, so it is opt-in rather than applied to whatever file NAME points
+at. In-memory databases get no pragmas. OPTIONS may add to or override them with
+'pragmas' and set 'transaction_mode' (as on Django 5.1) to open atomic blocks with
+BEGIN IMMEDIATE: the write lock is then taken, waiting up to 'timeout' seconds,
+when the transaction starts, rather than failing with "database is locked" when
+a reading transaction tries to write.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    # Negative sizes are in KiB
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'journal_size_limit': 64 * 1024 * 1024,
+}
+
+TRANSACTION_MODES = (None, 'DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = {**(PRAGMAS if options.get('wal') else {}), **options.get('pragmas', {})}
+        self.transaction_mode = options.get('transaction_mode')
+        if self.transaction_mode is not None:
+            self.transaction_mode = self.transaction_mode.upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES[{self.alias!r}]['OPTIONS']['transaction_mode'] must be one of "
+                f"{', '.join(mode for mode in TRANSACTION_MODES if mode)}"
+            )
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Ours, not sqlite3.connect() arguments
+        params.pop('wal', None)
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            for name, value in self.pragmas.items():
+                conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
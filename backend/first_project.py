@@ -0,0 +1,197 @@
+# backend/first_project.py
+"""
+Shared HTTP client for every call to the first project.
+
+One keep-alive session per process, a timeout per endpoint, a circuit breaker per
+endpoint and in-process latency/error metrics rendered by backend.views.metrics.
+"""
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and lets a single trial
+    request through once `reset_timeout` seconds have passed.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def available(self):
+        return self.state != self.OPEN or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.latency = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, outcome, seconds):
+        with self._lock:
+            self.latency.setdefault((endpoint, outcome), Histogram()).observe(seconds)
+
+    def error(self, endpoint, kind):
+        with self._lock:
+            self.errors[(endpoint, kind)] = self.errors.get((endpoint, kind), 0) + 1
+
+    def render(self, breakers):
+        """
+        Prometheus text exposition format.
+        """
+        lines = [
+            '# HELP first_project_request_duration_seconds Latency of calls to the first project.',
+            '# TYPE first_project_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (endpoint, outcome), histogram in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",outcome="{outcome}"'
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'first_project_request_duration_seconds_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f'first_project_request_duration_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'first_project_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            lines += [
+                '# HELP first_project_request_errors_total Failed calls to the first project.',
+                '# TYPE first_project_request_errors_total counter',
+            ]
+            for (endpoint, kind), count in sorted(self.errors.items()):
+                lines.append(f'first_project_request_errors_total{{endpoint="{endpoint}",kind="{kind}"}} {count}')
+
+        lines += [
+            '# HELP first_project_circuit_open Whether the circuit breaker of an endpoint is open.',
+            '# TYPE first_project_circuit_open gauge',
+        ]
+        for endpoint, breaker in sorted(breakers.items()):
+            lines.append(f'first_project_circuit_open{{endpoint="{endpoint}"}} {int(not breaker.available())}')
+        return '\n'.join(lines) + '\n'
+
+
+class FirstProjectClient:
+    def __init__(self, endpoints, pool_size, failure_threshold, reset_timeout):
+        self.endpoints = endpoints
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(endpoints), pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breakers = {name: CircuitBreaker(failure_threshold, reset_timeout) for name in endpoints}
+        self.metrics = Metrics()
+
+    def available(self, endpoint):
+        return self.breakers[endpoint].available()
+
+    def post(self, endpoint, **kwargs):
+        """
+        POSTs to one of the configured endpoints. Server errors and network failures
+        count towards the breaker, any other response is returned to the caller as is.
+        """
+        config = self.endpoints[endpoint]
+        breaker = self.breakers[endpoint]
+        if not breaker.allow():
+            self.metrics.error(endpoint, 'circuit_open')
+            raise CircuitOpenError(f'Circuit for first project endpoint "{endpoint}" is open')
+
+        started = time.monotonic()
+        try:
+            response = self.session.post(config['url'], timeout=config['timeout'], **kwargs)
+        except requests.Timeout:
+            self._failed(endpoint, 'timeout', started)
+            raise
+        except requests.RequestException:
+            self._failed(endpoint, 'connection', started)
+            raise
+
+        if response.status_code >= 500:
+            self._failed(endpoint, 'http_5xx', started)
+        else:
+            breaker.record_success()
+            if response.status_code >= 400:
+                self.metrics.error(endpoint, 'http_4xx')
+            self.metrics.observe(endpoint, 'success' if response.ok else 'client_error', time.monotonic() - started)
+        return response
+
+    def _failed(self, endpoint, kind, started):
+        self.breakers[endpoint].record_failure()
+        self.metrics.error(endpoint, kind)
+        self.metrics.observe(endpoint, 'error', time.monotonic() - started)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FirstProjectClient(
+                    endpoints={
+                        'register': {
+                            'url': settings.FIRST_PROJECT_API_URL,
+                            'timeout': settings.FIRST_PROJECT_TIMEOUTS['register'],
+                        },
+                        'orders': {
+                            'url': settings.FIRST_PROJECT_ORDER_API_URL,
+                            'timeout': settings.FIRST_PROJECT_TIMEOUTS['orders'],
+                        },
+                    },
+                    pool_size=settings.FIRST_PROJECT_POOL_SIZE,
+                    failure_threshold=settings.FIRST_PROJECT_CIRCUIT_FAILURE_THRESHOLD,
+                    reset_timeout=settings.FIRST_PROJECT_CIRCUIT_RESET_TIMEOUT,
+                )
+    return _client
@@ -0,0 +1,197 @@
+# backend/fulltext.py
+"""
+Full-text indexes kept next to the model tables.
+
+SQLite gets an FTS5 virtual table, PostgreSQL a plain table with a generated,
+weighted tsvector column under a GIN index. Rows are keyed by the id of the
+object they index and written by the owning app (see listings/search.py).
+"""
+import re
+
+from django.db import connection as default_connection
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# bm25 column weights for SQLite, matching the tsvector weight letters on PostgreSQL
+SQLITE_WEIGHTS = {'A': 10.0, 'B': 4.0, 'C': 1.0, 'D': 0.5}
+
+
+def get_terms(query, max_terms=8):
+    return TERM_RE.findall(query.lower())[:max_terms]
+
+
+class FullTextIndex:
+    def __init__(self, table, columns, snippet_column, sqlite_tokenizer='unicode61 remove_diacritics 2',
+                 pg_config='english', prefix=True):
+        """
+        columns maps column name -> weight letter ('A' ranks highest).
+        """
+        self.table = table
+        self.columns = columns
+        self.snippet_column = snippet_column
+        self.sqlite_tokenizer = sqlite_tokenizer
+        self.pg_config = pg_config
+        self.prefix = prefix
+
+    @staticmethod
+    def is_supported(connection=default_connection):
+        return connection.vendor in ('sqlite', 'postgresql')
+
+    def create(self, connection=default_connection):
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, tokenize='{}')".format(
+                    qn(self.table), ', '.join(self.columns), self.sqlite_tokenizer
+                ))
+            elif connection.vendor == 'postgresql':
+                document = ' || '.join(
+                    "setweight(to_tsvector('{}', coalesce({}, '')), '{}')".format(self.pg_config, qn(column), weight)
+                    for column, weight in self.columns.items()
+                )
+                cursor.execute('CREATE TABLE IF NOT EXISTS {} (id bigint PRIMARY KEY, {}, document tsvector '
+                               'GENERATED ALWAYS AS ({}) STORED)'.format(
+                                   qn(self.table), ', '.join(f'{qn(column)} text' for column in self.columns),
+                                   document))
+                cursor.execute('CREATE INDEX IF NOT EXISTS {} ON {} USING GIN (document)'.format(
+                    qn(f'{self.table}_document_idx'), qn(self.table)
+                ))
+
+    def drop(self, connection=default_connection):
+        if self.is_supported(connection):
+            with connection.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS {}'.format(connection.ops.quote_name(self.table)))
+
+    def delete(self, ids, connection=default_connection):
+        ids = list(ids)
+        if not ids or not self.is_supported(connection):
+            return
+        key = 'rowid' if connection.vendor == 'sqlite' else 'id'
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE {} IN ({})'.format(
+                connection.ops.quote_name(self.table), key, ', '.join(['%s'] * len(ids))
+            ), ids)
+
+    def upsert(self, documents, connection=default_connection):
+        """
+        documents is a list of (id, {column: text}).
+        """
+        if not documents or not self.is_supported(connection):
+            return
+        qn = connection.ops.quote_name
+        columns = list(self.columns)
+        rows = [[pk] + [values.get(column) or '' for column in columns] for pk, values in documents]
+        placeholders = ', '.join(['%s'] * (len(columns) + 1))
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                # FTS5 has no upsert, rows are replaced
+                self.delete([pk for pk, _ in documents], connection)
+                cursor.executemany('INSERT INTO {} (rowid, {}) VALUES ({})'.format(
+                    qn(self.table), ', '.join(columns), placeholders
+                ), rows)
+            else:
+                cursor.executemany('INSERT INTO {} (id, {}) VALUES ({}) ON CONFLICT (id) DO UPDATE SET {}'.format(
+                    qn(self.table), ', '.join(qn(c) for c in columns), placeholders,
+                    ', '.join(f'{qn(c)} = EXCLUDED.{qn(c)}' for c in columns)
+                ), rows)
+
+    def clear(self, connection=default_connection):
+        if self.is_supported(connection):
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM {}'.format(connection.ops.quote_name(self.table)))
+
+    @property
+    def is_trigram(self):
+        # FTS5 trigram tables match any substring of 3+ characters, there are no prefix queries
+        return self.sqlite_tokenizer.startswith('trigram')
+
+    def usable_terms(self, query, connection=default_connection):
+        terms = get_terms(query)
+        if connection.vendor == 'sqlite' and self.is_trigram:
+            terms = [term for term in terms if len(term) >= 3]
+        return terms
+
+    def build_query(self, terms, connection=default_connection):
+        if connection.vendor == 'sqlite':
+            suffix = '*' if self.prefix and not self.is_trigram else ''
+            return ' '.join(f'"{term}"{suffix}' for term in terms)
+        suffix = ':*' if self.prefix else ''
+        return ' & '.join(f'{term}{suffix}' for term in terms)
+
+    def count(self, query, connection=default_connection):
+        terms = self.usable_terms(query, connection)
+        if not terms:
+            return 0
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT count(*) FROM {0} WHERE {0} MATCH %s'.format(qn(self.table)),
+                               [self.build_query(terms, connection)])
+            else:
+                cursor.execute('SELECT count(*) FROM {} WHERE document @@ to_tsquery(%s::regconfig, %s)'.format(
+                    qn(self.table)), [self.pg_config, self.build_query(terms, connection)])
+            return cursor.fetchone()[0]
+
+    def search(self, query, limit, offset=0, connection=default_connection):
+        """
+        Best matches first, as a list of (id, rank, highlighted snippet).
+        """
+        terms = self.usable_terms(query, connection)
+        if not terms:
+            return []
+        qn = connection.ops.quote_name
+        match = self.build_query(terms, connection)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                columns = list(self.columns)
+                weights = ', '.join(str(SQLITE_WEIGHTS[self.columns[column]]) for column in columns)
+                cursor.execute(
+                    "SELECT rowid, -bm25({0}, {1}) AS rank, "
+                    "snippet({0}, {2}, '<mark>', '</mark>', '…', 16) "
+                    "FROM {0} WHERE {0} MATCH %s ORDER BY bm25({0}, {1}), rowid LIMIT %s OFFSET %s".format(
+                        qn(self.table), weights, columns.index(self.snippet_column)),
+                    [match, limit, offset])
+            else:
+                # ts_headline is expensive, so it only runs on the page that is returned
+                cursor.execute(
+                    "SELECT page.id, page.rank, ts_headline(%s::regconfig, t.{1}, page.q, "
+                    "'StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8, MaxFragments=1') "
+                    "FROM (SELECT id, ts_rank_cd(document, q, 1) AS rank, q FROM {0}, to_tsquery(%s::regconfig, %s) q "
+                    "WHERE document @@ q ORDER BY rank DESC, id LIMIT %s OFFSET %s) page "
+                    "JOIN {0} t ON t.id = page.id ORDER BY page.rank DESC, page.id".format(
+                        qn(self.table), qn(self.snippet_column)),
+                    [self.pg_config, self.pg_config, match, limit, offset])
+            return cursor.fetchall()
+
+
+class SearchResults:
+    """
+    Lazy, sliceable view of a search so the DRF paginators can page through it:
+    len() runs the count query and slicing runs the ranked search for that page only.
+    """
+
+    def __init__(self, index, query, load):
+        """
+        load receives a list of (id, rank, snippet) and returns the objects in that order.
+        """
+        self.index = index
+        self.query = query
+        self.load = load
+        self._count = None
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self.index.count(self.query)
+        return self._count
+
+    def count(self):
+        return len(self)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        stop = item.stop if item.stop is not None else len(self)
+        if stop <= start:
+            return []
+        return self.load(self.index.search(self.query, stop - start, start))
@@ -0,0 +1,51 @@
+# backend/pagination.py
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Default pagination of every list endpoint. Pages are fetched with a WHERE on
+    the ordering columns instead of an OFFSET, so deep pages cost the same as the
+    first one. Views can pass their own ordering as `keyset_ordering`; the last
+    field must be unique.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', self.ordering)
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+
+class SearchResultsPagination(LimitOffsetPagination):
+    """
+    For relevance-ranked results, which have no stable key to page on. Both the
+    page size and the depth are capped: offsets past SEARCH_MAX_OFFSET answer 400
+    and the last page within it has no next link.
+    """
+    default_limit = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+    @property
+    def max_limit(self):
+        return settings.MAX_PAGE_SIZE
+
+    @property
+    def max_offset(self):
+        return settings.SEARCH_MAX_OFFSET
+
+    def get_offset(self, request):
+        offset = super().get_offset(request)
+        if offset > self.max_offset:
+            raise ValidationError({'offset': f'Results past offset {self.max_offset} are not served.'})
+        return offset
+
+    def get_next_link(self):
+        if self.offset + self.limit > self.max_offset:
+            return None
+        return super().get_next_link()
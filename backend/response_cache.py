@@ -0,0 +1,102 @@
+# backend/response_cache.py
+"""
+Cached responses of public read endpoints.
+
+Entries are keyed by view, URL kwargs, normalized query params and the current
+version of every scope the view declares ('listings', 'skills', ...). Model
+signals bump a scope's version after commit, which orphans every entry built
+on it; orphans expire after RESPONSE_CACHE_TIMEOUT. Entries carry an ETag and a
+Last-Modified date so clients can revalidate and get a 304.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def version_key(scope):
+    return f'response-cache:version:{scope}'
+
+
+def bump(*scopes):
+    """
+    Invalidates every cached response built on the given scopes once the current
+    transaction commits.
+    """
+    def run():
+        for scope in scopes:
+            key = version_key(scope)
+            if not cache.add(key, 2, None):
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    # Evicted between add and incr
+                    cache.set(key, 1, None)
+    transaction.on_commit(run)
+
+
+def get_versions(scopes):
+    versions = cache.get_many([version_key(scope) for scope in scopes])
+    return [versions.get(version_key(scope), 1) for scope in scopes]
+
+
+def make_etag(data):
+    content = json.dumps(data, sort_keys=True, default=str).encode()
+    return '"{}"'.format(hashlib.md5(content, usedforsecurity=False).hexdigest())
+
+
+class CachedResponseMixin:
+    """
+    For public GET views whose output does not depend on the user. Views list the
+    scopes they read in `cache_scopes`.
+    """
+    cache_scopes = ()
+
+    def get_version_etag(self):
+        """
+        Detail views backed by a version counter (backend/versioning.py) return
+        the object's ETag here, so If-None-Match is answered before serializing.
+        """
+        return None
+
+    def get_response_cache_key(self, request, etag=None):
+        params = sorted((name, sorted(values)) for name, values in request.query_params.lists())
+        versions = get_versions(self.cache_scopes)
+        fingerprint = json.dumps([sorted(self.kwargs.items()), params, versions, etag], default=str)
+        digest = hashlib.md5(fingerprint.encode(), usedforsecurity=False).hexdigest()
+        return f'response-cache:{type(self).__module__}.{type(self).__name__}:{digest}'
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_version_etag()
+        if etag is not None:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                return not_modified
+
+        key = self.get_response_cache_key(request, etag)
+        entry = cache.get(key)
+        if entry is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = {
+                'data': response.data,
+                'etag': etag or make_etag(response.data),
+                'last_modified': int(time.time()),
+            }
+            cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+
+        response = Response(entry['data'])
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        response['Cache-Control'] = 'no-cache'
+        return get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified'], response=response
+        )
@@ -18,6 +18,7 @@ ALLOWED_HOSTS = ['*']
 
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver, serves the chat websockets in development
     'jazzmin',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
+    'channels',
 
 ]
 
@@ -47,8 +49,46 @@ MIDDLEWARE = [
 ]
 
 # settings.py in the second project
-FIRST_PROJECT_API_URL = 'https://presidentski.pythonanywhere.com/accounts/api/register/'
-FIRST_PROJECT_ORDER_API_URL = 'http://presidentski.pythonanywhere.com/listings/api/orders/create/'
+FIRST_PROJECT_API_URL = os.environ.get(
+    'FIRST_PROJECT_API_URL', 'https://presidentski.pythonanywhere.com/accounts/api/register/')
+FIRST_PROJECT_ORDER_API_URL = os.environ.get(
+    'FIRST_PROJECT_ORDER_API_URL', 'http://presidentski.pythonanywhere.com/listings/api/orders/create/')
+
+# 'sync' waits for the first project and answers 201 with its id. 'deferred' (opt in
+# through the environment) answers 202 right away and leaves the first project call
+# to `manage.py provision_first_project_users`.
+FIRST_PROJECT_REGISTRATION_MODE = os.environ.get('FIRST_PROJECT_REGISTRATION_MODE', 'sync')
+PROVISIONING_BATCH_SIZE = 50
+PROVISIONING_CONCURRENCY = 8
+PROVISIONING_MAX_ATTEMPTS = 8
+PROVISIONING_BACKOFF_SECONDS = 30
+PROVISIONING_MAX_BACKOFF_SECONDS = 60 * 60
+PROVISIONING_LEASE_SECONDS = 5 * 60
+PROVISIONING_POLL_INTERVAL = 2
+# Seconds the encrypted password of a pending registration stays readable, longer
+# than the retries above take; registrations still pending then fail
+PROVISIONING_PASSWORD_TTL = 3 * 60 * 60
+
+# Shared client for outbound first project calls (backend/first_project.py),
+# timeouts are (connect, read) seconds per endpoint
+FIRST_PROJECT_TIMEOUTS = {
+    'register': (3.05, 10),
+    'orders': (3.05, 10),
+}
+FIRST_PROJECT_POOL_SIZE = 10
+FIRST_PROJECT_CIRCUIT_FAILURE_THRESHOLD = 5
+FIRST_PROJECT_CIRCUIT_RESET_TIMEOUT = 30
+# Bearer token the Prometheus scraper sends to /metrics/; without one only staff
+# sessions can read it
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Listing -> first project order sync outbox, drained by `manage.py drain_order_outbox`
+ORDER_SYNC_BATCH_SIZE = 100
+ORDER_SYNC_MAX_ATTEMPTS = 8
+ORDER_SYNC_BACKOFF_SECONDS = 30
+ORDER_SYNC_MAX_BACKOFF_SECONDS = 60 * 60
+ORDER_SYNC_LEASE_SECONDS = 5 * 60
+ORDER_SYNC_POLL_INTERVAL = 2
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -69,14 +109,76 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# Redis in production (set REDIS_URL), in-memory for tests and local development.
+# The in-memory layer only reaches sockets served by the same process, and the
+# local-memory cache is per process too.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        },
+    }
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# PostgreSQL in production (set POSTGRES_DB), SQLite otherwise, in WAL mode with SQLITE_WAL=1.
+# Connections are kept for DB_CONN_MAX_AGE seconds and checked before reuse.
+# Behind a transaction-pooling PgBouncer set POSTGRES_POOLER=transaction, which
+# turns off the server-side cursors such a pooler cannot carry.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_POOLER') == 'transaction',
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            # Pragmas applied on connect are in backend/db/sqlite3/base.py
+            'ENGINE': 'backend.db.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'wal': os.environ.get('SQLITE_WAL') == '1',
+                # Seconds a writer waits for the lock before "database is locked"
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
-}
 
 
 
@@ -119,7 +221,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'backend.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
+
+# Largest page a client can ask for with ?page_size= / ?limit=
+MAX_PAGE_SIZE = 100
+
+# Deepest offset served for ranked search results
+SEARCH_MAX_OFFSET = 1000
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -138,3 +248,35 @@ CORS_ALLOWED_ORIGINS = [
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Bayesian rating of freelancers: RATING_PRIOR_WEIGHT virtual reviews of RATING_PRIOR_MEAN
+# are added to every profile. Run rebuild_ratings after changing these.
+RATING_PRIOR_MEAN = 3.0
+RATING_PRIOR_WEIGHT = 5
+
+# Cached top-freelancer leaderboards (accounts/leaderboard.py), overall and per skill.
+# Ties on the Bayesian rating go to more reviews ('rating_count') or the older profile ('oldest').
+LEADERBOARD_SIZE = 3
+LEADERBOARD_TIE_BREAK = 'rating_count'
+LEADERBOARD_TIMEOUT = 60 * 60
+
+# Skill matching between listings and freelancers (listings/matching.py)
+MATCHING_TOP_K = 20
+MATCHING_INDEX_TIMEOUT = 24 * 60 * 60
+
+# Precomputed recommendations (listings/recommendations.py), refreshed by compute_recommendations
+RECOMMENDATIONS_TOP_N = 20
+RECOMMENDATIONS_CHUNK_SIZE = 1000
+
+# Faceted browsing of open listings (listings/facets.py): bounds of the price
+# buckets, the last one open-ended, and how many skills get a count
+LISTING_PRICE_BUCKETS = (0, 50, 100, 250, 500, 1000, 5000)
+LISTING_FACET_SKILLS = 50
+
+# Bulk listing import and export (listings/bulk.py): listings inserted per
+# transaction, and rows fetched per round trip while streaming an export
+LISTING_IMPORT_BATCH_SIZE = 1000
+LISTING_EXPORT_CHUNK_SIZE = 2000
+
+# Lifetime of cached public responses (backend/response_cache.py); signals drop them sooner
+RESPONSE_CACHE_TIMEOUT = 10 * 60
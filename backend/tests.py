@@ -0,0 +1,71 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from listings.models import Listing
+
+
+class MetricsAccessTests(TestCase):
+    def test_anonymous_is_refused(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+    def test_staff_session_can_read(self):
+        staff = CustomUser.objects.create_user(username='metricsstaff', password='x', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'first_project_circuit_open', response.content)
+
+    def test_non_staff_session_is_refused(self):
+        self.client.force_login(CustomUser.objects.create_user(username='metricsuser', password='x'))
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    def test_no_token_configured_accepts_none(self):
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        client = CustomUser.objects.create_user(username='pagination-client', password='x', role='client')
+        self.listings = [
+            Listing.objects.create(user=client, title=f'widget {i}', description='widget', price=10)
+            for i in range(7)
+        ]
+
+    def follow(self, url, params):
+        pages = []
+        response = APIClient().get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([listing['id'] for listing in response.data['results']])
+            if not response.data['next'] or len(pages) > 10:
+                return pages
+            response = APIClient().get(response.data['next'])
+
+    def test_lists_are_keyset_paginated_newest_first(self):
+        pages = self.follow('/api/listings/open/', {'page_size': 3})
+        ids = [listing.pk for listing in reversed(self.listings)]
+        self.assertEqual(pages, [ids[:3], ids[3:6], ids[6:]])
+
+    @override_settings(MAX_PAGE_SIZE=4)
+    def test_page_size_is_capped(self):
+        response = APIClient().get('/api/listings/open/', {'page_size': 50})
+        self.assertEqual(len(response.data['results']), 4)
+        response = APIClient().get('/api/listings/open/search/', {'search': 'widget', 'limit': 50})
+        self.assertEqual(len(response.data['results']), 4)
+
+    @override_settings(SEARCH_MAX_OFFSET=4)
+    def test_search_stops_at_the_offset_cap(self):
+        pages = self.follow('/api/listings/open/search/', {'search': 'widget', 'limit': 2})
+        # Offsets 0, 2 and 4; nothing links past the cap
+        self.assertEqual([len(page) for page in pages], [2, 2, 2])
+        response = APIClient().get('/api/listings/open/search/', {'search': 'widget', 'limit': 2, 'offset': 6})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('offset', response.data)
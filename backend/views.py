@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .first_project import get_client
+
+
+def can_read_metrics(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return bool(settings.METRICS_TOKEN) and scheme.lower() == 'bearer' and constant_time_compare(
+        token, settings.METRICS_TOKEN
+    )
+
+
+def metrics(request):
+    """
+    Per-process metrics of the outbound first project calls, in Prometheus text format.
+    Staff sessions or METRICS_TOKEN only.
+    """
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    client = get_client()
+    return HttpResponse(client.metrics.render(client.breakers), content_type='text/plain; version=0.0.4')
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Chat, Message
+from .models import Chat, ChatReadState, Message
 admin.site.register(Chat)
 admin.site.register(Message)
+admin.site.register(ChatReadState)
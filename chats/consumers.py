@@ -0,0 +1,103 @@
+# chats/consumers.py
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .events import broadcast_read, group_name
+from .models import Chat, ChatReadState, Message
+from .serializers import MessageSerializer
+
+# How many messages are replayed to a client reconnecting with ?after=<message id>
+CATCH_UP_LIMIT = 100
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes new messages, read receipts and typing events of a single chat.
+
+    Client -> server:
+        {"type": "message", "content": "..."}
+        {"type": "read", "message_id": 42}
+        {"type": "typing", "is_typing": true}
+    Server -> client:
+        {"type": "message", "message": {...}}
+        {"type": "read", "user": 3, "message_id": 42}
+        {"type": "typing", "user": 3, "is_typing": true}
+    """
+
+    async def connect(self):
+        self.chat_id = self.scope['url_route']['kwargs']['chat_id']
+        self.user = self.scope['user']
+        if not self.user.is_authenticated or not await self.is_participant():
+            await self.close(code=4403)
+            return
+
+        await self.channel_layer.group_add(group_name(self.chat_id), self.channel_name)
+        await self.accept()
+
+        after = parse_qs(self.scope.get('query_string', b'').decode()).get('after', [None])[0]
+        if after and after.isdigit():
+            for message in await self.get_messages_after(int(after)):
+                await self.send_json({'type': 'message', 'message': message})
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(group_name(self.chat_id), self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        event_type = content.get('type')
+        if event_type == 'message':
+            errors = await self.create_message(content)
+            if errors:
+                await self.send_json({'type': 'error', 'errors': errors})
+        elif event_type == 'read':
+            message_id = content.get('message_id')
+            if isinstance(message_id, int):
+                errors = await self.mark_read(message_id)
+                if errors:
+                    await self.send_json({'type': 'error', 'errors': errors})
+        elif event_type == 'typing':
+            await self.channel_layer.group_send(group_name(self.chat_id), {
+                'type': 'chat.typing',
+                'user': self.user.id,
+                'is_typing': bool(content.get('is_typing', True)),
+            })
+
+    async def chat_message(self, event):
+        await self.send_json({'type': 'message', 'message': event['message']})
+
+    async def chat_read(self, event):
+        await self.send_json({'type': 'read', 'user': event['user'], 'message_id': event['message_id']})
+
+    async def chat_typing(self, event):
+        if event['user'] != self.user.id:
+            await self.send_json({'type': 'typing', 'user': event['user'], 'is_typing': event['is_typing']})
+
+    @database_sync_to_async
+    def is_participant(self):
+        return Chat.objects.filter(id=self.chat_id, participants=self.user).exists()
+
+    @database_sync_to_async
+    def get_messages_after(self, message_id):
+        messages = Message.objects.filter(chat_id=self.chat_id, id__gt=message_id).order_by('id')[:CATCH_UP_LIMIT]
+        context = {'read_watermarks': ChatReadState.watermarks(self.chat_id)}
+        return MessageSerializer(messages, many=True, context=context).data
+
+    @database_sync_to_async
+    def create_message(self, content):
+        # The new row reaches every socket, this one included, through the post_save broadcast
+        serializer = MessageSerializer(data={'content': content.get('content')})
+        if not serializer.is_valid():
+            return serializer.errors
+        serializer.save(author=self.user, chat_id=self.chat_id)
+        return None
+
+    @database_sync_to_async
+    def mark_read(self, message_id):
+        try:
+            last_read = ChatReadState.mark_read(self.chat_id, self.user, message_id)
+        except Message.DoesNotExist:
+            return {'message_id': ['Not a message of this chat.']}
+        if last_read is not None:
+            broadcast_read(self.chat_id, self.user.id, message_id)
+        return None
@@ -0,0 +1,37 @@
+# chats/events.py
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+
+def group_name(chat_id):
+    return f'chat_{chat_id}'
+
+
+def send_to_chat(chat_id, event):
+    """
+    Pushes an event to every socket connected to the chat. A broken channel layer
+    must not fail the request that produced the event, clients can still catch up over HTTP.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group_name(chat_id), event)
+    except Exception as e:
+        logger.error(f'Could not push {event["type"]} to chat {chat_id}: {e}')
+
+
+def broadcast_message(message):
+    from .models import ChatReadState
+    from .serializers import MessageSerializer
+    # Serialized as ChatDetailView does, is_read included
+    context = {'read_watermarks': ChatReadState.watermarks(message.chat_id)}
+    send_to_chat(message.chat_id, {'type': 'chat.message', 'message': MessageSerializer(message, context=context).data})
+
+
+def broadcast_read(chat_id, user_id, message_id):
+    send_to_chat(chat_id, {'type': 'chat.read', 'user': user_id, 'message_id': message_id})
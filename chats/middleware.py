@@ -0,0 +1,32 @@
+# chats/middleware.py
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+@database_sync_to_async
+def get_user(user_id):
+    from accounts.models import CustomUser
+    return CustomUser.objects.filter(id=user_id, is_active=True).first() or AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Browsers can't set headers on a websocket handshake, so the access token is
+    passed as ?token=<access token> instead of the Authorization header.
+    """
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        scope['user'] = AnonymousUser()
+        token = query.get('token', [None])[0]
+        if token:
+            try:
+                scope['user'] = await get_user(AccessToken(token)['user_id'])
+            except (TokenError, KeyError):
+                pass
+        return await super().__call__(scope, receive, send)
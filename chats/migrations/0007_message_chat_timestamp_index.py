@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0006_message_is_read'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'timestamp', 'id'], name='chats_msg_chat_ts_idx'),
+        ),
+    ]
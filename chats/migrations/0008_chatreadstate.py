@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_read_states(apps, schema_editor):
+    Chat = apps.get_model('chats', 'Chat')
+    ChatReadState = apps.get_model('chats', 'ChatReadState')
+    memberships = Chat.participants.through.objects.annotate(
+        unread=models.Count('chat__messages', filter=models.Q(chat__messages__is_read=False) & ~models.Q(
+            chat__messages__author_id=models.F('customuser_id')
+        ))
+    ).values_list('chat_id', 'customuser_id', 'unread')
+    ChatReadState.objects.bulk_create(
+        [ChatReadState(chat_id=chat_id, user_id=user_id, unread_count=unread) for chat_id, user_id, unread in memberships],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chats', '0007_message_chat_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chats.chat')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chatreadstate',
+            constraint=models.UniqueConstraint(fields=('chat', 'user'), name='chats_readstate_chat_user_uniq'),
+        ),
+        migrations.RunPython(create_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+def set_watermarks(apps, schema_editor):
+    """
+    Everything before a participant's oldest unread message counts as read. The
+    watermark is always a message of the chat (or 0), as ChatReadState.mark_read
+    requires, so it never passes the chat's last message.
+    """
+    ChatReadState = apps.get_model('chats', 'ChatReadState')
+    Message = apps.get_model('chats', 'Message')
+    states = list(ChatReadState.objects.all())
+    for state in states:
+        messages = Message.objects.filter(chat_id=state.chat_id)
+        first_unread = messages.filter(is_read=False).exclude(author_id=state.user_id).aggregate(
+            id=models.Min('id'))['id']
+        if first_unread is not None:
+            messages = messages.filter(id__lt=first_unread)
+        state.last_read_message_id = messages.aggregate(id=models.Max('id'))['id'] or 0
+        state.unread_count = Message.objects.filter(chat_id=state.chat_id, id__gt=state.last_read_message_id).exclude(
+            author_id=state.user_id).count()
+    ChatReadState.objects.bulk_update(states, ['last_read_message_id', 'unread_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0008_chatreadstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatreadstate',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(set_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0009_chatreadstate_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='participant_key',
+            field=models.CharField(blank=True, editable=False, max_length=41, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:02
+
+from django.db import migrations
+
+
+def collapse_duplicate_chats(apps, schema_editor):
+    """
+    Keys every two-person chat by its participant pair and folds the duplicates a
+    pair picked up into its oldest chat, messages included.
+    """
+    Chat = apps.get_model('chats', 'Chat')
+    ChatReadState = apps.get_model('chats', 'ChatReadState')
+    Message = apps.get_model('chats', 'Message')
+
+    participants = {}
+    for chat_id, user_id in Chat.participants.through.objects.values_list('chat_id', 'customuser_id'):
+        participants.setdefault(chat_id, []).append(user_id)
+
+    chats_by_key = {}
+    for chat_id, user_ids in sorted(participants.items()):
+        if len(user_ids) == 2:
+            chats_by_key.setdefault('{}:{}'.format(*sorted(user_ids)), []).append(chat_id)
+
+    for key, (chat_id, *duplicate_ids) in chats_by_key.items():
+        if duplicate_ids:
+            Message.objects.filter(chat_id__in=duplicate_ids).update(chat_id=chat_id)
+            for state in ChatReadState.objects.filter(chat_id=chat_id):
+                # The lowest watermark of the merged chats, so nothing unread gets lost
+                state.last_read_message_id = min(
+                    ChatReadState.objects.filter(chat_id__in=[chat_id, *duplicate_ids], user_id=state.user_id)
+                    .values_list('last_read_message_id', flat=True)
+                )
+                state.unread_count = Message.objects.filter(
+                    chat_id=chat_id, id__gt=state.last_read_message_id
+                ).exclude(author_id=state.user_id).count()
+                state.save(update_fields=['last_read_message_id', 'unread_count'])
+            Chat.objects.filter(id__in=duplicate_ids).delete()
+        Chat.objects.filter(id=chat_id).update(participant_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0010_chat_participant_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicate_chats, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,58 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
 from accounts.models import CustomUser
 
+# Characters of the last message shipped with each inbox row
+PREVIEW_LENGTH = 100
+
+
+class ChatManager(models.Manager):
+    def inbox_for(self, user):
+        """
+        The user's chats with their unread count and last message annotated, so the
+        whole inbox is one query plus one for the prefetched participants.
+        """
+        latest = Message.objects.filter(chat=OuterRef('pk')).order_by('-timestamp', '-id')
+        unread = ChatReadState.objects.filter(chat=OuterRef('pk'), user=user).values('unread_count')[:1]
+        return (
+            self.filter(participants=user)
+            .annotate(
+                unread_messages=Coalesce(Subquery(unread), Value(0)),
+                last_message_pk=Subquery(latest.values('id')[:1]),
+                last_message_author_id=Subquery(latest.values('author_id')[:1]),
+                last_message_content=Subquery(latest.annotate(
+                    preview=Substr('content', 1, PREVIEW_LENGTH)
+                ).values('preview')[:1]),
+                last_message_timestamp=Subquery(latest.values('timestamp')[:1]),
+            )
+            .prefetch_related('participants')
+            .order_by(F('last_message_timestamp').desc(nulls_last=True), '-id')
+        )
+
+
 class Chat(models.Model):
     participants = models.ManyToManyField(CustomUser, related_name='chats')
+    # "<smaller user id>:<larger user id>" for two-person chats, one chat per pair
+    participant_key = models.CharField(max_length=41, unique=True, null=True, blank=True, editable=False)
+
+    objects = ChatManager()
+
+    @staticmethod
+    def get_participant_key(user1, user2):
+        return '{}:{}'.format(*sorted([user1.pk, user2.pk]))
 
     @classmethod
     def get_or_create_with_participants(cls, user1, user2):
-        chat = cls.objects.filter(participants=user1).filter(participants=user2).first()
-        if chat is None:
-            chat = cls.objects.create()
-            chat.participants.add(user1, user2)
-            chat.save()
-            return chat, True  # Chat created
-        return chat, False  # Chat already exists
+        # A single probe of the unique participant_key index; if two requests race,
+        # the loser's insert hits the constraint and get_or_create returns the winner's chat
+        with transaction.atomic():
+            chat, created = cls.objects.get_or_create(participant_key=cls.get_participant_key(user1, user2))
+            if created:
+                chat.participants.add(user1, user2)
+        return chat, created
 
     def __str__(self):
         return "{}".format(self.pk)
@@ -25,8 +65,81 @@ class Message(models.Model):
     author = models.ForeignKey(CustomUser, related_name='messages', on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat', 'timestamp', 'id'], name='chats_msg_chat_ts_idx'),
+        ]
 
     def __str__(self):
         return "Chat {} - Author {}".format(self.chat.pk, self.author.email)
 
+
+class ChatReadState(models.Model):
+    """
+    Per participant bookkeeping of a chat. Everything up to last_read_message_id
+    counts as read, so marking a chat as read is a single row update; unread_count
+    is kept alongside it so the inbox never has to count messages.
+    """
+    chat = models.ForeignKey(Chat, related_name='read_states', on_delete=models.CASCADE)
+    user = models.ForeignKey(CustomUser, related_name='chat_read_states', on_delete=models.CASCADE)
+    last_read_message_id = models.BigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'user'], name='chats_readstate_chat_user_uniq'),
+        ]
+
+    def __str__(self):
+        return "Chat {} - User {} ({} unread)".format(self.chat_id, self.user_id, self.unread_count)
+
+    @classmethod
+    def mark_read(cls, chat_id, user, message_id=None):
+        """
+        Moves the user's watermark up to message_id (the latest message by default).
+        Returns the new watermark, or None when it did not move. Raises
+        Message.DoesNotExist when message_id is not a message of the chat: a
+        watermark past the last message would hide every later one.
+        """
+        messages = Message.objects.filter(chat_id=chat_id)
+        if message_id is None:
+            message_id = messages.order_by('-id').values_list('id', flat=True).first()
+            if message_id is None:
+                return None
+        elif not messages.filter(id=message_id).exists():
+            raise Message.DoesNotExist(f'Message {message_id} is not in chat {chat_id}.')
+        # Only the messages past the new watermark are counted, normally none
+        still_unread = messages.filter(id__gt=message_id).exclude(author=user).order_by().values('chat_id').annotate(
+            n=Count('id')
+        ).values('n')
+        updated = cls.objects.filter(chat_id=chat_id, user=user, last_read_message_id__lt=message_id).update(
+            last_read_message_id=message_id,
+            unread_count=Coalesce(Subquery(still_unread), Value(0)),
+        )
+        return message_id if updated else None
+
+    @classmethod
+    def watermarks(cls, chat_id):
+        return dict(cls.objects.filter(chat_id=chat_id).values_list('user_id', 'last_read_message_id'))
+
+
+@receiver(m2m_changed, sender=Chat.participants.through)
+def create_read_states(sender, instance, action, pk_set, reverse, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        states = [ChatReadState(chat_id=chat_id, user=instance) for chat_id in pk_set]
+    else:
+        states = [ChatReadState(chat=instance, user_id=user_id) for user_id in pk_set]
+    ChatReadState.objects.bulk_create(states, ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    if created:
+        ChatReadState.objects.filter(chat_id=instance.chat_id).exclude(user_id=instance.author_id).update(
+            unread_count=F('unread_count') + 1
+        )
+        from .events import broadcast_message
+        transaction.on_commit(lambda: broadcast_message(instance))
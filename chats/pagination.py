@@ -0,0 +1,70 @@
+# chats/pagination.py
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+class MessageCursorPagination:
+    """
+    Keyset pagination over (timestamp, id), backed by the (chat, timestamp, id) index.
+
+    ?before=<cursor> pages back through older messages, ?after=<cursor> fetches
+    what came in since the last page. Without a cursor the latest messages are
+    returned. Results are always in chronological order.
+    """
+    default_limit = 50
+    max_limit = 200
+
+    def encode_cursor(self, message):
+        raw = f'{message.timestamp.isoformat()}|{message.id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            timestamp, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            timestamp = parse_datetime(timestamp)
+            message_id = int(message_id)
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            timestamp = None
+        if timestamp is None:
+            raise ValidationError({'cursor': 'Invalid cursor.'})
+        return timestamp, message_id
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def paginate_queryset(self, queryset, request):
+        limit = self.get_limit(request)
+        after = request.query_params.get('after')
+        before = request.query_params.get('before')
+
+        if after:
+            timestamp, message_id = self.decode_cursor(after)
+            queryset = queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+            ).order_by('timestamp', 'id')
+            messages = list(queryset[:limit + 1])
+            self.has_more = len(messages) > limit
+            return messages[:limit]
+
+        if before:
+            timestamp, message_id = self.decode_cursor(before)
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+        messages = list(queryset.order_by('-timestamp', '-id')[:limit + 1])
+        self.has_more = len(messages) > limit
+        return messages[:limit][::-1]
+
+    def get_paginated_data(self, messages, data):
+        return {
+            'results': data,
+            'has_more': self.has_more,
+            'before': self.encode_cursor(messages[0]) if messages else None,
+            'after': self.encode_cursor(messages[-1]) if messages else None,
+        }
@@ -1,18 +1,53 @@
 from rest_framework import serializers
-from .models import Chat, Message
+from .models import Chat, Message, PREVIEW_LENGTH
 
 class MessageSerializer(serializers.ModelSerializer):
+    is_read = serializers.SerializerMethodField()
+
     class Meta:
         model = Message
         fields = '__all__'
+        read_only_fields = ['chat', 'author']
+
+    def get_is_read(self, obj):
+        # Read once another participant's watermark (ChatReadState.watermarks) has passed it
+        watermarks = self.context.get('read_watermarks', {})
+        return any(last_read >= obj.id for user_id, last_read in watermarks.items() if user_id != obj.author_id)
+
+class MessagePreviewSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ['id', 'author', 'content', 'timestamp']
+
+    def to_representation(self, instance):
+        response = super().to_representation(instance)
+        response['content'] = response['content'][:PREVIEW_LENGTH]
+        return response
+
 
 class ChatSerializer(serializers.ModelSerializer):
-    messages = MessageSerializer(many=True, read_only=True)
     participant_usernames = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
 
     class Meta:
         model = Chat
-        fields = ['id', 'participant_usernames', 'messages']  # Include 'participant_usernames' here
+        fields = ['id', 'participant_usernames', 'last_message']  # Include 'participant_usernames' here
+
+    def get_last_message(self, obj):
+        # Only a preview, the history itself is paged through ChatDetailView
+        if hasattr(obj, 'last_message_pk'):
+            # Annotated by Chat.objects.inbox_for
+            if obj.last_message_pk is None:
+                return None
+            message = Message(
+                id=obj.last_message_pk,
+                author_id=obj.last_message_author_id,
+                content=obj.last_message_content,
+                timestamp=obj.last_message_timestamp,
+            )
+        else:
+            message = obj.messages.order_by('-timestamp', '-id').first()
+        return MessagePreviewSerializer(message).data if message else None
 
     def get_participant_usernames(self, obj):
         try:
@@ -1,3 +1,360 @@
-from django.test import TestCase
+import base64
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import CustomUser
+from .events import broadcast_message, group_name
+from .middleware import JWTAuthMiddleware
+from .models import Chat, ChatReadState, Message
+from .routing import websocket_urlpatterns
+
+
+class ChatTestCase(TestCase):
+    def setUp(self):
+        self.client_user = CustomUser.objects.create_user(username='chatclient', password='x', role='client')
+        self.freelancer = CustomUser.objects.create_user(username='chatfreelancer', password='x', role='freelancer')
+        self.chat, _ = Chat.get_or_create_with_participants(self.client_user, self.freelancer)
+
+    def send(self, author, content='hello'):
+        return Message.objects.create(chat=self.chat, author=author, content=content)
+
+
+class BroadcastTests(ChatTestCase):
+    def receive_broadcast(self, message):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(group_name(self.chat.id), channel)
+        broadcast_message(message)
+        return async_to_sync(layer.receive)(channel)
+
+    def test_pushed_message_carries_read_state(self):
+        message = self.send(self.client_user)
+        self.assertFalse(self.receive_broadcast(message)['message']['is_read'])
+        ChatReadState.mark_read(self.chat.id, self.freelancer)
+        self.assertTrue(self.receive_broadcast(message)['message']['is_read'])
+
+
+class ChatConsumerTests(TransactionTestCase):
+    """
+    Over the in-memory channel layer. A TransactionTestCase, as the consumer's
+    database_sync_to_async calls close the connection a TestCase keeps in a
+    transaction, and the post_save broadcast waits for a commit.
+    """
+    application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def setUp(self):
+        self.client_user = CustomUser.objects.create_user(username='wsclient', password='x', role='client')
+        self.freelancer = CustomUser.objects.create_user(username='wsfreelancer', password='x', role='freelancer')
+        self.chat, _ = Chat.get_or_create_with_participants(self.client_user, self.freelancer)
+
+    def socket(self, user=None, token=None, query=''):
+        if user is not None:
+            token = str(AccessToken.for_user(user))
+        if token is not None:
+            query = f'token={token}&{query}'
+        return WebsocketCommunicator(self.application, f'/ws/chats/{self.chat.id}/?{query}')
+
+    async def connect(self, user, query=''):
+        socket = self.socket(user, query=query)
+        connected, _ = await socket.connect()
+        self.assertTrue(connected)
+        return socket
+
+    async def test_needs_a_valid_token(self):
+        for socket in (self.socket(), self.socket(token='not-a-jwt')):
+            self.assertEqual(await socket.connect(), (False, 4403))
+
+    async def test_outsider_is_closed(self):
+        outsider = await database_sync_to_async(CustomUser.objects.create_user)(
+            username='wsoutsider', password='x', role='freelancer'
+        )
+        self.assertEqual(await self.socket(outsider).connect(), (False, 4403))
+
+    async def test_reconnect_catches_up_after_the_last_seen_message(self):
+        create = database_sync_to_async(Message.objects.create)
+        seen = await create(chat=self.chat, author=self.client_user, content='seen')
+        for content in ('missed 1', 'missed 2'):
+            await create(chat=self.chat, author=self.client_user, content=content)
+        socket = await self.connect(self.freelancer, query=f'after={seen.id}')
+        for content in ('missed 1', 'missed 2'):
+            self.assertEqual((await socket.receive_json_from())['message']['content'], content)
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    async def test_message_is_pushed_to_both_participants(self):
+        sender = await self.connect(self.client_user)
+        receiver = await self.connect(self.freelancer)
+        await sender.send_json_to({'type': 'message', 'content': 'hello'})
+        for socket in (sender, receiver):
+            event = await socket.receive_json_from()
+            self.assertEqual((event['type'], event['message']['content']), ('message', 'hello'))
+        await sender.send_json_to({'type': 'message', 'content': ''})
+        self.assertEqual((await sender.receive_json_from())['type'], 'error')
+        for socket in (sender, receiver):
+            await socket.disconnect()
+
+    async def test_typing_is_not_echoed_to_the_typist(self):
+        typist = await self.connect(self.client_user)
+        other = await self.connect(self.freelancer)
+        await typist.send_json_to({'type': 'typing', 'is_typing': True})
+        self.assertEqual(await other.receive_json_from(),
+                         {'type': 'typing', 'user': self.client_user.id, 'is_typing': True})
+        self.assertTrue(await typist.receive_nothing())
+        for socket in (typist, other):
+            await socket.disconnect()
+
+    async def test_read_receipt(self):
+        message = await database_sync_to_async(Message.objects.create)(
+            chat=self.chat, author=self.client_user, content='hello'
+        )
+        author = await self.connect(self.client_user)
+        reader = await self.connect(self.freelancer)
+        await reader.send_json_to({'type': 'read', 'message_id': message.id})
+        self.assertEqual(await author.receive_json_from(),
+                         {'type': 'read', 'user': self.freelancer.id, 'message_id': message.id})
+        state = await database_sync_to_async(ChatReadState.objects.get)(chat=self.chat, user=self.freelancer)
+        self.assertEqual(state.last_read_message_id, message.id)
+        for socket in (author, reader):
+            await socket.disconnect()
+
+
+class ChatAccessTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.send(self.client_user, 'private')
+        self.outsider = CustomUser.objects.create_user(username='chatoutsider', password='x', role='freelancer')
+
+    def api(self, user=None):
+        api = APIClient()
+        if user:
+            api.force_authenticate(user)
+        return api
+
+    def test_history_needs_a_participant(self):
+        url = f'/api/chats/{self.chat.id}/'
+        self.assertEqual(self.api().get(url).status_code, 401)
+        self.assertEqual(self.api(self.outsider).get(url).status_code, 404)
+        response = self.api(self.freelancer).get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['content'] for m in response.data['messages']['results']], ['private'])
+
+    def test_only_participants_send(self):
+        for url in (f'/api/chats/{self.chat.id}/', f'/api/chats/{self.chat.id}/send/'):
+            self.assertEqual(self.api().post(url, {'content': 'hi'}).status_code, 401)
+            self.assertEqual(self.api(self.outsider).post(url, {'content': 'hi'}).status_code, 404)
+            self.assertEqual(self.api(self.freelancer).post(url, {'content': 'hi'}).status_code, 201)
+        self.assertEqual(self.chat.messages.count(), 3)
+
+    def test_only_participants_delete(self):
+        url = f'/api/chats/{self.chat.id}/'
+        self.assertEqual(self.api(self.outsider).delete(url).status_code, 404)
+        self.assertEqual(self.api(self.client_user).delete(url).status_code, 204)
+        self.assertFalse(Chat.objects.filter(id=self.chat.id).exists())
+
+
+class InboxTests(ChatTestCase):
+    def inbox(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        response = api.get('/api/chats/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_unread_counts_and_last_message(self):
+        other = CustomUser.objects.create_user(username='chatclient2', password='x', role='client')
+        other_chat, _ = Chat.get_or_create_with_participants(other, self.freelancer)
+        self.send(self.client_user, 'first')
+        self.send(self.freelancer, 'mine')
+        self.send(self.client_user, 'x' * 150)
+        Message.objects.create(chat=other_chat, author=other, content='older')
+        ChatReadState.mark_read(other_chat.id, self.freelancer)
+
+        inbox = self.inbox(self.freelancer)
+        self.assertEqual([chat['id'] for chat in inbox], [other_chat.id, self.chat.id])
+        self.assertEqual([chat['unread_messages'] for chat in inbox], [0, 2])
+        last = inbox[1]['last_message']
+        self.assertEqual((last['author'], last['content']), (self.client_user.id, 'x' * 100))
+        self.assertEqual(self.inbox(self.client_user)[0]['unread_messages'], 1)
+
+    def test_query_count_does_not_grow_with_the_chats(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.inbox(self.freelancer)
+        for i in range(4):
+            client = CustomUser.objects.create_user(username=f'inboxclient{i}', password='x', role='client')
+            chat, _ = Chat.get_or_create_with_participants(client, self.freelancer)
+            for _ in range(3):
+                Message.objects.create(chat=chat, author=client, content='hi')
+        with self.assertNumQueries(len(queries)):
+            inbox = self.inbox(self.freelancer)
+        self.assertEqual([chat['unread_messages'] for chat in inbox], [3, 3, 3, 3, 0])
+
+
+class MessagePaginationTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.messages = [self.send(self.client_user, f'm{i}').id for i in range(1, 6)]
+        # The id breaks the tie between messages of the same timestamp
+        self.chat.messages.update(timestamp=self.chat.messages.first().timestamp)
+
+    def page(self, **params):
+        api = APIClient()
+        api.force_authenticate(self.freelancer)
+        response = api.get(f'/api/chats/{self.chat.id}/', {'limit': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        page = response.data['messages']
+        return [m['id'] for m in page['results']], page['has_more'], page
+
+    def test_before_pages_back_to_the_first_message(self):
+        ids, has_more, page = self.page()
+        self.assertEqual((ids, has_more), (self.messages[3:], True))
+        ids, has_more, page = self.page(before=page['before'])
+        self.assertEqual((ids, has_more), (self.messages[1:3], True))
+        ids, has_more, page = self.page(before=page['before'])
+        self.assertEqual((ids, has_more), (self.messages[:1], False))
+
+    def test_after_fetches_what_came_in_since(self):
+        ids, has_more, page = self.page()
+        self.assertEqual(self.page(after=page['after'])[:2], ([], False))
+        new = [self.send(self.client_user, f'n{i}').id for i in range(3)]
+        ids, has_more, page = self.page(after=page['after'])
+        self.assertEqual((ids, has_more), (new[:2], True))
+        ids, has_more, page = self.page(after=page['after'])
+        self.assertEqual((ids, has_more), (new[2:], False))
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        api = APIClient()
+        api.force_authenticate(self.freelancer)
+        for cursor in ('garbage', 'bm90LWEtZGF0ZXwx', base64.urlsafe_b64encode(b'2024-01-01T00:00:00|x').decode()):
+            for param in ('before', 'after'):
+                response = api.get(f'/api/chats/{self.chat.id}/', {param: cursor})
+                self.assertEqual(response.status_code, 400, (param, cursor))
+                self.assertIn('cursor', response.data)
+
+
+class MarkReadTests(ChatTestCase):
+    def mark_read(self, user, **data):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api.post(f'/api/chats/{self.chat.id}/read/', data, format='json')
+
+    def state(self, user):
+        return ChatReadState.objects.get(chat=self.chat, user=user)
+
+    def test_watermark_cannot_pass_the_chat_messages(self):
+        message = self.send(self.client_user)
+        other_chat, _ = Chat.get_or_create_with_participants(
+            self.client_user, CustomUser.objects.create_user(username='chatfreelancer2', password='x')
+        )
+        foreign = Message.objects.create(chat=other_chat, author=self.client_user, content='elsewhere')
+        for message_id in (1000000000000, foreign.id):
+            self.assertEqual(self.mark_read(self.freelancer, message_id=message_id).status_code, 400)
+        self.assertEqual(self.state(self.freelancer).last_read_message_id, 0)
+
+        self.assertEqual(self.mark_read(self.freelancer, message_id=message.id).status_code, 200)
+        self.send(self.client_user)
+        state = self.state(self.freelancer)
+        self.assertEqual((state.last_read_message_id, state.unread_count), (message.id, 1))
+        self.mark_read(self.freelancer)
+        self.assertEqual(self.state(self.freelancer).unread_count, 0)
+
+
+class ParticipantPairTests(ChatTestCase):
+    def test_reversed_pair_reuses_the_chat(self):
+        chat, created = Chat.get_or_create_with_participants(self.freelancer, self.client_user)
+        self.assertEqual((chat, created), (self.chat, False))
+        self.assertEqual(Chat.objects.filter(participants=self.client_user).count(), 1)
+
+
+class MigrationTestCase(TransactionTestCase):
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+
+class ReadWatermarkMigrationTests(MigrationTestCase):
+    """
+    chats.0009 turns the is_read flags into a watermark per participant.
+    """
+    before = [('chats', '0008_chatreadstate')]
+    after = [('chats', '0009_chatreadstate_watermark')]
+
+    def test_watermark_is_the_last_message_read(self):
+        apps = self.migrate(self.before)
+        Chat = apps.get_model('chats', 'Chat')
+        Message = apps.get_model('chats', 'Message')
+        ChatReadState = apps.get_model('chats', 'ChatReadState')
+        client, freelancer = [
+            CustomUser.objects.create_user(username=f'watermark-user-{i}', password='x') for i in range(2)
+        ]
+        chat, other_chat = Chat.objects.create(), Chat.objects.create()
+        for each in (chat, other_chat):
+            each.participants.add(client.pk, freelancer.pk)
+            ChatReadState.objects.bulk_create([ChatReadState(chat=each, user_id=client.pk),
+                                               ChatReadState(chat=each, user_id=freelancer.pk)])
+        read = Message.objects.create(chat=chat, author_id=client.pk, content='read', is_read=True)
+        # Between the chat's messages, so the id right before the first unread one is not in the chat
+        elsewhere = Message.objects.create(chat=other_chat, author_id=client.pk, content='elsewhere', is_read=True)
+        unread = Message.objects.create(chat=chat, author_id=client.pk, content='unread')
+
+        apps = self.migrate(self.after)
+        states = apps.get_model('chats', 'ChatReadState').objects.values_list(
+            'chat_id', 'user_id', 'last_read_message_id', 'unread_count'
+        )
+        self.assertEqual(set(states), {
+            (chat.pk, client.pk, unread.pk, 0), (chat.pk, freelancer.pk, read.pk, 1),
+            (other_chat.pk, client.pk, elsewhere.pk, 0), (other_chat.pk, freelancer.pk, elsewhere.pk, 0),
+        })
+
+
+class CollapseDuplicateChatsMigrationTests(MigrationTestCase):
+    """
+    chats.0011 folds the chats a participant pair picked up before the pair was
+    unique into the oldest one.
+    """
+    before = [('chats', '0010_chat_participant_key')]
+    after = [('chats', '0011_collapse_duplicate_chats')]
+
+    def test_duplicates_are_merged_into_the_oldest_chat(self):
+        apps = self.migrate(self.before)
+        Chat = apps.get_model('chats', 'Chat')
+        Message = apps.get_model('chats', 'Message')
+        ChatReadState = apps.get_model('chats', 'ChatReadState')
+        client, freelancer, other = [
+            CustomUser.objects.create_user(username=f'collapse-user-{i}', password='x') for i in range(3)
+        ]
+        chats = []
+        for first, second in ((client, freelancer), (freelancer, client), (client, other)):
+            chat = Chat.objects.create()
+            chat.participants.add(first.pk, second.pk)
+            ChatReadState.objects.bulk_create([ChatReadState(chat=chat, user_id=first.pk),
+                                               ChatReadState(chat=chat, user_id=second.pk)])
+            chats.append(chat)
+        read = Message.objects.create(chat=chats[0], author_id=client.pk, content='read')
+        Message.objects.create(chat=chats[1], author_id=client.pk, content='unread')
+        ChatReadState.objects.filter(chat=chats[0], user_id=freelancer.pk).update(last_read_message_id=read.pk)
+
+        apps = self.migrate(self.after)
+        Chat = apps.get_model('chats', 'Chat')
+        self.assertEqual(sorted(Chat.objects.values_list('id', 'participant_key')), [
+            (chats[0].pk, f'{client.pk}:{freelancer.pk}'), (chats[2].pk, f'{client.pk}:{other.pk}'),
+        ])
+        messages = apps.get_model('chats', 'Message').objects.filter(chat_id=chats[0].pk)
+        self.assertEqual(sorted(messages.values_list('content', flat=True)), ['read', 'unread'])
+        # The lower watermark wins, so the merged chat's unread message stays unread
+        state = apps.get_model('chats', 'ChatReadState').objects.get(chat_id=chats[0].pk, user_id=freelancer.pk)
+        self.assertEqual((state.last_read_message_id, state.unread_count), (0, 2))
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import ChatListView, ChatCreateView, ChatDetailView, SendMessageView, StartChatView
+from .views import ChatListView, ChatCreateView, ChatDetailView, SendMessageView, StartChatView, MarkAsReadView
 from . import views
 
 app_name = 'chat'
@@ -9,5 +9,6 @@ urlpatterns = [
     path('chats/<int:chat_id>/', ChatDetailView.as_view(), name='chat_detail'),
     path('start-chat/<str:username>/', StartChatView.as_view(), name='start_chat'),
     path('chats/<int:chat_id>/send/', SendMessageView.as_view(), name='send_message'),
+    path('chats/<int:chat_id>/read/', MarkAsReadView.as_view(), name='mark_as_read'),
 
 ]
@@ -2,8 +2,10 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import ChatSerializer
-from .models import Chat
+from .serializers import ChatSerializer, MessageSerializer
+from .events import broadcast_read
+from .models import Chat, ChatReadState, Message
+from .pagination import MessageCursorPagination
 from accounts.models import CustomUser
 import logging
 
@@ -16,9 +18,9 @@ class StartChatView(APIView):
             logger.debug(f'Request User Role: {request.user.role}, Client Role: {client.role}')
 
             if request.user.role == 'freelancer' and client.role == 'client':
-                chat = Chat.get_or_create_with_participants(request.user, client)
+                chat, created = Chat.get_or_create_with_participants(request.user, client)
                 serializer = ChatSerializer(chat)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+                return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
             else:
                 logger.debug('Role condition failed')
                 return Response({'error': 'Invalid user roles or user not found'}, status=status.HTTP_400_BAD_REQUEST)
@@ -35,31 +37,38 @@ class ChatListView(APIView):
 
 
     def get(self, request):
-        chats = request.user.chats.all()
-        chat_list = []
-        for chat in chats:
-            # Correctly filter messages that are unread and not authored by the request user
-            unread_count = chat.messages.exclude(author=request.user).filter(is_read=False).count()
-            chat_data = ChatSerializer(chat).data
-            chat_data['unread_messages'] = unread_count
-            chat_list.append(chat_data)
+        chats = list(Chat.objects.inbox_for(request.user))
+        chat_list = ChatSerializer(chats, many=True).data
+        for chat, chat_data in zip(chats, chat_list):
+            chat_data['unread_messages'] = chat.unread_messages
         return Response(chat_list)
 
 
 
 
 
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticated
+
+
+def get_participant_chat(request, chat_id):
+    # Other people's chats answer 404, as if they did not exist
+    return get_object_or_404(Chat, id=chat_id, participants=request.user)
+
+
 class ChatDetailView(APIView):
-    permission_classes = [IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAuthenticated]
 
     def get(self, request, chat_id):
-        chat = get_object_or_404(Chat, id=chat_id)
-        serializer = ChatSerializer(chat)
-        return Response(serializer.data)
+        chat = get_participant_chat(request, chat_id)
+        paginator = MessageCursorPagination()
+        messages = paginator.paginate_queryset(chat.messages.all(), request)
+        data = ChatSerializer(chat).data
+        serializer = MessageSerializer(messages, many=True, context={'read_watermarks': ChatReadState.watermarks(chat.id)})
+        data['messages'] = paginator.get_paginated_data(messages, serializer.data)
+        return Response(data)
 
     def post(self, request, chat_id):
-        chat = get_object_or_404(Chat, id=chat_id)
+        chat = get_participant_chat(request, chat_id)
         serializer = MessageSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(author=request.user, chat=chat)
@@ -67,36 +76,27 @@ class ChatDetailView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, chat_id):
-        chat = get_object_or_404(Chat, id=chat_id)
-        # Check if the request.user is in chat participants
-        if request.user in chat.participants.all():
-            chat.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        else:
-            return Response({"error": "You do not have permission to delete this chat."},
-                            status=status.HTTP_403_FORBIDDEN)
+        get_participant_chat(request, chat_id).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 class ChatCreateView(APIView):
     def post(self, request, username):
         client = get_object_or_404(CustomUser, username=username)
         if request.user.role == 'client' and client.role == 'freelancer':
             # Use get_or_create_with_participants class method to handle chat creation
-            chat = Chat.get_or_create_with_participants(request.user, client)
+            chat, created = Chat.get_or_create_with_participants(request.user, client)
             serializer = ChatSerializer(chat)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
         else:
             return Response({'error': 'Invalid user roles or user not found'}, status=status.HTTP_400_BAD_REQUEST)
 
 
 
-from rest_framework.permissions import IsAuthenticated
-
-from .serializers import MessageSerializer
 class SendMessageView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, chat_id):
-        chat = get_object_or_404(Chat, pk=chat_id)
+        chat = get_participant_chat(request, chat_id)
         serializer = MessageSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(author=request.user, chat=chat)
@@ -108,5 +108,17 @@ class MarkAsReadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, chat_id):
-        Chat.objects.filter(id=chat_id, participants=request.user).update(messages__is_read=True)
+        chat = get_participant_chat(request, chat_id)
+        message_id = request.data.get('message_id')
+        if message_id is not None and not str(message_id).isdigit():
+            return Response({'message_id': 'Must be a message id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            last_read = ChatReadState.mark_read(
+                chat.id, request.user, int(message_id) if message_id is not None else None
+            )
+        except Message.DoesNotExist:
+            return Response({'message_id': 'Not a message of this chat.'}, status=status.HTTP_400_BAD_REQUEST)
+        if last_read is not None:
+            broadcast_read(chat.id, request.user.id, last_read)
         return Response({"message": "Messages marked as read."}, status=status.HTTP_200_OK)
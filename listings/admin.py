@@ -1,4 +1,21 @@
 from django.contrib import admin
-from .models import Listing
+from django.utils import timezone
+from .models import Listing, OrderSyncEvent, RecommendationRun
 # Register your models here.
-admin.site.register(Listing)
\ No newline at end of file
+admin.site.register(Listing)
+
+
+@admin.register(OrderSyncEvent)
+class OrderSyncEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'listing', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status']
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected events')
+    def requeue(self, request, queryset):
+        queryset.update(status='pending', attempts=0, next_attempt_at=timezone.now())
+
+
+@admin.register(RecommendationRun)
+class RecommendationRunAdmin(admin.ModelAdmin):
+    list_display = ['id', 'full', 'started_at', 'finished_at', 'freelancers', 'clients']
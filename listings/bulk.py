@@ -0,0 +1,189 @@
+# listings/bulk.py
+"""
+Bulk import and streaming export of listings, as NDJSON or CSV.
+
+An import inserts each batch with bulk_create: listings, their skill rows and
+their sync events in one INSERT each, with skills and slugs resolved for the
+whole batch. bulk_create sends no signals, so each batch then does what the
+Listing signals do per listing: search index, facet counts, skill postings and
+cached responses.
+
+An export walks the listings in chunks over a server-side cursor where the
+database has one, so memory use does not grow with the number of listings.
+"""
+import codecs
+import csv
+import json
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from accounts.skills import resolve_skill_ids
+from backend import response_cache
+from .facets import adjust_facet_counts, bucket_index
+from .matching import LISTING_SKILLS
+from .models import Listing, ListingSkill, OrderSyncEvent
+from .search import index_listings
+from .serializers import ListingImportSerializer
+
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# Skills share one CSV column
+CSV_SKILL_SEPARATOR = ';'
+EXPORT_FIELDS = ['id', 'slug', 'title', 'description', 'price', 'status', 'skills', 'client', 'freelancer',
+                 'created_at', 'updated_at']
+# Errors listed in an import report; all of them are counted
+MAX_REPORTED_ERRORS = 100
+
+ImportResult = namedtuple('ImportResult', ['created', 'error_count', 'errors'])
+
+
+def decode_lines(lines, undecodable):
+    """
+    Lines of UTF-8 bytes as text, up to the first one that does not decode,
+    whose number is appended to undecodable.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    for number, line in enumerate(lines, start=1):
+        try:
+            yield decoder.decode(line)
+        except UnicodeDecodeError:
+            undecodable.append(number)
+            return
+
+
+def read_rows(lines, file_format):
+    """
+    Yields (line number, row, error) from lines of UTF-8 bytes, with either the
+    row or the error set. Reading stops at a line that is not UTF-8, which is
+    reported as the last error.
+    """
+    undecodable = []
+    lines = decode_lines(lines, undecodable)
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            skills = row.get('skills') or ''
+            row['skills'] = [name.strip() for name in skills.split(CSV_SKILL_SEPARATOR) if name.strip()]
+            yield reader.line_num, row, None
+    else:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, None, {'non_field_errors': [f'Invalid JSON: {e}']}
+                continue
+            if isinstance(row, dict):
+                yield number, row, None
+            else:
+                yield number, None, {'non_field_errors': ['Expected a JSON object.']}
+    if undecodable:
+        yield undecodable[0], None, {'non_field_errors': ['Not UTF-8; this line and the rest were not read.']}
+
+
+def import_listings(user, rows, batch_size=None):
+    """
+    Creates listings owned by user from the rows of read_rows(). Invalid rows
+    are skipped and reported. Every batch commits on its own.
+    """
+    batch_size = batch_size or settings.LISTING_IMPORT_BATCH_SIZE
+    created = error_count = 0
+    errors = []
+    batch = []
+    for line, row, error in rows:
+        if error is None:
+            serializer = ListingImportSerializer(data=row)
+            if serializer.is_valid():
+                batch.append(serializer.validated_data)
+            else:
+                error = serializer.errors
+        if error is not None:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line, 'errors': error})
+        if len(batch) >= batch_size:
+            created += insert_batch(user, batch)
+            batch = []
+    if batch:
+        created += insert_batch(user, batch)
+    return ImportResult(created, error_count, errors)
+
+
+def insert_batch(user, rows):
+    skill_ids = resolve_skill_ids(name for row in rows for name in row['skills'])
+    slugs = Listing.objects.unique_slugs([row['title'] for row in rows])
+    listings = [
+        Listing(user=user, slug=slug, title=row['title'], description=row['description'], price=row['price'],
+                status=row['status'])
+        for row, slug in zip(rows, slugs)
+    ]
+    with transaction.atomic():
+        Listing.objects.bulk_create(listings)
+        skill_rows = [
+            ListingSkill(listing_id=listing.pk, skill_id=skill_ids[name])
+            for listing, row in zip(listings, rows)
+            for name in dict.fromkeys(row['skills'])
+        ]
+        ListingSkill.objects.bulk_create(skill_rows)
+        OrderSyncEvent.objects.bulk_create([OrderSyncEvent(listing=listing) for listing in listings])
+
+        # What the post_save and m2m_changed receivers would have done
+        index_listings([listing.pk for listing in listings])
+        deltas = Counter()
+        buckets = {listing.pk: bucket_index(listing.price) for listing in listings if listing.status == 'open'}
+        buckets = {pk: bucket for pk, bucket in buckets.items() if bucket is not None}
+        for bucket in buckets.values():
+            deltas[None, bucket] += 1
+        for skill_row in skill_rows:
+            if skill_row.listing_id in buckets:
+                deltas[skill_row.skill_id, buckets[skill_row.listing_id]] += 1
+        adjust_facet_counts(deltas)
+        changed_skills = {skill_row.skill_id for skill_row in skill_rows}
+        transaction.on_commit(lambda: LISTING_SKILLS.invalidate(changed_skills))
+        response_cache.bump('listings')
+    return len(listings)
+
+
+def export_rows(queryset, chunk_size=None):
+    queryset = queryset.select_related('user', 'freelancer').prefetch_related('skills').order_by('pk')
+    for listing in queryset.iterator(chunk_size=chunk_size or settings.LISTING_EXPORT_CHUNK_SIZE):
+        yield {
+            'id': listing.pk,
+            'slug': listing.slug,
+            'title': listing.title,
+            'description': listing.description,
+            'price': listing.price,
+            'status': listing.status,
+            'skills': [skill.name for skill in listing.skills.all()],
+            'client': listing.user.username,
+            'freelancer': listing.freelancer.username if listing.freelancer else None,
+            'created_at': listing.created_at,
+            'updated_at': listing.updated_at,
+        }
+
+
+class EchoBuffer:
+    """
+    Hands what csv.writer writes straight back, one row at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def render_rows(rows, file_format):
+    """
+    Yields the rows as lines of NDJSON or CSV, header first.
+    """
+    if file_format == 'csv':
+        writer = csv.DictWriter(EchoBuffer(), EXPORT_FIELDS)
+        yield writer.writeheader()
+        for row in rows:
+            row['skills'] = CSV_SKILL_SEPARATOR.join(row['skills'])
+            yield writer.writerow(row)
+        return
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
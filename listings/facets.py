@@ -0,0 +1,296 @@
+# listings/facets.py
+"""
+Filters of the open listings browser and the facet counts shown next to them.
+
+Skill filters are semi-joins on the skills table, so they need no DISTINCT and
+keyset pagination keeps reading listings in id order. Facets are disjunctive:
+each one is counted with every filter except its own, so picking a price
+bucket does not hide the others.
+
+When skills and price buckets are the only filters, the facets are read from
+ListingFacetCount, open listings counted per skill and price bucket and kept up
+to date by the signals in listings/models.py; the price buckets then allow for
+at most one skill. Anything else is counted on the listings: the skills in one
+grouped query, the total and the price buckets in one aggregate.
+"""
+from bisect import bisect_right
+from collections import Counter, namedtuple
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from accounts.skills import resolve_skill_ids
+from .models import OPEN, Listing, ListingFacetCount, ListingSkill
+
+PriceBucket = namedtuple('PriceBucket', ['key', 'low', 'high'])
+
+
+def price_buckets():
+    """
+    Buckets between the bounds of LISTING_PRICE_BUCKETS, low included; the last
+    one is open-ended. Keys look like '50-100' and '5000-'.
+    """
+    bounds = settings.LISTING_PRICE_BUCKETS
+    return [
+        PriceBucket(f"{low}-{'' if high is None else high}", low, high)
+        for low, high in zip(bounds, [*bounds[1:], None])
+    ]
+
+
+def bucket_q(bucket, field='price'):
+    q = Q(**{f'{field}__gte': bucket.low})
+    return q if bucket.high is None else q & Q(**{f'{field}__lt': bucket.high})
+
+
+def bucket_index(price):
+    """
+    Position of the bucket of a price in price_buckets(), None below the first.
+    """
+    index = bisect_right(settings.LISTING_PRICE_BUCKETS, Decimal(str(price))) - 1
+    return index if index >= 0 else None
+
+
+def open_bucket(listing):
+    if listing.status == 'open' and listing.freelancer_id is None:
+        return bucket_index(listing.price)
+    return None
+
+
+class ListingFilters:
+    """
+    Query parameters:
+      skills          skill name, repeatable
+      skills_mode     'any' (default) or 'all' of the given skills
+      price           price bucket key, repeatable, any of them
+      min_price       max_price
+      created_after   created_before, dates or datetimes, both included
+      client          username of the listing's owner
+    """
+    SKILLS_MODES = ('any', 'all')
+
+    def __init__(self, params):
+        self.skill_names = [name for name in params.getlist('skills') if name]
+        self.skills_mode = params.get('skills_mode') or 'any'
+        if self.skills_mode not in self.SKILLS_MODES:
+            raise ValidationError({'skills_mode': f"Must be one of {', '.join(self.SKILLS_MODES)}."})
+        buckets = {bucket.key: bucket for bucket in price_buckets()}
+        unknown = [key for key in params.getlist('price') if key not in buckets]
+        if unknown:
+            raise ValidationError({'price': f"Unknown price buckets: {', '.join(unknown)}."})
+        self.buckets = [buckets[key] for key in dict.fromkeys(params.getlist('price'))]
+        self.min_price = self.parse_price(params, 'min_price')
+        self.max_price = self.parse_price(params, 'max_price')
+        self.created_q = self.parse_created(params, 'created_after') & self.parse_created(
+            params, 'created_before', before=True
+        )
+        self.client = params.get('client') or None
+        self._skill_ids = None
+
+    @staticmethod
+    def parse_price(params, name):
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({name: 'A number is required.'})
+
+    @staticmethod
+    def parse_created(params, name, before=False):
+        """
+        Bound on created_at from a datetime or a date, both included. Dates
+        become a range on the column itself, which keeps its index usable.
+        """
+        value = params.get(name)
+        if not value:
+            return Q()
+        try:
+            # parse_datetime() would also take a bare date, as midnight
+            day = parse_date(value)
+            moment = None if day else parse_datetime(value)
+        except ValueError:
+            moment = day = None
+        if moment is None and day is None:
+            raise ValidationError({name: 'A date or datetime in ISO 8601 format is required.'})
+        lookup = 'lte' if before else 'gte'
+        if day is not None:
+            if before:
+                day, lookup = day + timedelta(days=1), 'lt'
+            moment = datetime.combine(day, time.min)
+        if settings.USE_TZ and timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return Q(**{f'created_at__{lookup}': moment})
+
+    @property
+    def skill_ids(self):
+        if self._skill_ids is None:
+            self._skill_ids = list(resolve_skill_ids(self.skill_names, create=False).values())
+        return self._skill_ids
+
+    def skills_q(self):
+        if not self.skill_names:
+            return Q()
+        rows = ListingSkill.objects.filter(skill_id__in=self.skill_ids)
+        if self.skills_mode == 'all':
+            if len(self.skill_ids) < len(set(self.skill_names)):
+                # One of the skills does not exist
+                return Q(pk__in=[])
+            rows = rows.values('listing_id').annotate(matched=Count('skill_id')).filter(matched=len(self.skill_ids))
+        return Q(pk__in=rows.values('listing_id'))
+
+    def price_q(self):
+        q = Q()
+        if self.buckets:
+            buckets = Q()
+            for bucket in self.buckets:
+                buckets |= bucket_q(bucket)
+            q &= buckets
+        if self.min_price is not None:
+            q &= Q(price__gte=self.min_price)
+        if self.max_price is not None:
+            q &= Q(price__lte=self.max_price)
+        return q
+
+    def other_q(self):
+        q = self.created_q
+        if self.client:
+            q &= Q(user__username=self.client)
+        return q
+
+    @property
+    def only_facets(self):
+        """
+        Whether skills and price buckets are the only filters, which
+        ListingFacetCount can count.
+        """
+        return self.min_price is None and self.max_price is None and not self.created_q and not self.client
+
+    def apply(self, queryset, skip=None):
+        """
+        skip leaves out the filters of one facet, 'skills' or 'price'.
+        """
+        if skip != 'skills':
+            queryset = queryset.filter(self.skills_q())
+        if skip != 'price':
+            queryset = queryset.filter(self.price_q())
+        return queryset.filter(self.other_q())
+
+
+def facet_counts(filters):
+    """
+    Total of the filtered open listings, count per skill (top
+    LISTING_FACET_SKILLS) and count per price bucket.
+    """
+    total, per_bucket = price_facet(filters)
+    buckets = price_buckets()
+    return {
+        'count': total,
+        'skills': skill_facet(filters),
+        'price_buckets': [
+            {'key': bucket.key, 'min': bucket.low, 'max': bucket.high, 'count': per_bucket.get(i, 0)}
+            for i, bucket in enumerate(buckets)
+        ],
+    }
+
+
+def selected_buckets(filters):
+    buckets = price_buckets()
+    return [i for i, bucket in enumerate(buckets) if bucket in filters.buckets] or list(range(len(buckets)))
+
+
+def skill_facet(filters):
+    # With 'all', the skill counts narrow the current selection down instead
+    narrowing = filters.skills_mode == 'all' and filters.skill_names
+    if filters.only_facets and not narrowing:
+        rows = ListingFacetCount.objects.filter(
+            skill__isnull=False, bucket__in=selected_buckets(filters)
+        ).values('skill__name').annotate(total=Sum('count')).filter(total__gt=0)
+    else:
+        listings = filters.apply(Listing.objects.filter(OPEN), skip=None if narrowing else 'skills')
+        rows = ListingSkill.objects.filter(listing_id__in=listings.values('pk')).values('skill__name').annotate(
+            total=Count('listing_id')
+        )
+    rows = rows.order_by('-total', 'skill__name')
+    return [{'name': row['skill__name'], 'count': row['total']} for row in rows[:settings.LISTING_FACET_SKILLS]]
+
+
+def price_facet(filters):
+    """
+    (total, bucket position -> count), the buckets counted without the price
+    filters.
+    """
+    if filters.only_facets and len(filters.skill_names) <= 1 and len(filters.skill_ids) == len(filters.skill_names):
+        per_bucket = dict(ListingFacetCount.objects.filter(
+            skill=filters.skill_ids[0] if filters.skill_names else None
+        ).values_list('bucket', 'count'))
+        return sum(per_bucket.get(i, 0) for i in selected_buckets(filters)), per_bucket
+
+    buckets = price_buckets()
+    totals = filters.apply(Listing.objects.filter(OPEN), skip='price').aggregate(
+        total=Count('pk', filter=filters.price_q() or None),
+        **{f'bucket_{i}': Count('pk', filter=bucket_q(bucket)) for i, bucket in enumerate(buckets)},
+    )
+    return totals['total'], {i: totals[f'bucket_{i}'] for i in range(len(buckets))}
+
+
+def count_open_skill_rows(rows, sign):
+    """
+    Counter of (skill id, bucket) -> sign times the number of the given skill
+    rows whose listing is open.
+    """
+    counts = Counter()
+    for skill_id, price in rows.filter(listing__status='open', listing__freelancer__isnull=True).values_list(
+        'skill_id', 'listing__price'
+    ):
+        bucket = bucket_index(price)
+        if bucket is not None:
+            counts[skill_id, bucket] += sign
+    return counts
+
+
+def adjust_facet_counts(deltas):
+    """
+    Applies a Counter of (skill id or None, bucket) -> delta to ListingFacetCount.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ListingFacetCount.objects.bulk_create(
+        [ListingFacetCount(skill_id=skill_id, bucket=bucket) for skill_id, bucket in deltas], ignore_conflicts=True
+    )
+    # One UPDATE per distinct delta, nearly always just one
+    by_delta = {}
+    for (skill_id, bucket), delta in deltas.items():
+        by_delta.setdefault(delta, Q())
+        by_delta[delta] |= Q(skill_id=skill_id, bucket=bucket) if skill_id is not None else Q(skill__isnull=True, bucket=bucket)
+    for delta, rows in by_delta.items():
+        ListingFacetCount.objects.filter(rows).update(count=F('count') + delta)
+
+
+def rebuild_facet_counts():
+    """
+    Recounts ListingFacetCount from the listings.
+    """
+    def bucket_of(field):
+        return Case(*[When(bucket_q(bucket, field), then=Value(i)) for i, bucket in enumerate(price_buckets())],
+                    output_field=IntegerField())
+
+    totals = Listing.objects.filter(OPEN).annotate(bucket=bucket_of('price')).values('bucket').annotate(
+        n=Count('pk')
+    ).order_by()
+    per_skill = ListingSkill.objects.filter(
+        listing__status='open', listing__freelancer__isnull=True
+    ).annotate(bucket=bucket_of('listing__price')).values('skill_id', 'bucket').annotate(n=Count('pk')).order_by()
+    rows = [ListingFacetCount(skill_id=None, bucket=row['bucket'], count=row['n']) for row in totals]
+    rows += [ListingFacetCount(skill_id=row['skill_id'], bucket=row['bucket'], count=row['n']) for row in per_skill]
+    with transaction.atomic():
+        ListingFacetCount.objects.all().delete()
+        ListingFacetCount.objects.bulk_create([row for row in rows if row.bucket is not None], batch_size=1000)
+    return len(rows)
@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import CustomUser
+from listings.models import Listing
+from listings.search import LISTING_INDEX, build_documents, search_listings
+
+COMMON_WORDS = (
+    'python django react vue angular design logo website mobile android ios backend frontend api '
+    'database postgres mysql data analysis machine learning scraping bot telegram shop wordpress '
+    'seo marketing copywriting translation video editing animation game unity unreal blockchain '
+    'smart contract devops docker kubernetes cloud aws testing automation support landing page'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares full-text listing search with the old title icontains lookup on generated data. '
+        'Everything runs in a transaction that is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not LISTING_INDEX.is_supported():
+            raise CommandError('Full-text search is not available on this database.')
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            self.populate(rng, options['listings'])
+            queries = [' '.join(self.sample_words(rng, rng.choice([1, 1, 2]))) for _ in range(options['queries'])]
+            # Prefix matching is what a search-as-you-type box sends
+            queries += [word[:4] for word in rng.sample(COMMON_WORDS, 10)]
+            page_size = options['page_size']
+
+            def old_endpoint(query):
+                # What SearchListingsView used to do: every title match, unpaginated
+                return list(Listing.objects.filter(title__icontains=query))
+
+            def icontains_page(query):
+                # The same coverage as the full-text search with the old technique, one page plus a count
+                matches = Listing.objects.filter(Q(title__icontains=query) | Q(description__icontains=query))
+                return matches.count(), list(matches.order_by('-id')[:page_size])
+
+            def fulltext_page(query):
+                results = search_listings(query)
+                return len(results), list(results[:page_size])
+
+            self.stdout.write(f"{options['listings']} listings, {len(queries)} queries, page of {page_size}")
+            for name, run in (('title icontains, all rows', old_endpoint),
+                              ('icontains, one page', icontains_page),
+                              ('full-text, one page', fulltext_page)):
+                timings = self.time(queries, run)
+                self.stdout.write('{:<26} mean {:8.2f} ms  p95 {:8.2f} ms'.format(
+                    name, statistics.mean(timings), statistics.quantiles(timings, n=20)[-1]
+                ))
+            transaction.set_rollback(True)
+
+    def build_vocabulary(self, rng, size=5000):
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        self.vocabulary = list(COMMON_WORDS) + [
+            ''.join(rng.choices(letters, k=rng.randint(5, 10))) for _ in range(size)
+        ]
+        # Zipf-like frequencies, a few words are everywhere and most are rare
+        self.weights = [1 / rank for rank in range(1, len(self.vocabulary) + 1)]
+
+    def sample_words(self, rng, k):
+        return rng.choices(self.vocabulary, weights=self.weights, k=k)
+
+    def populate(self, rng, count, batch_size=5000):
+        self.build_vocabulary(rng)
+        user = CustomUser(username='benchmarkclient', role='client')
+        # Skips CustomUser.save(), no profile or provisioning is needed for this user
+        CustomUser.objects.bulk_create([user])
+        user = CustomUser.objects.get(username='benchmarkclient')
+        for start in range(0, count, batch_size):
+            listings = Listing.objects.bulk_create([
+                Listing(
+                    title=' '.join(self.sample_words(rng, 5)).capitalize(),
+                    slug=f'benchmark-{start + i}',
+                    user=user,
+                    description=' '.join(self.sample_words(rng, 60)),
+                    price=rng.randint(10, 5000),
+                )
+                for i in range(min(batch_size, count - start))
+            ])
+            if listings[0].pk is None:
+                listings = Listing.objects.filter(slug__startswith='benchmark-').order_by('-id')[:len(listings)]
+            LISTING_INDEX.upsert(build_documents(Listing.objects.filter(
+                id__in=[listing.pk for listing in listings]
+            ).prefetch_related('skills')))
+
+    def time(self, queries, run):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            run(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
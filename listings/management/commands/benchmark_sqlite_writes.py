@@ -0,0 +1,105 @@
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Event
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+# The old settings against the ones of backend/settings.py with SQLITE_WAL=1
+PROFILES = {
+    'stock': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'OPTIONS': {},
+    },
+    'tuned': {
+        'ENGINE': 'backend.db.sqlite3',
+        'OPTIONS': {'wal': True, 'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures write throughput of concurrent writers, with readers polling alongside, on a scratch SQLite '
+        'file for each connection profile. Every write is a chat-style insert plus a listing-style row update '
+        'in one transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writes', type=int, default=200, help='Transactions per writer')
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+        parser.add_argument('--dir', help='Where the scratch files go, ideally the disk of the real database')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{options['writers']} writers x {options['writes']} transactions, "
+                          f"{options['readers']} readers")
+        for name in options['profiles']:
+            directory = tempfile.mkdtemp(prefix='benchmark-writes-', dir=options['dir'])
+            alias = f'benchmark_{name}'
+            connections.settings[alias] = connections.configure_settings({
+                DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+                alias: {**PROFILES[name], 'NAME': str(Path(directory) / 'benchmark.sqlite3')},
+            })[alias]
+            try:
+                self.stdout.write(f"{name:<8}" + self.run(alias, options))
+            finally:
+                connections[alias].close()
+                del connections[alias]
+                del connections.settings[alias]
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, alias, options):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('CREATE TABLE message (id integer PRIMARY KEY, chat_id integer, content text)')
+            cursor.execute('CREATE INDEX message_chat_idx ON message (chat_id, id)')
+            cursor.execute('CREATE TABLE listing (id integer PRIMARY KEY, version integer)')
+            cursor.executemany('INSERT INTO listing (id, version) VALUES (%s, 1)', [(i,) for i in range(100)])
+        connections[alias].close()
+
+        done = Event()
+
+        def write(worker):
+            errors = 0
+            try:
+                for i in range(options['writes']):
+                    try:
+                        with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                            cursor.execute('INSERT INTO message (chat_id, content) VALUES (%s, %s)',
+                                           [worker, f'message {i}'])
+                            cursor.execute('UPDATE listing SET version = version + 1 WHERE id = %s', [i % 100])
+                    except OperationalError:
+                        errors += 1
+                return errors
+            finally:
+                connections[alias].close()
+
+        def read(worker):
+            reads = 0
+            try:
+                while not done.is_set():
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute('SELECT count(*), max(id) FROM message WHERE chat_id = %s',
+                                       [worker % options['writers']])
+                        cursor.fetchone()
+                    reads += 1
+                return reads
+            finally:
+                connections[alias].close()
+
+        with ThreadPoolExecutor(max_workers=options['writers'] + options['readers']) as pool:
+            readers = [pool.submit(read, worker) for worker in range(options['readers'])]
+            started = time.perf_counter()
+            writers = [pool.submit(write, worker) for worker in range(options['writers'])]
+            errors = sum(future.result() for future in writers)
+            elapsed = time.perf_counter() - started
+            done.set()
+            reads = sum(future.result() for future in readers)
+
+        committed = options['writers'] * options['writes'] - errors
+        return (f'{committed / elapsed:>9.0f} writes/s {reads / elapsed:>9.0f} reads/s '
+                f'{errors:>6} failed with "database is locked"   ({elapsed:.2f}s)')
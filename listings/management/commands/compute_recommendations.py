@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.recommendations import compute_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Precomputes the top matched open listings of every freelancer and the top freelancers of every client. '
+        'Only recomputes those affected by changes since the last run unless --full is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true')
+        parser.add_argument('--top-n', type=int, default=settings.RECOMMENDATIONS_TOP_N)
+        parser.add_argument('--chunk-size', type=int, default=settings.RECOMMENDATIONS_CHUNK_SIZE,
+                            help='Rows multiplied and written per transaction.')
+
+    def handle(self, *args, **options):
+        run = compute_recommendations(options['top_n'], options['chunk_size'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS('{} run: {} freelancers, {} clients in {:.1f}s'.format(
+            'Full' if run.full else 'Incremental', run.freelancers, run.clients,
+            (run.finished_at - run.started_at).total_seconds(),
+        )))
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.sync import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Pushes pending listing sync events to the first project, with retries and dead-lettering.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_SYNC_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=settings.ORDER_SYNC_MAX_ATTEMPTS)
+        parser.add_argument('--interval', type=float, default=settings.ORDER_SYNC_POLL_INTERVAL,
+                            help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain a single batch and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = drain_outbox(options['batch_size'], options['max_attempts'])
+            if any(stats.values()):
+                self.stdout.write('sent={sent} retried={retried} dead={dead}'.format(**stats))
+            if options['once']:
+                return
+            # Keep going right away while there is a backlog
+            if sum(stats.values()) < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import CustomUser
+from listings.bulk import FORMATS, export_rows, render_rows
+from listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Exports listings, all of them or those of one user, as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--user', help='Only the listings this user owns or works on')
+        parser.add_argument('--output', help='File to write, standard output by default')
+
+    def handle(self, *args, **options):
+        queryset = Listing.objects.all()
+        if options['user']:
+            try:
+                queryset = Listing.objects.for_user(CustomUser.objects.get(username=options['user']))
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"No user named {options['user']}.")
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for line in render_rows(export_rows(queryset), options['format']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
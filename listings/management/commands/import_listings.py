@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import CustomUser
+from listings.bulk import FORMATS, import_listings, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Imports listings for a client from an NDJSON or CSV file, the format taken from its extension.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Username of the client who owns the listings')
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['user'], role='client')
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No client named {options['user']}.")
+        file_format = options['format'] or Path(options['path']).suffix.lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(f"Cannot tell the format of {options['path']}; pass --format.")
+
+        with open(options['path'], 'rb') as lines:
+            result = import_listings(user, read_rows(lines, file_format), options['batch_size'])
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} listings, skipped {result.error_count} invalid rows.'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from listings.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Recounts the open listings per skill and price bucket behind the listing facets. '
+        'Run it after changing LISTING_PRICE_BUCKETS.'
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} listing facet counts.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+from listings.search import LISTING_INDEX, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Recreates the listing full-text index from the listings table.'
+
+    def handle(self, *args, **options):
+        if not LISTING_INDEX.is_supported():
+            self.stderr.write('Full-text search is not available on this database.')
+            return
+        LISTING_INDEX.create()
+        rebuild_index(Listing)
+        self.stdout.write(f'Indexed {Listing.objects.count()} listings.')
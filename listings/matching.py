@@ -0,0 +1,136 @@
+# listings/matching.py
+"""
+Skill-overlap matching between listings and freelancers.
+
+Each SkillIndex keeps, in the cache, a sorted posting list per skill (skill id ->
+ids of the objects that have it) and the skill count of every object. A match
+only reads the postings of the requested skills, so its cost follows the size of
+the skill set rather than the size of the tables. Postings are loaded lazily and
+dropped per skill by the m2m signals in listings/models.py.
+"""
+import heapq
+from collections import Counter, namedtuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+Match = namedtuple('Match', ['id', 'score', 'overlap'])
+
+
+class SkillIndex:
+    def __init__(self, name, model, skills_field='skills', filters=None):
+        """
+        model is an 'app_label.Model' label; filters restrict which objects are
+        listed, e.g. only open listings.
+        """
+        self.name = name
+        self.model_label = model
+        self.skills_field = skills_field
+        self.filters = filters or {}
+
+    @property
+    def field(self):
+        return apps.get_model(self.model_label)._meta.get_field(self.skills_field)
+
+    @property
+    def generation_key(self):
+        return f'matching:{self.name}:generation'
+
+    def key(self, kind, pk):
+        generation = cache.get_or_set(self.generation_key, 1, None)
+        return f'matching:{self.name}:{generation}:{kind}:{pk}'
+
+    def postings(self, skill_ids):
+        keys = {self.key('skill', skill_id): skill_id for skill_id in skill_ids}
+        cached = cache.get_many(keys)
+        postings = {keys[key]: ids for key, ids in cached.items()}
+        missing = [skill_id for skill_id in skill_ids if skill_id not in postings]
+        if missing:
+            field = self.field
+            item, skill = field.m2m_field_name(), field.m2m_reverse_field_name()
+            loaded = {skill_id: [] for skill_id in missing}
+            rows = field.remote_field.through.objects.filter(
+                **{f'{skill}_id__in': missing},
+                **{f'{item}__{lookup}': value for lookup, value in self.filters.items()},
+            ).order_by(f'{item}_id').values_list(f'{skill}_id', f'{item}_id')
+            for skill_id, item_id in rows:
+                loaded[skill_id].append(item_id)
+            cache.set_many({self.key('skill', skill_id): ids for skill_id, ids in loaded.items()},
+                           settings.MATCHING_INDEX_TIMEOUT)
+            postings.update(loaded)
+        return postings
+
+    def sizes(self, item_ids):
+        keys = {self.key('size', item_id): item_id for item_id in item_ids}
+        sizes = {keys[key]: size for key, size in cache.get_many(keys).items()}
+        missing = [item_id for item_id in item_ids if item_id not in sizes]
+        if missing:
+            field = self.field
+            item = field.m2m_field_name()
+            loaded = dict(
+                field.remote_field.through.objects.filter(**{f'{item}_id__in': missing})
+                .values(f'{item}_id').annotate(n=Count('id')).values_list(f'{item}_id', 'n')
+            )
+            cache.set_many({self.key('size', item_id): size for item_id, size in loaded.items()},
+                           settings.MATCHING_INDEX_TIMEOUT)
+            sizes.update(loaded)
+        return sizes
+
+    def top_matches(self, skill_ids, k):
+        """
+        The k objects sharing the most with skill_ids by Jaccard similarity, ties
+        going to the larger overlap and then the newer object.
+        """
+        skill_ids = set(skill_ids)
+        if not skill_ids or k <= 0:
+            return []
+        overlap = Counter()
+        for ids in self.postings(list(skill_ids)).values():
+            overlap.update(ids)
+        sizes = self.sizes(list(overlap))
+        matches = (
+            Match(item_id, shared / (len(skill_ids) + sizes.get(item_id, shared) - shared), shared)
+            for item_id, shared in overlap.items()
+        )
+        return heapq.nlargest(k, matches, key=lambda match: (match.score, match.overlap, match.id))
+
+    def invalidate(self, skill_ids=(), item_ids=()):
+        keys = [self.key('skill', skill_id) for skill_id in skill_ids]
+        keys += [self.key('size', item_id) for item_id in item_ids]
+        if keys:
+            cache.delete_many(keys)
+
+    def invalidate_all(self):
+        cache.set(self.generation_key, cache.get_or_set(self.generation_key, 1, None) + 1, None)
+
+
+LISTING_SKILLS = SkillIndex('listings', 'listings.Listing', filters={'status': 'open'})
+FREELANCER_SKILLS = SkillIndex('freelancers', 'accounts.FreelancerProfile')
+
+
+def invalidate_all():
+    LISTING_SKILLS.invalidate_all()
+    FREELANCER_SKILLS.invalidate_all()
+
+
+def load_in_order(queryset, ids):
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def load_topped_up(queryset, ids, index, skill_ids, limit):
+    """
+    The objects of ids that queryset still returns, in order, followed by the
+    index's best live matches for skill_ids until there are limit of them.
+    Stored recommendations go stale as listings close and profiles go away.
+    """
+    objects = load_in_order(queryset, ids[:limit])
+    if len(objects) < limit:
+        seen = set(ids)
+        # Enough candidates that the ones already seen cannot leave a gap
+        matches = index.top_matches(skill_ids, limit + len(seen))
+        extra = [match.id for match in matches if match.id not in seen][:limit - len(objects)]
+        objects += load_in_order(queryset, extra)
+    return objects
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:10
+
+from django.db import migrations
+
+# The index as it was created here; listings/search.py maintains it from then on
+TABLE = 'listings_listing_fts'
+COLUMNS = {'title': 'A', 'skills': 'B', 'description': 'C'}
+CHUNK_SIZE = 2000
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, "
+                           "tokenize='unicode61 remove_diacritics 2')".format(qn(TABLE), ', '.join(COLUMNS)))
+            insert = 'INSERT INTO {} (rowid, {}) VALUES ({})'
+        else:
+            document = ' || '.join(
+                "setweight(to_tsvector('english', coalesce({}, '')), '{}')".format(qn(column), weight)
+                for column, weight in COLUMNS.items()
+            )
+            cursor.execute('CREATE TABLE IF NOT EXISTS {} (id bigint PRIMARY KEY, {}, document tsvector '
+                           'GENERATED ALWAYS AS ({}) STORED)'.format(
+                               qn(TABLE), ', '.join(f'{qn(column)} text' for column in COLUMNS), document))
+            cursor.execute('CREATE INDEX IF NOT EXISTS {} ON {} USING GIN (document)'.format(
+                qn(f'{TABLE}_document_idx'), qn(TABLE)
+            ))
+            insert = 'INSERT INTO {} (id, {}) VALUES ({})'
+        insert = insert.format(qn(TABLE), ', '.join(qn(column) for column in COLUMNS),
+                               ', '.join(['%s'] * (len(COLUMNS) + 1)))
+
+        Listing = apps.get_model('listings', 'Listing')
+        queryset = Listing.objects.order_by('pk').prefetch_related('skills')
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+            if not chunk:
+                return
+            cursor.executemany(insert, [
+                (listing.pk, listing.title or '', ' '.join(skill.name for skill in listing.skills.all()),
+                 listing.description or '')
+                for listing in chunk
+            ])
+            last_pk = chunk[-1].pk
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(connection.ops.quote_name(TABLE)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_ordersyncevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0012_freelancerprofile_updated_at'),
+        ('listings', '0005_listing_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('full', models.BooleanField(default=False)),
+                ('freelancers', models.PositiveIntegerField(default=0)),
+                ('clients', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='ListingRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('overlap', models.PositiveSmallIntegerField()),
+                ('freelancer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_recommendations', to='accounts.freelancerprofile')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='listings.listing')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FreelancerRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('overlap', models.PositiveSmallIntegerField()),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='freelancer_recommendations', to=settings.AUTH_USER_MODEL)),
+                ('freelancer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='client_recommendations', to='accounts.freelancerprofile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='listingrecommendation',
+            constraint=models.UniqueConstraint(fields=('freelancer', 'rank'), name='listings_listingrec_rank_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='freelancerrecommendation',
+            constraint=models.UniqueConstraint(fields=('client', 'rank'), name='listings_freelancerrec_rank_uniq'),
+        ),
+    ]
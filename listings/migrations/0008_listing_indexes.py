@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('listings', '0007_listing_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='listing',
+            name='freelancer',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='taken_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('freelancer__isnull', True), ('status', 'open')), fields=['price', 'id'], name='listings_open_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['user', 'status', '-id'], name='listings_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['freelancer', '-id'], name='listings_freelancer_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:31
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+import django.db.models.deletion
+
+# settings.LISTING_PRICE_BUCKETS as it was when the counts were added;
+# rebuild_listing_facets recounts them after it changes
+PRICE_BUCKETS = (0, 50, 100, 250, 500, 1000, 5000)
+
+
+def bucket_of(field):
+    whens = []
+    for i, (low, high) in enumerate(zip(PRICE_BUCKETS, [*PRICE_BUCKETS[1:], None])):
+        q = Q(**{f'{field}__gte': low})
+        if high is not None:
+            q &= Q(**{f'{field}__lt': high})
+        whens.append(When(q, then=Value(i)))
+    return Case(*whens, output_field=IntegerField())
+
+
+def fill_facet_counts(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    ListingFacetCount = apps.get_model('listings', 'ListingFacetCount')
+    totals = Listing.objects.filter(status='open', freelancer__isnull=True).annotate(
+        bucket=bucket_of('price')
+    ).values('bucket').annotate(n=Count('pk')).order_by()
+    per_skill = Listing.skills.through.objects.filter(
+        listing__status='open', listing__freelancer__isnull=True
+    ).annotate(bucket=bucket_of('listing__price')).values('skill_id', 'bucket').annotate(n=Count('pk')).order_by()
+    rows = [ListingFacetCount(skill_id=None, bucket=row['bucket'], count=row['n']) for row in totals]
+    rows += [ListingFacetCount(skill_id=row['skill_id'], bucket=row['bucket'], count=row['n']) for row in per_skill]
+    ListingFacetCount.objects.bulk_create([row for row in rows if row.bucket is not None], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_customuser_role_index'),
+        ('listings', '0008_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('freelancer__isnull', True), ('status', 'open')), fields=['created_at', 'id'], name='listings_open_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='listingfacetcount',
+            name='skill',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.skill'),
+        ),
+        migrations.AddConstraint(
+            model_name='listingfacetcount',
+            constraint=models.UniqueConstraint(fields=('skill', 'bucket'), name='listings_facet_skill_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='listingfacetcount',
+            constraint=models.UniqueConstraint(condition=models.Q(('skill__isnull', True)), fields=('bucket',), name='listings_facet_total_uniq'),
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
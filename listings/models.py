@@ -1,10 +1,22 @@
 # listings/models.py
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
 from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import get_random_string
 from django.utils.text import slugify
-from accounts.models import Skill,SkillMapping
-import requests
-from django.conf import settings
+from accounts.models import ClientProfile, FreelancerProfile, FreelancerSkill, Skill
+from backend import response_cache
+from backend.versioning import VersionedModelMixin, bump_versions
+
+# Listings that can still be taken
+OPEN = models.Q(status='open', freelancer__isnull=True)
+
+SLUG_SUFFIX_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789'
 
 class ListingManager(models.Manager):
     def for_user(self, user):
@@ -14,8 +26,40 @@ class ListingManager(models.Manager):
             return self.filter(user=user)
         return self.none()
 
+    def unique_slugs(self, titles):
+        """
+        A free slug per title: the slugified title, or that with a random suffix
+        when it is taken, in the table or earlier in the list. One query for all.
+        """
+        bases = [slugify(title)[:200] or 'listing' for title in titles]
+        taken = set(self.filter(slug__in=set(bases)).values_list('slug', flat=True))
+        slugs = []
+        for base in bases:
+            slug = base
+            while slug in taken:
+                slug = f'{base}-{get_random_string(6, SLUG_SUFFIX_CHARS)}'
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+
+    def take(self, slug, freelancer):
+        """
+        Assigns an open, untaken listing to the freelancer. The row is locked
+        first, so of two concurrent takes the second finds it taken. Returns the
+        listing, or None when it is gone or already taken. Must run in a
+        transaction that the caller commits with its own writes.
+        """
+        listing = self.select_for_update().select_related('user').filter(OPEN, slug=slug).first()
+        if listing is None:
+            return None
+        listing.freelancer = freelancer
+        listing.status = 'in_progress'
+        listing.taken_at = timezone.now()
+        listing.save(update_fields=['freelancer', 'status', 'taken_at', 'updated_at'])
+        return listing
+
 
-class Listing(models.Model):
+class Listing(VersionedModelMixin, models.Model):
     STATUS_CHOICES = [
         ('open', 'Open'),
         ('closed', 'Closed'),
@@ -28,37 +72,364 @@ class Listing(models.Model):
     status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='open')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped when the skills change, read by the incremental recommendations run
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     taken_at = models.DateTimeField(null=True, blank=True)
     ended_at = models.DateTimeField(null=True, blank=True)
+    # Indexed by listings_freelancer_idx below
     freelancer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
-                                   related_name='taken_listings')
+                                   related_name='taken_listings', db_index=False)
     skills = models.ManyToManyField(Skill, blank=True)
+    # Bumped on every change to what the detail endpoint returns, see backend/versioning.py
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     objects = ListingManager()
 
+    class Meta:
+        # List endpoints page newest first, so every index ends in the id.
+        # listings.tests.QueryPlanTests fails when one of their queries stops using them.
+        indexes = [
+            # OpenListingsListView with a price range; without one it reads
+            # listings_freelancer_idx at freelancer IS NULL
+            models.Index(fields=['price', 'id'], condition=OPEN, name='listings_open_price_idx'),
+            # and with a creation date range (listings/facets.py)
+            models.Index(fields=['created_at', 'id'], condition=OPEN, name='listings_open_created_idx'),
+            # ClientInProgressListingsView and ListingManager.for_user
+            models.Index(fields=['user', 'status', '-id'], name='listings_user_status_idx'),
+            models.Index(fields=['freelancer', '-id'], name='listings_freelancer_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        super(Listing, self).save(*args, **kwargs)
-        data = {
-            'title': self.title,
-            'description': self.description,
-            'price': str(self.price),
-            'skills': [mapping.first_project_skill_id for mapping in SkillMapping.objects.filter(second_project_skill__in=self.skills.all())],
-            'client': self.user_id,
-            'status': self.status
-        }
-
-        print("Data being sent:", data)  # Log the data being sent to troubleshoot
-
-        response = requests.post(settings.FIRST_PROJECT_ORDER_API_URL, json=data)  # Note: Use json= here
-        if response.status_code == 201:
-            try:
-                response_data = response.json()
-                print("Data received:", response_data)
-            except ValueError:
-                print("Failed to decode JSON from response:", response.text)
-        else:
-            print("Failed to sync order with the first project:", response.status_code, response.text)
+        if not self.slug:
+            self.slug = Listing.objects.unique_slugs([self.title])[0]
+        # The sync event is written in the same transaction as the listing, the
+        # actual call to the first project happens in the drain_order_outbox worker.
+        with transaction.atomic():
+            super(Listing, self).save(*args, **kwargs)
+            OrderSyncEvent.objects.create(listing=self)
 
     def __str__(self):
         return self.title
 
+
+# The listing <-> skill rows, as opposed to the LISTING_SKILLS posting lists of listings/matching.py
+ListingSkill = Listing.skills.through
+
+
+class OrderSyncEvent(models.Model):
+    """
+    Outbox row telling the worker that a listing has to be pushed to the first project.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),
+    ]
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='sync_events')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='listings_sync_due_idx'),
+        ]
+
+    def __str__(self):
+        return "Sync {} for listing {} ({})".format(self.pk, self.listing_id, self.status)
+
+
+class RecommendationRun(models.Model):
+    """
+    One run of compute_recommendations. The start of the last finished run is the
+    watermark of the next incremental run.
+    """
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    full = models.BooleanField(default=False)
+    freelancers = models.PositiveIntegerField(default=0)
+    clients = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "Recommendations run {} ({})".format(self.pk, 'full' if self.full else 'incremental')
+
+
+class ListingRecommendation(models.Model):
+    freelancer = models.ForeignKey(FreelancerProfile, on_delete=models.CASCADE, related_name='listing_recommendations')
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='recommendations')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    overlap = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['freelancer', 'rank'], name='listings_listingrec_rank_uniq'),
+        ]
+
+
+class FreelancerRecommendation(models.Model):
+    client = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                               related_name='freelancer_recommendations')
+    freelancer = models.ForeignKey(FreelancerProfile, on_delete=models.CASCADE, related_name='client_recommendations')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    overlap = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'rank'], name='listings_freelancerrec_rank_uniq'),
+        ]
+
+
+class ListingFacetCount(models.Model):
+    """
+    Open listings per price bucket of listings/facets.py, overall (no skill) and
+    per skill. Kept up to date by the signals below, rebuilt by
+    rebuild_listing_facets.
+    """
+    skill = models.ForeignKey(Skill, null=True, on_delete=models.CASCADE, related_name='+')
+    bucket = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['skill', 'bucket'], name='listings_facet_skill_uniq'),
+            models.UniqueConstraint(fields=['bucket'], condition=models.Q(skill__isnull=True),
+                                    name='listings_facet_total_uniq'),
+        ]
+
+    def __str__(self):
+        return "{} listings in bucket {} for skill {}".format(self.count, self.bucket, self.skill_id)
+
+
+# Keep the full-text index (listings/search.py) in step with listings and their skills
+
+@receiver(post_save, sender=Listing)
+def index_saved_listing(sender, instance, **kwargs):
+    from .search import index_listings
+    index_listings([instance.pk])
+
+
+@receiver(post_delete, sender=Listing)
+def unindex_deleted_listing(sender, instance, **kwargs):
+    from .search import unindex_listings
+    unindex_listings([instance.pk])
+
+
+@receiver(m2m_changed, sender=ListingSkill)
+def reindex_listing_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    from .search import index_listings
+    if not reverse:
+        index_listings([instance.pk])
+    elif pk_set:
+        index_listings(pk_set)
+
+
+@receiver(post_save, sender=Skill)
+def reindex_renamed_skill(sender, instance, created, **kwargs):
+    if not created:
+        from .search import index_listings
+        index_listings(instance.listing_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Skill)
+def reindex_deleted_skill(sender, instance, **kwargs):
+    from .search import index_listings
+    listing_ids = list(instance.listing_set.values_list('id', flat=True))
+    if listing_ids:
+        transaction.on_commit(lambda: index_listings(listing_ids))
+
+
+# Keep the skill matching postings (listings/matching.py) fresh
+
+def skill_owner_model(sender):
+    return Listing if sender is ListingSkill else FreelancerProfile
+
+
+def skill_index_for(sender):
+    from .matching import FREELANCER_SKILLS, LISTING_SKILLS
+    return LISTING_SKILLS if sender is ListingSkill else FREELANCER_SKILLS
+
+
+def changed_skill_rows(sender, instance, action, reverse, pk_set):
+    """
+    (skill ids, object ids) touched by a change of a skills relation, or None.
+    Clears carry no pk_set, so their rows are read on pre_clear before they go.
+    """
+    if action == 'pre_clear':
+        if reverse:
+            item_field = skill_owner_model(sender)._meta.get_field('skills').m2m_field_name()
+            return [instance.pk], list(sender.objects.filter(skill_id=instance.pk).values_list(
+                f'{item_field}_id', flat=True
+            ))
+        return list(instance.skills.values_list('id', flat=True)), [instance.pk]
+    if action in ('post_add', 'post_remove') and pk_set:
+        return ([instance.pk], list(pk_set)) if reverse else (list(pk_set), [instance.pk])
+    return None
+
+
+@receiver(m2m_changed, sender=ListingSkill)
+@receiver(m2m_changed, sender=FreelancerSkill)
+def invalidate_skill_postings(sender, instance, action, reverse, pk_set, **kwargs):
+    rows = changed_skill_rows(sender, instance, action, reverse, pk_set)
+    if rows:
+        index = skill_index_for(sender)
+        transaction.on_commit(lambda: index.invalidate(*rows))
+
+
+@receiver(post_save, sender=Listing)
+def invalidate_listing_postings(sender, instance, created, **kwargs):
+    # Only open listings are posted, so a status change moves the listing in or out
+    if not created:
+        from .matching import LISTING_SKILLS
+        skill_ids = list(instance.skills.values_list('id', flat=True))
+        transaction.on_commit(lambda: LISTING_SKILLS.invalidate(skill_ids))
+
+
+@receiver(pre_delete, sender=Listing)
+@receiver(pre_delete, sender=FreelancerProfile)
+def invalidate_deleted_postings(sender, instance, **kwargs):
+    index = skill_index_for(sender.skills.through)
+    skill_ids = list(instance.skills.values_list('id', flat=True))
+    transaction.on_commit(lambda: index.invalidate(skill_ids, [instance.pk]))
+
+
+@receiver(post_delete, sender=Skill)
+def invalidate_all_postings(sender, instance, **kwargs):
+    from .matching import invalidate_all
+    transaction.on_commit(invalidate_all)
+
+
+# Skill changes count as updates for the incremental recommendations run
+
+@receiver(m2m_changed, sender=ListingSkill)
+@receiver(m2m_changed, sender=FreelancerSkill)
+def touch_skill_owners(sender, instance, action, reverse, pk_set, **kwargs):
+    rows = changed_skill_rows(sender, instance, action, reverse, pk_set)
+    if rows:
+        skill_owner_model(sender).objects.filter(pk__in=rows[1]).update(
+            updated_at=timezone.now(), version=F('version') + 1
+        )
+
+
+@receiver(pre_delete, sender=Skill)
+def touch_deleted_skill_owners(sender, instance, **kwargs):
+    now = timezone.now()
+    instance.listing_set.update(updated_at=now, version=F('version') + 1)
+    instance.freelancerprofile_set.update(updated_at=now, version=F('version') + 1)
+
+
+@receiver(post_save, sender=Skill)
+def bump_renamed_skill_owners(sender, instance, created, **kwargs):
+    if not created:
+        bump_versions(instance.listing_set.all())
+        bump_versions(instance.freelancerprofile_set.all())
+
+
+@receiver(post_save, sender=ClientProfile)
+def bump_client_listings(sender, instance, created, **kwargs):
+    # The owner's profile picture is part of the listing payload
+    if not created:
+        bump_versions(Listing.objects.filter(user_id=instance.user_id))
+
+
+# Facet counts (ListingFacetCount): a listing counts while it is open, in the
+# bucket of its price
+
+# Saves limited to other fields leave the counts alone
+FACET_FIELDS = frozenset(['price', 'status', 'freelancer', 'freelancer_id'])
+
+
+def saves_facet_fields(update_fields):
+    return update_fields is None or not FACET_FIELDS.isdisjoint(update_fields)
+
+
+@receiver(pre_save, sender=Listing)
+def remember_facet_bucket(sender, instance, raw, update_fields=None, **kwargs):
+    if instance._state.adding or raw or not saves_facet_fields(update_fields):
+        return
+    from .facets import bucket_index
+    # Locked so that concurrent saves move the listing out of its bucket once
+    price = sender.objects.select_for_update().filter(OPEN, pk=instance.pk).values_list('price', flat=True).first()
+    instance._facet_bucket_before = None if price is None else bucket_index(price)
+
+
+@receiver(post_save, sender=Listing)
+def update_facet_counts(sender, instance, created, raw, update_fields=None, **kwargs):
+    if raw or not saves_facet_fields(update_fields):
+        return
+    from .facets import adjust_facet_counts, open_bucket
+    before = instance.__dict__.pop('_facet_bucket_before', None)
+    after = open_bucket(instance)
+    if before == after:
+        return
+    skill_ids = [] if created else list(instance.skills.values_list('id', flat=True))
+    deltas = Counter()
+    for skill_id in [None, *skill_ids]:
+        if before is not None:
+            deltas[skill_id, before] -= 1
+        if after is not None:
+            deltas[skill_id, after] += 1
+    adjust_facet_counts(deltas)
+
+
+@receiver(pre_delete, sender=Listing)
+def uncount_deleted_listing(sender, instance, **kwargs):
+    from .facets import adjust_facet_counts, bucket_index, count_open_skill_rows
+    price = sender.objects.filter(OPEN, pk=instance.pk).values_list('price', flat=True).first()
+    if price is not None:
+        deltas = count_open_skill_rows(sender.skills.through.objects.filter(listing_id=instance.pk), -1)
+        deltas[None, bucket_index(price)] -= 1
+        adjust_facet_counts(deltas)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def count_released_listings(sender, instance, **kwargs):
+    # Deleting a freelancer empties Listing.freelancer with an UPDATE that sends
+    # no signals, which opens the listings of theirs still marked 'open'. Their
+    # own listings go with them, uncounted by uncount_deleted_listing.
+    from .facets import adjust_facet_counts, bucket_index
+    from .matching import LISTING_SKILLS
+    taken = Listing.objects.filter(freelancer=instance).exclude(user=instance)
+    bump_versions(taken)
+    buckets = {pk: bucket_index(price) for pk, price in taken.filter(status='open').values_list('pk', 'price')}
+    if not buckets:
+        return
+    skill_rows = list(ListingSkill.objects.filter(listing_id__in=buckets).values_list('listing_id', 'skill_id'))
+    deltas = Counter()
+    for listing_id, skill_id in [(pk, None) for pk in buckets] + skill_rows:
+        if buckets[listing_id] is not None:
+            deltas[skill_id, buckets[listing_id]] += 1
+    adjust_facet_counts(deltas)
+    skill_ids = {skill_id for _, skill_id in skill_rows}
+    transaction.on_commit(lambda: LISTING_SKILLS.invalidate(skill_ids))
+    response_cache.bump('listings')
+
+
+@receiver(m2m_changed, sender=ListingSkill)
+def update_skill_facet_counts(sender, instance, action, reverse, pk_set, model, **kwargs):
+    # Before removals, to count only the rows that exist, after additions,
+    # whose pk_set leaves out the rows that already existed
+    if action not in ('post_add', 'pre_remove', 'pre_clear'):
+        return
+    from .facets import adjust_facet_counts, count_open_skill_rows
+    rows = sender.objects.filter(**{'skill_id' if reverse else 'listing_id': instance.pk})
+    if action != 'pre_clear':
+        if not pk_set:
+            return
+        rows = rows.filter(**{'listing_id__in' if reverse else 'skill_id__in': pk_set})
+    adjust_facet_counts(count_open_skill_rows(rows, 1 if action == 'post_add' else -1))
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(m2m_changed, sender=ListingSkill)
+def bump_listing_responses(sender, **kwargs):
+    # Cached public responses, see backend/response_cache.py
+    if kwargs.get('action') in (None, 'post_add', 'post_remove', 'post_clear'):
+        response_cache.bump('listings')
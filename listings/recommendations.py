@@ -0,0 +1,142 @@
+# listings/recommendations.py
+"""
+Batch version of listings/matching.py: the top-N open listings of every freelancer
+and the top-N freelancers of every client, precomputed by compute_recommendations.
+
+Skill sets become sparse binary matrices (rows x skills), one sparse product gives
+the shared skill counts of every pair in a chunk of rows, and Jaccard similarity
+is computed on the non-zero entries only.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from scipy import sparse
+
+from accounts.models import CustomUser, FreelancerProfile, FreelancerSkill
+from .models import FreelancerRecommendation, Listing, ListingRecommendation, ListingSkill, RecommendationRun
+
+
+def skill_matrix(pairs, row_ids, skill_positions):
+    """
+    Binary CSR matrix of row_ids x skills from (row id, skill id) pairs.
+    """
+    row_positions = {pk: i for i, pk in enumerate(row_ids)}
+    rows, cols = [], []
+    for row_id, skill_id in pairs:
+        if row_id in row_positions:
+            rows.append(row_positions[row_id])
+            cols.append(skill_positions[skill_id])
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(row_ids), len(skill_positions))
+    )
+    # Clients can reach a skill through several listings
+    matrix.data[:] = 1
+    return matrix
+
+
+def rank_chunks(queries, candidates, top_n, chunk_size):
+    """
+    Yields, per chunk of query rows, a list of (query row, candidate positions,
+    scores, overlaps) with the best top_n candidates first. Ties go to the larger
+    overlap, then the newer candidate (candidates are sorted by id).
+    """
+    query_sizes = np.asarray(queries.sum(axis=1)).ravel()
+    candidate_sizes = np.asarray(candidates.sum(axis=1)).ravel()
+    candidates_t = candidates.T.tocsr()
+    for start in range(0, queries.shape[0], chunk_size):
+        overlap = (queries[start:start + chunk_size] @ candidates_t).tocsr()
+        ranked = []
+        for offset in range(overlap.shape[0]):
+            row = start + offset
+            lo, hi = overlap.indptr[offset], overlap.indptr[offset + 1]
+            cols = overlap.indices[lo:hi]
+            shared = overlap.data[lo:hi].astype(np.float64)
+            scores = shared / (query_sizes[row] + candidate_sizes[cols] - shared)
+            best = np.lexsort((cols, shared, scores))[::-1][:top_n]
+            ranked.append((row, cols[best], scores[best], shared[best]))
+        yield ranked
+
+
+def changed_targets(since):
+    """
+    Freelancer and client ids whose recommendations may differ since the given time:
+    the changed objects themselves, everyone sharing a skill with a changed object,
+    and everyone currently recommended a changed object.
+    """
+    changed_listings = Listing.objects.filter(updated_at__gte=since).values('id')
+    changed_profiles = FreelancerProfile.objects.filter(updated_at__gte=since).values('id')
+    listing_skills = ListingSkill.objects.filter(listing_id__in=changed_listings).values('skill_id')
+    profile_skills = FreelancerSkill.objects.filter(freelancerprofile_id__in=changed_profiles).values('skill_id')
+
+    freelancer_ids = set(FreelancerProfile.objects.filter(
+        Q(id__in=changed_profiles)
+        | Q(skills__in=listing_skills)
+        | Q(listing_recommendations__listing_id__in=changed_listings)
+    ).values_list('id', flat=True))
+    client_ids = set(CustomUser.objects.filter(
+        Q(listings__id__in=changed_listings)
+        | Q(listings__skills__in=profile_skills)
+        | Q(freelancer_recommendations__freelancer_id__in=changed_profiles)
+    ).values_list('id', flat=True))
+    return freelancer_ids, client_ids
+
+
+def write_recommendations(model, owner_field, candidate_field, owner_ids, candidate_ids, ranked):
+    rows = [
+        model(**{f'{owner_field}_id': owner_ids[row], f'{candidate_field}_id': candidate_ids[col]},
+              rank=rank, score=float(score), overlap=int(shared))
+        for row, cols, scores, overlaps in ranked
+        for rank, (col, score, shared) in enumerate(zip(cols, scores, overlaps), start=1)
+    ]
+    with transaction.atomic():
+        model.objects.filter(**{f'{owner_field}_id__in': [owner_ids[row] for row, *_ in ranked]}).delete()
+        model.objects.bulk_create(rows, batch_size=1000)
+
+
+def compute_recommendations(top_n, chunk_size, full=False):
+    """
+    Recomputes the recommendations of every freelancer and client, or on an
+    incremental run only of those affected by changes since the last finished run.
+    """
+    run = RecommendationRun(started_at=timezone.now(), full=full)
+    last_run = RecommendationRun.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+    if full or last_run is None:
+        run.full = True
+        freelancer_ids = set(FreelancerProfile.objects.values_list('id', flat=True))
+        client_ids = set(CustomUser.objects.filter(role='client').values_list('id', flat=True))
+    else:
+        freelancer_ids, client_ids = changed_targets(last_run.started_at)
+
+    freelancer_pairs = list(FreelancerSkill.objects.values_list('freelancerprofile_id', 'skill_id'))
+    open_listing_pairs = list(ListingSkill.objects.filter(listing__status='open').values_list('listing_id', 'skill_id'))
+    client_pairs = list(ListingSkill.objects.filter(listing__user_id__in=client_ids).values_list(
+        'listing__user_id', 'skill_id'
+    ))
+    skill_positions = {
+        skill_id: i for i, skill_id in enumerate(sorted({skill for _, skill in
+                                                         freelancer_pairs + open_listing_pairs + client_pairs}))
+    }
+
+    all_freelancer_ids = sorted({pk for pk, _ in freelancer_pairs})
+    open_listing_ids = sorted({pk for pk, _ in open_listing_pairs})
+    freelancer_matrix = skill_matrix(freelancer_pairs, all_freelancer_ids, skill_positions)
+    listing_matrix = skill_matrix(open_listing_pairs, open_listing_ids, skill_positions)
+
+    # Listings for freelancers
+    targets = sorted(freelancer_ids)
+    queries = skill_matrix(freelancer_pairs, targets, skill_positions)
+    for ranked in rank_chunks(queries, listing_matrix, top_n, chunk_size):
+        write_recommendations(ListingRecommendation, 'freelancer', 'listing', targets, open_listing_ids, ranked)
+
+    # Freelancers for clients, by the skills of all their listings
+    targets = sorted(client_ids)
+    queries = skill_matrix(client_pairs, targets, skill_positions)
+    for ranked in rank_chunks(queries, freelancer_matrix, top_n, chunk_size):
+        write_recommendations(FreelancerRecommendation, 'client', 'freelancer', targets, all_freelancer_ids, ranked)
+
+    run.freelancers = len(freelancer_ids)
+    run.clients = len(client_ids)
+    run.finished_at = timezone.now()
+    run.save()
+    return run
@@ -0,0 +1,73 @@
+# listings/search.py
+from django.db.models import Q
+
+from backend.fulltext import FullTextIndex, SearchResults
+
+LISTING_INDEX = FullTextIndex(
+    table='listings_listing_fts',
+    columns={'title': 'A', 'skills': 'B', 'description': 'C'},
+    snippet_column='description',
+)
+
+
+def build_documents(listings):
+    """
+    Index rows for listings with their skills prefetched. Also used by
+    rebuild_index(), which takes the model as an argument.
+    """
+    return [
+        (listing.pk, {
+            'title': listing.title,
+            'description': listing.description,
+            'skills': ' '.join(skill.name for skill in listing.skills.all()),
+        })
+        for listing in listings
+    ]
+
+
+def index_listings(listing_ids):
+    from .models import Listing
+    LISTING_INDEX.upsert(build_documents(Listing.objects.filter(id__in=listing_ids).prefetch_related('skills')))
+
+
+def unindex_listings(listing_ids):
+    LISTING_INDEX.delete(listing_ids)
+
+
+def rebuild_index(listing_model, chunk_size=2000):
+    LISTING_INDEX.clear()
+    queryset = listing_model.objects.order_by('pk').prefetch_related('skills')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        LISTING_INDEX.upsert(build_documents(chunk))
+        last_pk = chunk[-1].pk
+
+
+def search_listings(query, queryset=None):
+    """
+    Ranked listings matching every word of the query (words match as prefixes),
+    with `rank` and a highlighted `snippet` of the description set on each.
+    The result is a lazy sequence meant to be handed to a paginator.
+    """
+    from .models import Listing
+    queryset = queryset if queryset is not None else Listing.objects.all()
+
+    if not LISTING_INDEX.is_supported():
+        # No full-text engine on this database, plain substring matching without ranking
+        return queryset.filter(Q(title__icontains=query) | Q(description__icontains=query)).order_by('-id')
+
+    def load(hits):
+        listings = queryset.in_bulk([pk for pk, _, _ in hits])
+        results = []
+        for pk, rank, snippet in hits:
+            if pk in listings:
+                listing = listings[pk]
+                listing.rank = rank
+                listing.snippet = snippet
+                results.append(listing)
+        return results
+
+    return SearchResults(LISTING_INDEX, query, load)
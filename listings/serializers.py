@@ -46,6 +46,14 @@ class OpenListingSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'price', 'created_at', 'slug', 'skills']
 
 
+class ListingSearchResultSerializer(OpenListingSerializer):
+    rank = serializers.FloatField(read_only=True, default=None)
+    snippet = serializers.CharField(read_only=True, default=None)
+
+    class Meta(OpenListingSerializer.Meta):
+        fields = OpenListingSerializer.Meta.fields + ['rank', 'snippet']
+
+
 class TakeListingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Listing
@@ -66,3 +74,22 @@ class OrderSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         return Listing.objects.create(**validated_data)
 
+
+
+class ListingSkillsSerializer(serializers.Serializer):
+    """
+    The skill names UpdateListingView sets on a listing.
+    """
+    skills = serializers.ListField(child=serializers.CharField(max_length=100))
+
+
+class ListingImportSerializer(serializers.Serializer):
+    """
+    One row of a bulk import, see listings/bulk.py.
+    """
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    # Imported listings have no freelancer yet
+    status = serializers.ChoiceField(choices=['open', 'closed'], default='open')
+    skills = serializers.ListField(child=serializers.CharField(max_length=100), default=list)
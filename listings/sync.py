@@ -0,0 +1,118 @@
+# listings/sync.py
+import logging
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.skills import translate_skill_ids
+from backend.first_project import get_client
+from .models import Listing, OrderSyncEvent
+
+logger = logging.getLogger(__name__)
+
+
+def build_order_payload(listing):
+    """
+    Data the first project expects for an order. Built when the event is sent,
+    so a burst of saves on the same listing ends up as a single up to date push.
+    """
+    return {
+        'title': listing.title,
+        'description': listing.description,
+        'price': str(listing.price),
+        'skills': translate_skill_ids(skill.pk for skill in listing.skills.all()),
+        'client': listing.user_id,
+        'status': listing.status,
+    }
+
+
+def get_backoff(attempts):
+    delay = settings.ORDER_SYNC_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, settings.ORDER_SYNC_MAX_BACKOFF_SECONDS))
+
+
+def claim_due_events(batch_size):
+    """
+    Picks due pending events and pushes their next_attempt_at forward, so another
+    worker running at the same time does not send them twice.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OrderSyncEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        OrderSyncEvent.objects.filter(id__in=[event.id for event in events]).update(
+            next_attempt_at=now + timedelta(seconds=settings.ORDER_SYNC_LEASE_SECONDS)
+        )
+    return events
+
+
+def send_order(client, listing):
+    """
+    Returns None when the first project accepted the order, otherwise a tuple of
+    (error message, retryable).
+    """
+    try:
+        response = client.post('orders', json=build_order_payload(listing))
+    except requests.RequestException as e:
+        return str(e), True
+
+    if response.status_code == 201:
+        return None
+    # Client errors other than timeouts and throttling will not get better on retry
+    retryable = response.status_code >= 500 or response.status_code in (408, 429)
+    return "{} {}".format(response.status_code, response.text[:500]), retryable
+
+
+def drain_outbox(batch_size=None, max_attempts=None, client=None):
+    batch_size = batch_size or settings.ORDER_SYNC_BATCH_SIZE
+    max_attempts = max_attempts or settings.ORDER_SYNC_MAX_ATTEMPTS
+    client = client or get_client()
+    stats = {'sent': 0, 'retried': 0, 'dead': 0}
+    if not client.available('orders'):
+        # Leave the events alone instead of burning their attempts while the remote is down
+        return stats
+
+    events = claim_due_events(batch_size)
+    by_listing = {}
+    for event in events:
+        by_listing.setdefault(event.listing_id, []).append(event)
+
+    listings = Listing.objects.prefetch_related('skills').in_bulk(by_listing.keys())
+
+    for listing_id, group in by_listing.items():
+        if listing_id not in listings:
+            # Listing was deleted after the claim, its events went with it
+            continue
+        if not client.available('orders'):
+            # The breaker opened mid-batch, what is left gets picked up again once the lease runs out
+            break
+        event_ids = [event.id for event in group]
+        error, retryable = send_order(client, listings[listing_id]) or (None, False)
+        now = timezone.now()
+
+        if error is None:
+            OrderSyncEvent.objects.filter(id__in=event_ids).update(status='sent', sent_at=now, last_error='')
+            stats['sent'] += len(event_ids)
+            continue
+
+        attempts = max(event.attempts for event in group) + 1
+        if not retryable or attempts >= max_attempts:
+            logger.error('Order sync for listing %s dead-lettered after %s attempts: %s', listing_id, attempts, error)
+            OrderSyncEvent.objects.filter(id__in=event_ids).update(
+                status='dead', attempts=attempts, last_error=error
+            )
+            stats['dead'] += len(event_ids)
+        else:
+            logger.warning('Order sync for listing %s failed (attempt %s): %s', listing_id, attempts, error)
+            OrderSyncEvent.objects.filter(id__in=event_ids).update(
+                attempts=attempts, last_error=error, next_attempt_at=now + get_backoff(attempts)
+            )
+            stats['retried'] += len(event_ids)
+
+    return stats
@@ -1,3 +1,667 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import timedelta
+from threading import Barrier
+from unittest import skipUnless
+from uuid import uuid4
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser, FreelancerProfile, Review, Skill, SkillMapping
+from accounts.skills import get_catalog
+from accounts.tests import FakeFirstProject, FakeResponse
+from chats.models import Chat, Message
+from . import matching
+from .facets import rebuild_facet_counts
+from .models import FreelancerRecommendation, Listing, ListingFacetCount, ListingRecommendation, OrderSyncEvent
+from .sync import claim_due_events, drain_outbox
+
+
+class ListingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        matching.invalidate_all()
+        self.skills = [Skill.objects.create(name=f'listing-test-skill-{i}') for i in range(3)]
+        self.client_user = CustomUser.objects.create_user(username='listing-client', password='x', role='client')
+        self.freelancer_user = CustomUser.objects.create_user(username='listing-freelancer', password='x',
+                                                              role='freelancer')
+        self.profile = FreelancerProfile.objects.get(user=self.freelancer_user)
+
+    def create_listing(self, title, skills, **fields):
+        listing = Listing.objects.create(user=self.client_user, title=title, description=title, price=100, **fields)
+        listing.skills.set(skills)
+        return listing
+
+    def create_freelancer(self, username, skills):
+        user = CustomUser.objects.create_user(username=username, password='x', role='freelancer')
+        profile = FreelancerProfile.objects.get(user=user)
+        profile.skills.set(skills)
+        return profile
+
+    def api(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api
+
+
+class MatchTopUpTests(ListingTestCase):
+    def test_closed_recommendations_are_replaced_by_live_matches(self):
+        self.profile.skills.set(self.skills[:2])
+        stored = self.create_listing('stored', self.skills[:2])
+        closed = self.create_listing('closed', self.skills[:2])
+        live = self.create_listing('live', self.skills[:1])
+        ListingRecommendation.objects.create(freelancer=self.profile, listing=closed, rank=1, score=1, overlap=2)
+        ListingRecommendation.objects.create(freelancer=self.profile, listing=stored, rank=2, score=1, overlap=2)
+        Listing.objects.filter(pk=closed.pk).update(status='closed')
+        matching.invalidate_all()
+
+        response = self.api(self.freelancer_user).get('/api/listings/open/matched/', {'limit': 3})
+        self.assertEqual([listing['id'] for listing in response.data], [stored.id, live.id])
+
+        response = self.api(self.freelancer_user).get('/api/listings/open/matched/', {'limit': 1})
+        self.assertEqual([listing['id'] for listing in response.data], [stored.id])
+
+    def test_deleted_freelancers_are_replaced_by_live_matches(self):
+        self.create_listing('wanted', self.skills[:2])
+        stored = self.create_freelancer('stored-freelancer', self.skills[:2])
+        gone = self.create_freelancer('gone-freelancer', self.skills[:2])
+        self.create_freelancer('live-freelancer', self.skills[:1])
+        FreelancerRecommendation.objects.create(client=self.client_user, freelancer=stored, rank=1, score=1,
+                                                overlap=2)
+        FreelancerRecommendation.objects.create(client=self.client_user, freelancer=gone, rank=2, score=1, overlap=2)
+        gone.user.delete()
+
+        response = self.api(self.client_user).get('/api/listings/client/matched_freelancers/', {'limit': 3})
+        usernames = [freelancer['user']['username'] for freelancer in response.data]
+        self.assertEqual(usernames[0], 'stored-freelancer')
+        self.assertIn('live-freelancer', usernames)
+        self.assertNotIn('gone-freelancer', usernames)
+        self.assertEqual(len(usernames), len(set(usernames)))
+
+
+class FacetCountTests(ListingTestCase):
+    """
+    The counts kept by the signals must match a recount after every kind of change.
+    """
+    def counts(self):
+        return set(ListingFacetCount.objects.exclude(count=0).values_list('skill_id', 'bucket', 'count'))
+
+    def assert_counts_match_rebuild(self, change):
+        with self.subTest(change=change):
+            incremental = self.counts()
+            rebuild_facet_counts()
+            self.assertEqual(incremental, self.counts())
+
+    def test_incremental_counts_match_a_rebuild(self):
+        first = self.create_listing('facets first', self.skills[:2])
+        second = self.create_listing('facets second', self.skills[1:])
+        third = self.create_listing('facets third', self.skills[:1])
+        self.assert_counts_match_rebuild('create')
+
+        Listing.objects.take(first.slug, self.freelancer_user)
+        self.assert_counts_match_rebuild('take')
+        second.status = 'closed'
+        second.save()
+        self.assert_counts_match_rebuild('close')
+        third.price = 600
+        third.save()
+        self.assert_counts_match_rebuild('price change')
+        third.skills.add(self.skills[2])
+        self.assert_counts_match_rebuild('skill add')
+        third.skills.remove(self.skills[0])
+        self.assert_counts_match_rebuild('skill remove')
+        third.skills.clear()
+        self.assert_counts_match_rebuild('skill clear')
+        third.delete()
+        self.assert_counts_match_rebuild('listing delete')
+        self.skills[1].delete()
+        self.assert_counts_match_rebuild('skill delete')
+
+    def test_saves_of_other_fields_do_not_lock_or_recount(self):
+        listing = self.create_listing('facets untouched', self.skills[:1])
+        listing.title = 'facets retitled'
+        with CaptureQueriesContext(connection) as queries:
+            listing.save(update_fields=['title'])
+        sql = [query['sql'] for query in queries.captured_queries]
+        # The locked read of the old price, and any write to the counts
+        self.assertFalse([query for query in sql if query.startswith('SELECT "listings_listing"."price" FROM')])
+        self.assertFalse([query for query in sql if 'listings_listingfacetcount' in query])
+        self.assert_counts_match_rebuild('title change')
+
+    def test_deleting_the_freelancer_reopens_their_open_listings(self):
+        held = self.create_listing('facets held', self.skills[:2], freelancer=self.freelancer_user)
+        self.create_listing('facets free', self.skills[1:])
+        self.assert_counts_match_rebuild('create')
+        version = held.version
+
+        self.freelancer_user.delete()
+        self.assert_counts_match_rebuild('freelancer delete')
+        held.refresh_from_db()
+        self.assertIsNone(held.freelancer_id)
+        self.assertGreater(held.version, version)
+
+
+class UpdateListingSkillsTests(ListingTestCase):
+    def patch(self, listing, data):
+        return self.api(self.client_user).patch(f'/api/listings/{listing.slug}/update/', data, format='json')
+
+    def test_skills_are_set_by_name(self):
+        listing = self.create_listing('skills update', self.skills[:1])
+        response = self.patch(listing, {'skills': ['listing-test-skill-1', 'brand-new-skill', 'brand-new-skill']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(listing.skills.values_list('name', flat=True)),
+                         ['brand-new-skill', 'listing-test-skill-1'])
+
+    def test_malformed_skills_are_rejected(self):
+        listing = self.create_listing('skills malformed', self.skills[:1])
+        for skills in ('python', [['python']], [{'name': 'python'}], ['']):
+            with self.subTest(skills=skills):
+                response = self.patch(listing, {'skills': skills})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('skills', response.data)
+        self.assertEqual(list(listing.skills.all()), self.skills[:1])
+
+    def test_numbers_are_taken_as_names(self):
+        listing = self.create_listing('skills numbers', [])
+        self.assertEqual(self.patch(listing, {'skills': [1]}).status_code, 200)
+        self.assertEqual(list(listing.skills.values_list('name', flat=True)), ['1'])
+
+
+class OrderOutboxTests(ListingTestCase):
+    def events(self, listing):
+        return OrderSyncEvent.objects.filter(listing=listing)
+
+    def test_events_are_written_in_the_save_transaction(self):
+        listing = self.create_listing('outbox saved', [])
+        self.assertEqual(list(self.events(listing).values_list('status', flat=True)), ['pending'])
+        try:
+            with transaction.atomic():
+                listing.title = 'outbox rolled back'
+                listing.save()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self.events(listing).count(), 1)
+
+    def test_accepted_order_marks_the_events_sent(self):
+        # Committed, so the skill catalog another test loaded is reloaded with the mapping
+        with self.captureOnCommitCallbacks(execute=True):
+            SkillMapping.objects.create(second_project_skill=self.skills[0], first_project_skill_id=7)
+        listing = self.create_listing('outbox accepted', self.skills[:2])
+        listing.save()
+        first_project = FakeFirstProject(FakeResponse(201, {'id': 1}))
+        self.assertEqual(drain_outbox(client=first_project), {'sent': 2, 'retried': 0, 'dead': 0})
+
+        # Both events of the listing go out as one push
+        [(endpoint, kwargs)] = first_project.calls
+        self.assertEqual(endpoint, 'orders')
+        self.assertEqual(kwargs['json']['title'], 'outbox accepted')
+        self.assertEqual(kwargs['json']['skills'], [7])
+        self.assertFalse(self.events(listing).exclude(status='sent').exists())
+        self.assertFalse(self.events(listing).filter(sent_at__isnull=True).exists())
+
+    def test_server_errors_timeouts_and_throttling_are_retried_with_backoff(self):
+        for status_code in (500, 503, 408, 429):
+            with self.subTest(status_code=status_code):
+                listing = self.create_listing(f'outbox retried {status_code}', [])
+                started = timezone.now()
+                stats = drain_outbox(client=FakeFirstProject(FakeResponse(status_code)))
+                self.assertEqual(stats, {'sent': 0, 'retried': 1, 'dead': 0})
+                event = self.events(listing).get()
+                self.assertEqual((event.status, event.attempts), ('pending', 1))
+                self.assertGreaterEqual(event.next_attempt_at, started + timedelta(seconds=30))
+                self.assertIn(str(status_code), event.last_error)
+
+                # Not due again until the backoff has passed
+                first_project = FakeFirstProject()
+                self.assertEqual(drain_outbox(client=first_project)['sent'], 0)
+                self.assertEqual(first_project.calls, [])
+
+    def test_client_errors_are_dead_lettered(self):
+        listing = self.create_listing('outbox rejected', [])
+        stats = drain_outbox(client=FakeFirstProject(FakeResponse(400, {'price': ['Invalid.']})))
+        self.assertEqual(stats, {'sent': 0, 'retried': 0, 'dead': 1})
+        self.assertEqual(list(self.events(listing).values_list('status', 'attempts')), [('dead', 1)])
+
+    def test_last_attempt_is_dead_lettered(self):
+        listing = self.create_listing('outbox exhausted', [])
+        self.events(listing).update(attempts=2)
+        stats = drain_outbox(max_attempts=3, client=FakeFirstProject(FakeResponse(503)))
+        self.assertEqual(stats, {'sent': 0, 'retried': 0, 'dead': 1})
+        self.assertEqual(list(self.events(listing).values_list('status', 'attempts')), [('dead', 3)])
+
+    def test_claimed_events_wait_for_their_lease_to_expire(self):
+        listing = self.create_listing('outbox leased', [])
+        # A worker claims the event and dies before sending it
+        self.assertEqual(len(claim_due_events(10)), 1)
+        first_project = FakeFirstProject()
+        self.assertEqual(drain_outbox(client=first_project)['sent'], 0)
+
+        self.events(listing).update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(client=first_project)['sent'], 1)
+        self.assertEqual(len(first_project.calls), 1)
+
+    def test_open_breaker_leaves_the_events_alone(self):
+        listings = [self.create_listing(f'outbox breaker {i}', []) for i in range(3)]
+        first_project = FakeFirstProject(FakeResponse(503))
+        # The breaker opens after two failures and the third listing is not sent
+        self.assertEqual(drain_outbox(client=first_project), {'sent': 0, 'retried': 2, 'dead': 0})
+        self.assertEqual(len(first_project.calls), 2)
+        self.assertEqual(self.events(listings[2]).get().attempts, 0)
+
+        OrderSyncEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(client=first_project), {'sent': 0, 'retried': 0, 'dead': 0})
+        self.assertEqual(len(first_project.calls), 2)
+        self.assertEqual(sorted(OrderSyncEvent.objects.values_list('attempts', flat=True)), [0, 1, 1])
+
+
+class ListingSearchTests(ListingTestCase):
+    def search(self, query):
+        response = APIClient().get('/api/listings/open/search/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def found(self, query):
+        return [result['id'] for result in self.search(query)]
+
+    def listing(self, title, description, skills=()):
+        listing = Listing.objects.create(user=self.client_user, title=title, description=description, price=100)
+        listing.skills.set(skills)
+        return listing
+
+    def test_title_outranks_skills_outranks_description(self):
+        skill = Skill.objects.create(name='harbour')
+        in_description = self.listing('Paint a fence', 'Next to the harbour office')
+        in_skills = self.listing('Paint a boat', 'Two coats', [skill])
+        in_title = self.listing('Harbour signage', 'Three signs')
+        self.listing('Unrelated', 'Nothing to see')
+        self.assertEqual(self.found('harbour'), [in_title.pk, in_skills.pk, in_description.pk])
+        # Every word has to match, in any column
+        self.assertEqual(self.found('harbour paint'), [in_skills.pk, in_description.pk])
+
+    def test_words_match_as_prefixes(self):
+        listing = self.listing('Refactoring a warehouse app', 'Inventory screens')
+        self.assertEqual(self.found('refact'), [listing.pk])
+        self.assertEqual(self.found('wareh invent'), [listing.pk])
+        self.assertEqual(self.found('factoring'), [])
+
+    def test_snippet_highlights_the_description(self):
+        self.listing('Logo', 'A new logo for a bakery in the old town')
+        result = self.search('bakery')[0]
+        self.assertIn('<mark>bakery</mark>', result['snippet'])
+        self.assertGreater(result['rank'], 0)
+
+    def test_skill_changes_are_reindexed(self):
+        skill = Skill.objects.create(name='kotlin')
+        listing = self.listing('Mobile app', 'Android client', [skill])
+        self.assertEqual(self.found('kotlin'), [listing.pk])
+        listing.skills.remove(skill)
+        self.assertEqual(self.found('kotlin'), [])
+        skill.listing_set.add(listing)
+        self.assertEqual(self.found('kotlin'), [listing.pk])
+        skill.name = 'swift'
+        skill.save()
+        self.assertEqual((self.found('kotlin'), self.found('swift')), ([], [listing.pk]))
+
+    def test_deleted_listing_is_unindexed(self):
+        listing = self.listing('Translate a menu', 'French to English')
+        self.assertEqual(self.found('menu'), [listing.pk])
+        listing.delete()
+        self.assertEqual(self.found('menu'), [])
+
+
+class ListingResponseCacheTests(ListingTestCase):
+    def open_titles(self):
+        return [listing['title'] for listing in APIClient().get('/api/listings/open/').data['results']]
+
+    def test_cached_list_is_dropped_once_the_change_commits(self):
+        listing = self.create_listing('cached title', [])
+        self.assertEqual(self.open_titles(), ['cached title'])
+        # Served from the cache: an UPDATE without signals goes unnoticed
+        Listing.objects.filter(pk=listing.pk).update(title='unsignalled title')
+        self.assertEqual(self.open_titles(), ['cached title'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.title = 'saved title'
+            listing.save()
+            self.assertEqual(self.open_titles(), ['cached title'])
+        self.assertEqual(self.open_titles(), ['saved title'])
+
+    def test_cached_detail_costs_the_version_lookup_only(self):
+        listing = self.create_listing('cached detail', self.skills)
+        url = f'/api/listings/{listing.slug}/'
+        first = APIClient().get(url)
+        with self.assertNumQueries(1):
+            second = APIClient().get(url)
+        self.assertEqual((second.data, second['ETag']), (first.data, first['ETag']))
+
+
+class ListingETagTests(ListingTestCase):
+    def test_unchanged_listing_answers_not_modified(self):
+        listing = self.create_listing('etag unchanged', [])
+        url = f'/api/listings/{listing.slug}/'
+        etag = APIClient().get(url)['ETag']
+        response = APIClient().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_update_needs_the_current_etag_and_returns_the_next(self):
+        listing = self.create_listing('etag update', [])
+        detail_url, update_url = f'/api/listings/{listing.slug}/', f'/api/listings/{listing.slug}/update/'
+        etag = APIClient().get(detail_url)['ETag']
+        api = self.api(self.client_user)
+
+        response = api.patch(update_url, {'description': 'first'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        new_etag = response['ETag']
+        self.assertNotEqual(new_etag, etag)
+
+        # Another client still holds the old ETag
+        response = api.patch(update_url, {'description': 'lost'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (412, new_etag))
+        listing.refresh_from_db()
+        self.assertEqual(listing.description, 'first')
+
+        response = APIClient().get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (200, new_etag))
+
+
+class BulkListingTests(ListingTestCase):
+    def import_body(self, body, content_type='application/x-ndjson', user=None):
+        return self.api(user or self.client_user).post('/api/listings/import/', body, content_type=content_type)
+
+    def export(self, user, **params):
+        response = self.api(user).get('/api/listings/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(LISTING_IMPORT_BATCH_SIZE=10)
+    def test_ndjson_import_reports_bad_lines_and_indexes_the_rest(self):
+        row = {'title': 'Imported gig', 'description': 'bulk', 'price': '120', 'skills': ['bulkimportskill']}
+        body = '\n'.join([
+            json.dumps(row),
+            '',
+            '{not json',
+            '["a", "list"]',
+            json.dumps({'title': 'No price', 'description': 'bulk'}),
+            json.dumps({**row, 'skills': ['bulkimportskill', 'listing-test-skill-0']}),
+        ])
+        response = self.import_body(body)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['error_count']), (2, 3))
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4, 5])
+        self.assertIn('price', response.data['errors'][2]['errors'])
+
+        imported = Listing.objects.filter(title='Imported gig').order_by('pk')
+        # Two rows with one title in one batch still get two slugs
+        slugs = [listing.slug for listing in imported]
+        self.assertEqual(len(set(slugs)), 2)
+        self.assertTrue(all(slug.startswith('imported-gig') for slug in slugs))
+        self.assertEqual([sorted(listing.skills.values_list('name', flat=True)) for listing in imported],
+                         [['bulkimportskill'], ['bulkimportskill', 'listing-test-skill-0']])
+
+        # What the signals of a save would have done
+        results = APIClient().get('/api/listings/open/search/', {'search': 'bulkimportskill'}).data['results']
+        self.assertEqual(sorted(result['id'] for result in results), [listing.pk for listing in imported])
+        self.assertEqual(OrderSyncEvent.objects.filter(listing__in=imported, status='pending').count(), 2)
+        counts = ListingFacetCount.objects.exclude(count=0).values_list('skill_id', 'bucket', 'count')
+        incremental = set(counts)
+        rebuild_facet_counts()
+        self.assertEqual(incremental, set(counts.all()))
+
+    def test_csv_import_splits_the_skills_column(self):
+        body = 'title,description,price,status,skills\r\nCSV gig,bulk,80,closed,listing-test-skill-1; csvskill\r\n'
+        response = self.import_body(body, content_type='text/csv')
+        self.assertEqual((response.status_code, response.data['created']), (201, 1))
+        listing = Listing.objects.get(title='CSV gig')
+        self.assertEqual(listing.status, 'closed')
+        self.assertEqual(sorted(listing.skills.values_list('name', flat=True)), ['csvskill', 'listing-test-skill-1'])
+
+    @override_settings(LISTING_IMPORT_BATCH_SIZE=2)
+    def test_undecodable_line_is_reported_with_what_was_created(self):
+        rows = [json.dumps({'title': f'Decoded {i}', 'description': 'bulk', 'price': 10}).encode() for i in range(3)]
+        body = b'\n'.join([*rows, b'{"title": "\xff"}', rows[0]])
+        response = self.import_body(body)
+        self.assertEqual((response.status_code, response.data['created']), (201, 3))
+        self.assertEqual(response.data['error_count'], 1)
+        self.assertEqual(response.data['errors'][0]['line'], 4)
+        self.assertEqual(Listing.objects.filter(title__startswith='Decoded').count(), 3)
+
+        response = self.import_body(b'\xff\xfe', content_type='text/csv')
+        self.assertEqual((response.status_code, response.data['created']), (400, 0))
+
+    def test_nothing_imported_answers_400(self):
+        response = self.import_body(json.dumps({'title': 'No price', 'description': 'bulk'}))
+        self.assertEqual((response.status_code, response.data['created']), (400, 0))
+
+    def test_only_clients_can_import(self):
+        response = self.import_body(json.dumps({'title': 'x', 'description': 'x', 'price': 1}),
+                                    user=self.freelancer_user)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Listing.objects.exists())
+
+    def test_export_streams_the_users_listings(self):
+        listing = self.create_listing('Exported gig', self.skills[:2])
+        other_client = CustomUser.objects.create_user(username='other-export-client', password='x', role='client')
+        Listing.objects.create(user=other_client, title='Not mine', description='x', price=5)
+
+        rows = [json.loads(line) for line in self.export(self.client_user).splitlines()]
+        self.assertEqual([(row['id'], row['client'], row['freelancer']) for row in rows],
+                         [(listing.pk, 'listing-client', None)])
+        self.assertEqual(rows[0]['skills'], ['listing-test-skill-0', 'listing-test-skill-1'])
+
+        rows = list(csv.DictReader(io.StringIO(self.export(self.client_user, output='csv'))))
+        self.assertEqual([(row['slug'], row['price'], row['skills']) for row in rows],
+                         [(listing.slug, '100.00', 'listing-test-skill-0;listing-test-skill-1')])
+
+        self.assertEqual(self.export(self.freelancer_user), '')
+        self.assertEqual(self.api(self.client_user).get('/api/listings/export/', {'output': 'xml'}).status_code, 400)
+
+
+class TakeRaceTests(TransactionTestCase):
+    """
+    Several freelancers take the same listing at once, each request in its own
+    thread, connection and transaction.
+    """
+    FREELANCERS = 8
+    ROUNDS = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            cls.use_file_database()
+
+    @classmethod
+    def use_file_database(cls):
+        """
+        Moves the default alias to a WAL-mode file copy of the in-memory test
+        database until the class is done. Table locks of the shared in-memory
+        database fail at once instead of waiting for the timeout.
+        """
+        directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'race.sqlite3')
+        connection.ensure_connection()
+        with closing(sqlite3.connect(path)) as copy:
+            connection.connection.backup(copy)
+            copy.execute('PRAGMA journal_mode = WAL')
+
+        # Closing the in-memory connection would drop the database, it is put back instead
+        memory_name, memory_connection = connection.settings_dict['NAME'], connection.connection
+        connection.connection = None
+        connection.settings_dict['NAME'] = path
+
+        def restore():
+            connection.close()
+            connection.settings_dict['NAME'] = memory_name
+            connection.connection = memory_connection
+
+        cls.addClassCleanup(restore)
+
+    def take_all(self, listing, freelancers):
+        barrier = Barrier(len(freelancers))
+
+        def take(user):
+            api = APIClient()
+            api.force_authenticate(user)
+            try:
+                barrier.wait()
+                return api.post(f'/api/listings/{listing.slug}/take/').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(freelancers)) as pool:
+            return list(pool.map(take, freelancers))
+
+    def test_exactly_one_take_wins(self):
+        client = CustomUser.objects.create_user(username='race-client', password='x', role='client')
+        freelancers = [
+            CustomUser.objects.create_user(username=f'race-freelancer-{i}', password='x', role='freelancer')
+            for i in range(self.FREELANCERS)
+        ]
+        messages = Message.objects.filter(chat__participants=client)
+        for round_number in range(self.ROUNDS):
+            with self.subTest(round=round_number):
+                listing = Listing.objects.create(user=client, title=f'race listing {round_number}',
+                                                 description='race', price=100)
+                messages_before = messages.count()
+                codes = self.take_all(listing, freelancers)
+
+                self.assertEqual(sorted(codes), [200] + [409] * (self.FREELANCERS - 1))
+                winner = freelancers[codes.index(200)]
+                listing.refresh_from_db()
+                self.assertEqual((listing.freelancer_id, listing.status), (winner.pk, 'in_progress'))
+                # One intro message, from the winner
+                self.assertEqual(messages.count(), messages_before + 1)
+                self.assertEqual(messages.order_by('id').last().author_id, winner.pk)
+                # One event for the create, one for the take
+                self.assertEqual(OrderSyncEvent.objects.filter(listing=listing).count(), 2)
+
+
+# SQLite: "SCAN table" without an index, PostgreSQL: a Seq Scan node
+SQLITE_FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+
+
+def full_scans(sql):
+    """
+    The tables that the plan of sql reads whole.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+            return [match[1] for match in map(SQLITE_FULL_SCAN_RE.match, details) if match]
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(node['Relation Name'])
+        nodes += node.get('Plans', [])
+    return scans
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'No plan reader for this database')
+class QueryPlanTests(TestCase):
+    """
+    Every SELECT of the list endpoints must read an index rather than a whole table.
+    """
+    ROWS = 30
+    # (url, who asks). Paginated endpoints are also checked on their second page.
+    ENDPOINTS = (
+        ('/api/listings/open/', None),
+        ('/api/listings/open/?min_price=50&max_price=500', None),
+        ('/api/listings/open/?skills=plans-skill-2', None),
+        ('/api/listings/open/?created_after=2000-01-01&created_before=2100-01-01', None),
+        ('/api/listings/open/?skills=plans-skill-1&skills=plans-skill-2&skills_mode=all', None),
+        ('/api/listings/open/facets/?skills=plans-skill-2&price=50-100', None),
+        ('/api/listings/open/facets/?skills=plans-skill-2&price=50-100&client=plans-client', None),
+        ('/api/listings/open/search/?search=plans', None),
+        ('/api/listings/open/matched/', 'freelancer'),
+        ('/api/listings/taken/', 'freelancer'),
+        ('/api/listings/user-specific/', 'client'),
+        ('/api/listings/user-specific/', 'freelancer'),
+        ('/api/listings/progress/', 'client'),
+        ('/api/listings/client/matched_freelancers/', 'client'),
+        ('/api/accounts/freelancers/', None),
+        ('/api/accounts/top-freelancers/', None),
+        ('/api/accounts/search/freelancers/?q=plans', None),
+        ('/api/accounts/reviews/freelancer/plans-freelancer-0/', None),
+        ('/api/accounts/skills/', None),
+        ('/api/chats/', 'client'),
+        ('/api/chats/{chat}/', 'client'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        skills = [Skill.objects.create(name=f'plans-skill-{i}') for i in range(3)]
+        client = CustomUser.objects.create_user(username='plans-client', password='x', role='client')
+        freelancers = []
+        for i in range(cls.ROWS):
+            user = CustomUser.objects.create_user(
+                username=f'plans-freelancer-{i}', password='x', role='freelancer', first_name='Plans'
+            )
+            profile = FreelancerProfile.objects.get(user=user)
+            profile.skills.set(skills[:2])
+            Review.objects.create(rating=4 + i % 2, text='plans', client=client, freelancer=profile)
+            freelancers.append(user)
+        for i in range(cls.ROWS):
+            listing = Listing.objects.create(
+                user=client, title=f'plans listing {i}', slug=f'plans-listing-{i}', description='plans',
+                price=10 * (i + 1),
+            )
+            listing.skills.set(skills[i % 3:])
+            if i % 3 == 0:
+                Listing.objects.take(listing.slug, freelancers[0])
+        cls.chat, _ = Chat.get_or_create_with_participants(client, freelancers[0])
+        Message.objects.bulk_create(Message(chat=cls.chat, author=client, content=f'plans {i}') for i in range(cls.ROWS))
+        cls.users = {'client': client, 'freelancer': freelancers[0]}
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tiny tables are cheaper to scan; only fall back to it when no index fits
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        # Loaded whole on purpose, and once per process rather than per request
+        get_catalog()
+
+    def get(self, api, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        scans = [
+            (table, query['sql']) for query in queries.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT') for table in full_scans(query['sql'])
+        ]
+        self.assertEqual(scans, [], f'{url} reads whole tables')
+        return response
+
+    def test_list_queries_use_indexes(self):
+        for url, role in self.ENDPOINTS:
+            with self.subTest(url=url, role=role):
+                api = APIClient()
+                if role:
+                    api.force_authenticate(self.users[role])
+                url = url.format(chat=self.chat.pk)
+                # A parameter of its own keeps the response cache out of the way
+                url += ('&' if '?' in url else '?') + f'page_size=5&nocache={uuid4().hex}'
+                response = self.get(api, url)
+                next_url = response.data.get('next') if isinstance(response.data, dict) else None
+                if next_url:
+                    self.get(api, next_url)
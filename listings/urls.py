@@ -1,20 +1,24 @@
 from django.urls import path
 from .views import (CreateListingView, ListingDetailView, UpdateListingView,
-                    TakeListingView, OpenListingsListView, TakenListingsListView,
+                    TakeListingView, OpenListingsListView, OpenListingFacetsView, TakenListingsListView,
                     get_matched_listings, MatchedFreelancersView, SearchListingsView,
                     ClientInProgressListingsView, UserSpecificListingsView,
-                    OrderCreateAPIView)  # Import UserSpecificListingsView
+                    OrderCreateAPIView, ImportListingsView, ExportListingsView)  # Import UserSpecificListingsView
 
 urlpatterns = [
     path('open/', OpenListingsListView.as_view(), name='open-listings'),
+    path('open/facets/', OpenListingFacetsView.as_view(), name='open-listing-facets'),
     path('user-specific/', UserSpecificListingsView.as_view(), name='user-specific-listings'),
     path('client/matched_freelancers/', MatchedFreelancersView.as_view(), name='matched_freelancers'),
     path('progress/', ClientInProgressListingsView.as_view(), name='in-progress-listings'),
     path('create/', CreateListingView.as_view(), name='create-listing'),
+    # Before the slug routes, which would take it for a listing
+    path('taken/', TakenListingsListView.as_view(), name='taken-listings'),
+    path('import/', ImportListingsView.as_view(), name='import-listings'),
+    path('export/', ExportListingsView.as_view(), name='export-listings'),
     path('<slug:slug>/', ListingDetailView.as_view(), name='listing-detail'),
     path('<slug:slug>/update/', UpdateListingView.as_view(), name='update-listing'),
     path('<slug:slug>/take/', TakeListingView.as_view(), name='take-listing'),
-    path('taken/', TakenListingsListView.as_view(), name='taken-listings'),
     path('open/matched/', get_matched_listings, name='matched-listings'),
     path('open/search/', SearchListingsView.as_view(), name='search-listings'),
     path('create/orders/', OrderCreateAPIView.as_view(), name='create-order'),
@@ -3,34 +3,45 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from backend.pagination import SearchResultsPagination
+from backend.response_cache import CachedResponseMixin
+from backend.versioning import get_version_etag, if_match_failed, precondition_failed
 from rest_framework import serializers
-from django.db.models import Count, Q
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.core.exceptions import PermissionDenied
 
-from .models import Listing
-from .serializers import ListingSerializer, OpenListingSerializer, TakeListingSerializer, OrderSerializer
+from .models import OPEN, FreelancerRecommendation, Listing, ListingRecommendation
+from .serializers import ListingSerializer, OpenListingSerializer, TakeListingSerializer, OrderSerializer, \
+    ListingSearchResultSerializer, ListingSkillsSerializer
+from .search import search_listings
+from .facets import ListingFilters, facet_counts
+from .bulk import CONTENT_TYPES as BULK_CONTENT_TYPES, FORMATS as BULK_FORMATS, export_rows, import_listings, \
+    read_rows, render_rows
+from .matching import FREELANCER_SKILLS, LISTING_SKILLS, load_topped_up
 from .permissions import IsClientUser
 from accounts.models import CustomUser, FreelancerProfile, Skill
 from accounts.serializers import FreelancerProfileSerializer
+from accounts.skills import resolve_skill_ids
 from chats.models import Chat, Message
 
-class OpenListingsListView(generics.ListAPIView):
+class OpenListingsListView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = OpenListingSerializer
+    cache_scopes = ('listings',)
 
     def get_queryset(self):
-        queryset = Listing.objects.filter(freelancer__isnull=True, status='open')
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
-        skills = self.request.query_params.getlist('skills')
+        return ListingFilters(self.request.query_params).apply(Listing.objects.filter(OPEN))
 
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        if skills:
-            queryset = queryset.filter(skills__name__in=skills).distinct()
 
-        return queryset
+class OpenListingFacetsView(CachedResponseMixin, generics.RetrieveAPIView):
+    """
+    Facet counts for the filters of OpenListingsListView, see listings/facets.py.
+    """
+    cache_scopes = ('listings',)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(facet_counts(ListingFilters(request.query_params)))
 
 
 class CreateListingView(generics.CreateAPIView):
@@ -40,11 +51,15 @@ class CreateListingView(generics.CreateAPIView):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class ListingDetailView(generics.RetrieveAPIView):
+class ListingDetailView(CachedResponseMixin, generics.RetrieveAPIView):
     queryset = Listing.objects.all()
     serializer_class = ListingSerializer
     lookup_field = 'slug'
     permission_classes = [permissions.AllowAny]
+    cache_scopes = ('listings',)
+
+    def get_version_etag(self):
+        return get_version_etag(Listing.objects.filter(slug=self.kwargs['slug']))
 
 
 from django.shortcuts import get_object_or_404
@@ -55,6 +70,16 @@ class UpdateListingView(generics.UpdateAPIView):
     lookup_field = 'slug'
     permission_classes = [IsAuthenticated]
 
+    def update(self, request, *args, **kwargs):
+        # If-Match carries the ETag the client last read, the row stays locked until the update is saved
+        with transaction.atomic():
+            etag = get_version_etag(Listing.objects.filter(slug=kwargs['slug']), lock=True)
+            if if_match_failed(request, etag):
+                return precondition_failed(etag)
+            response = super().update(request, *args, **kwargs)
+        response['ETag'] = get_version_etag(Listing.objects.filter(slug=response.data.get('slug', kwargs['slug'])))
+        return response
+
     def perform_update(self, serializer):
         listing = serializer.instance
         current_freelancer = listing.freelancer
@@ -72,10 +97,12 @@ class UpdateListingView(generics.UpdateAPIView):
             else:
                 raise serializers.ValidationError({"freelancer": "Freelancer not found or not valid."})
 
-        skills_data = self.request.data.get('skills')
-        if skills_data is not None:
-            skills = [Skill.objects.get_or_create(name=skill_name)[0] for skill_name in skills_data]
-            listing.skills.set(skills)
+        if self.request.data.get('skills') is not None:
+            skills = ListingSkillsSerializer(data=self.request.data)
+            skills.is_valid(raise_exception=True)
+            names = skills.validated_data['skills']
+            skill_ids = resolve_skill_ids(names)
+            listing.skills.set([skill_ids[name] for name in dict.fromkeys(names)])
 
         serializer.save()
 
@@ -84,25 +111,23 @@ class TakeListingView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, slug):
-        listing = get_object_or_404(Listing, slug=slug)
-        if listing.status in ['closed', 'in progress'] or listing.freelancer:
-            return Response({'error': 'This listing is not available for taking'}, status=status.HTTP_400_BAD_REQUEST)
-
         if not hasattr(request.user, 'freelancer_profile'):
             return Response({'error': 'Only freelancers can take listings'}, status=status.HTTP_400_BAD_REQUEST)
 
-        listing.freelancer = request.user
-        listing.status = 'in_progress'
-        listing.save()
+        with transaction.atomic():
+            listing = Listing.objects.take(slug, request.user)
+            if listing is None:
+                get_object_or_404(Listing, slug=slug)
+                return Response({'error': 'This listing is not available for taking'}, status=status.HTTP_409_CONFLICT)
 
-        chat, created = Chat.get_or_create_with_participants(request.user, listing.user)
+            chat, created = Chat.get_or_create_with_participants(request.user, listing.user)
 
-        # Create a message in the chat
-        Message.objects.create(
-            chat=chat,
-            author=request.user,
-            content=f"Hi {listing.user.username}, I am interested in your listing '{listing.title}'."
-        )
+            # Create a message in the chat
+            Message.objects.create(
+                chat=chat,
+                author=request.user,
+                content=f"Hi {listing.user.username}, I am interested in your listing '{listing.title}'."
+            )
 
         return Response({'message': 'Listing taken and status updated to in progress'}, status=status.HTTP_200_OK)
 
@@ -133,14 +158,25 @@ class TakenListingsListView(generics.ListAPIView):
         else:
             raise PermissionDenied("You do not have permission to view this.")
 
+def get_match_limit(request, default):
+    limit = request.query_params.get('limit', '')
+    return min(int(limit), settings.MAX_PAGE_SIZE) if limit.isdigit() else default
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_matched_listings(request):
-    user = request.user
-    user_skills = user.freelancer_profile.skills.all() if hasattr(user, 'freelancer_profile') else Skill.objects.none()
-    listings = Listing.objects.filter(status='open').annotate(
-        matched_skills_count=Count('skills', filter=Q(skills__in=user_skills))
-    ).order_by('-matched_skills_count')[:10]
+    profile = getattr(request.user, 'freelancer_profile', None)
+    limit = get_match_limit(request, 10)
+    if not profile:
+        return Response([])
+    # Precomputed by compute_recommendations, matched live until the freelancer's first run
+    # and for the rows that closed since
+    listing_ids = list(ListingRecommendation.objects.filter(freelancer=profile).order_by('rank').values_list(
+        'listing_id', flat=True
+    )[:limit])
+    listings = load_topped_up(Listing.objects.filter(status='open').prefetch_related('skills'), listing_ids,
+                              LISTING_SKILLS, profile.skills.values_list('id', flat=True), limit)
     serializer = OpenListingSerializer(listings, many=True)
     return Response(serializer.data)
 
@@ -150,20 +186,17 @@ class MatchedFreelancersView(APIView):
     def get(self, request):
         client = request.user
         if hasattr(client, 'client_profile'):
-            listings = Listing.objects.filter(user=client)
-
-            # Collect skill names from all listings
-            skill_names = set()
-            for listing in listings:
-                for skill in listing.skills.all():
-                    skill_names.add(skill.name)
-
-            # Find freelancers with matching skills
-            matched_freelancers = FreelancerProfile.objects.filter(
-                skills__name__in=skill_names
-            ).distinct()
-
-            serializer = FreelancerProfileSerializer(matched_freelancers, many=True)
+            limit = get_match_limit(request, settings.MATCHING_TOP_K)
+            freelancer_ids = list(FreelancerRecommendation.objects.filter(client=client).order_by('rank').values_list(
+                'freelancer_id', flat=True
+            )[:limit])
+            # Skills used by any of the client's listings
+            skill_ids = Skill.objects.filter(listing__user=client).values_list('id', flat=True).distinct()
+            freelancers = load_topped_up(
+                FreelancerProfileSerializer.setup_eager_loading(FreelancerProfile.objects.all()), freelancer_ids,
+                FREELANCER_SKILLS, skill_ids, limit
+            )
+            serializer = FreelancerProfileSerializer(freelancers, many=True)
             return Response(serializer.data)
         else:
             return Response({'message': 'User is not a client or has no listings'}, status=400)
@@ -175,9 +208,11 @@ class SearchListingsView(APIView):
         query = request.query_params.get('search', '').strip()
         if not query:
             return Response({'message': 'No search query provided'}, status=400)
-        listings = Listing.objects.filter(title__icontains=query)
-        serializer = OpenListingSerializer(listings, many=True)
-        return Response(serializer.data)
+        results = search_listings(query, Listing.objects.prefetch_related('skills'))
+        paginator = SearchResultsPagination()
+        page = paginator.paginate_queryset(results, request, view=self)
+        serializer = ListingSearchResultSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class ClientInProgressListingsView(generics.ListAPIView):
     serializer_class = OpenListingSerializer
@@ -196,6 +231,45 @@ class UserSpecificListingsView(generics.ListAPIView):
         return Listing.objects.for_user(user)
 
 
+class ImportListingsView(APIView):
+    """
+    Creates the requesting client's listings from an NDJSON body, or CSV with
+    Content-Type: text/csv. The body is read line by line as it arrives, and
+    batches already created stay when a later line fails.
+    """
+    permission_classes = [IsAuthenticated, IsClientUser]
+
+    def post(self, request):
+        file_format = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+        # None for an empty body
+        lines = request.stream or ()
+        result = import_listings(request.user, read_rows(lines, file_format))
+        return Response(
+            {'created': result.created, 'error_count': result.error_count, 'errors': result.errors},
+            status=status.HTTP_400_BAD_REQUEST if result.error_count and not result.created else status.HTTP_201_CREATED,
+        )
+
+
+class ExportListingsView(APIView):
+    """
+    Streams the user's listings, or every listing for staff, as NDJSON or with
+    ?output=csv as CSV.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        file_format = request.query_params.get('output', 'ndjson')
+        if file_format not in BULK_FORMATS:
+            return Response({'error': f"output must be one of {', '.join(BULK_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        queryset = Listing.objects.all() if request.user.is_staff else Listing.objects.for_user(request.user)
+        response = StreamingHttpResponse(
+            render_rows(export_rows(queryset), file_format), content_type=BULK_CONTENT_TYPES[file_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="listings.{file_format}"'
+        return response
+
+
 class OrderCreateAPIView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = OrderSerializer(data=request.data)